@@ -3,42 +3,1127 @@
 # dependencies: pandas, pdfquery
 
 #%%
-def scrape_transcript(pdf_filepath, outfile_path):
+def mine_transcript(pdf_filepath, cache=True, cache_dir=None, catalog=None, executor=None):
     """
+    Returns tuple of (records, npages), where records is the pd.DataFrame
+    of mined course rows and npages the number of pages in the transcript.
+
+    Raises tm.InvalidPDF, a ValueError carrying a reason code, if the file is
+    not a valid transcript.
+
+    Args:
+        pdf_filepath: path to transcript pdf to be scraped, or a tm.SharedPdf
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        catalog: course catalog (.xlsx or index .npz) to add full course
+                 titles and units from, or None
+        executor: concurrent.futures.Executor to lay out the pages on, in
+                  chunks, or None to lay them out in this process
+    """
+    import transcript_miner as tm
+
+    layout = tm.load_layout(pdf_filepath, cache=cache, cache_dir=cache_dir, executor=executor)
+    records = mine_layout(layout)
+    if catalog is not None:
+        import transcript_catalog as tc
+        records = tc.open_catalog(catalog, cache_dir).enrich(records)
+    return records, len(layout["pages"])
+
+def mine_layout(layout):
+    """
+    Returns pd.DataFrame of the mined course rows of a transcript already
+    laid out, running every stage of mine_transcript after the layout.
+
+    Raises tm.InvalidPDF if the layout is not that of a valid transcript.
+
+    Args:
+        layout: layout dict from tm.load_layout()
+    """
+    import transcript_miner as tm
+
+    reason = tm.rejection_reason(layout)
+    if reason is not None:
+        raise tm.InvalidPDF(reason)
+
+    npages = len(layout["pages"])
+    tokens = tm.tokenize_layout(layout)
+
+    colleges = tm.define_college_sections(tokens, npages)
+    semesters = tm.scrape_semesters_and_plans(tokens)
+
+    colleges = tm.group_semesters_by_college(colleges, semesters)
+    colleges = tm.scrape_courses(layout, colleges)
+
+    return tm.prepare_records(layout, colleges)
+
+def scrape_transcript(pdf_filepath, outfile_path, cache=True, cache_dir=None,
+                      profile=False, memory=False, trace_path=None, fmt=None,
+                      catalog=None, workers=None):
+    """
+    Returns -1 if the input file is invalid. Otherwise returns the profile
+    dict from tm.profiling() when profiling, or None.
+
     Args:
         pdf_filepath: path to transcript pdf to be scraped
-        outfile_path: path and filename of CSV outfile
+        outfile_path: path and filename of the outfile
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        profile: time every stage of the pipeline
+        memory: profile, and trace peak memory per stage
+        trace_path: profile, and write the spans as a Chrome trace to this file
+        fmt: output format, a key of tm.SINK_FORMATS (default: by the
+             outfile's extension, else CSV)
+        catalog: course catalog (.xlsx or index .npz) to add full course
+                 titles and units from, or None
+        workers: number of worker processes to split the transcript's pages
+                 across, or None to mine it in this process. Stages run in
+                 the workers are missing from the profile.
     """
+    from contextlib import nullcontext
+    from concurrent.futures import ProcessPoolExecutor
     import transcript_miner as tm
-    import pdfquery as pq
 
-    is_good_pdf = False
+    profiled = profile or memory or trace_path is not None
+    with (tm.profiling(memory) if profiled else nullcontext()) as stats, \
+         tm.span("scrape_transcript"), \
+         (ProcessPoolExecutor(workers, initializer=__init_worker) if (workers or 0) > 1
+          else nullcontext()) as executor:
+        try:
+            records, npages = mine_transcript(pdf_filepath, cache, cache_dir, catalog, executor)
+        except ValueError as e:
+            print(e)
+            return -1
+        except Exception as e:
+            print("Input file is invalid. Error: ", e)
+            return -1
 
+        tm.write_records(records, outfile_path, fmt, source=pdf_filepath)
+
+    if trace_path is not None:
+        tm.write_chrome_trace(stats, trace_path)
+    return stats
+
+def __check_infile(pdf_filepath):
+    """
+    Returns str describing why the file cannot be a PDF, or None. Reads only
+    the first KiB, where a PDF's header must be, and imports nothing heavy.
+
+    Args:
+        pdf_filepath: path to transcript pdf
+    """
+    import os
+
+    if not os.path.isfile(pdf_filepath):
+        return "no such file: %s" % pdf_filepath
     try:
-        pdf = pq.PDFQuery(pdf_filepath)
-        pdf.load()
+        with open(pdf_filepath, "rb") as pdf_file:
+            head = pdf_file.read(1024)
+    except OSError as e:
+        return "cannot read %s: %s" % (pdf_filepath, e.strerror)
+    if b"%PDF-" not in head:
+        return "not a PDF file: %s" % pdf_filepath
+    return None
+
+def print_profile(stats):
+    """
+    Prints one line per profiled stage, in the order the stages first ran.
+
+    Args:
+        stats: profile dict from scrape_transcript()
+    """
+    stages = stats["stages"]
+    print("%-28s %6s %10s %9s %9s %10s" % \
+          ("stage", "calls", "ms", "scanned", "matched", "peak KiB"))
+    for name, stage in stages.iterrows():
+        peak = "-" if stage["peak_bytes"] != stage["peak_bytes"] else \
+               "%.0f" % (stage["peak_bytes"] / 1024)
+        print("%-28s %6d %10.1f %9d %9d %10s" % \
+              (name, stage["calls"], 1000 * stage["seconds"], stage["scanned"],
+               stage["matched"], peak))
+
+#%% SECTION: Batch mode
+def collect_inputs(source):
+    """
+    Returns sorted list of PDF paths.
+
+    Args:
+        source: a directory (every *.pdf inside it), a glob pattern, or a
+                manifest file listing one PDF path per line. Relative paths
+                in a manifest are relative to the manifest's directory.
+    """
+    import os
+    import glob
+
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "*.pdf")))
 
-        is_good_pdf = tm.valid_pdf(pdf)
+    if os.path.isfile(source) and not source.lower().endswith(".pdf"):
+        root = os.path.dirname(source)
+        with open(source) as manifest:
+            lines = [line.strip() for line in manifest]
+        return [os.path.join(root, line) for line in lines
+                if line and not line.startswith("#")]
+
+    return sorted(glob.glob(source))
+
+def __init_worker():
+    """
+    Imports the heavy modules once per worker process, so that every file
+    handled by the worker after the first is processed warm.
+    """
+    import pandas
+    import transcript_miner as tm
+    if tm.layout_backend().name == "pdfquery":
+        import pdfquery
+
+def __scrape_one(pdf_filepath, outfile_path, cache=True, cache_dir=None, catalog=None,
+                 executor=None):
+    """
+    Batch worker. Never raises: failures are reported in the returned dict.
+
+    Returns dict with keys source, pages, rows, seconds, error and records.
+    records is only set when outfile_path is None (merged output).
+
+    Args:
+        pdf_filepath: path to transcript pdf to be scraped, or a tm.SharedPdf
+        outfile_path: path of the outfile for this transcript, or None
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        catalog: course catalog (.xlsx or index .npz) to add full course
+                 titles and units from, or None
+        executor: concurrent.futures.Executor to lay out the pages on, in
+                  chunks, or None to lay them out in this process
+    """
+    import time
+    import transcript_miner as tm
+
+    result = {"source": pdf_filepath, "pages": 0, "rows": 0,
+              "seconds": 0.0, "error": None, "records": None}
+    start = time.perf_counter()
+    try:
+        records, result["pages"] = mine_transcript(pdf_filepath, cache, cache_dir, catalog,
+                                                   executor)
+        result["rows"] = len(records)
+        if outfile_path is None:
+            result["records"] = records
+        else:
+            tm.write_records(records, outfile_path, source=pdf_filepath)
     except Exception as e:
-        print("Input file is invalid. Error: ", e)
-        return -1
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def scrape_batch(source, out_path, workers=None, merge=False, cache=True, cache_dir=None,
+                 pipeline=False, readers=4, writers=4, queue_size=8, fmt=None,
+                 flush_rows=None, flush_seconds=None, append=False, catalog=None,
+                 split_pages=None):
+    """
+    Scrapes every transcript in `source` across a pool of warm worker
+    processes. A failing file is reported and skipped without stopping the
+    batch.
 
-    if is_good_pdf:
-        figures = pdf.pq('LTFigure')
+    Returns list of per-file result dicts (see __scrape_one), in input order.
+
+    Args:
+        source: directory, glob pattern or manifest file (see collect_inputs)
+        out_path: directory for one outfile per input, or the merged outfile
+                  when merge is True
+        workers: number of worker processes (default: os.cpu_count())
+        merge: stream every input's records, with a 'source' column, into a
+               single outfile as each input finishes, instead of writing one
+               outfile per input. Rows are grouped by input in the order the
+               inputs finish.
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        pipeline: run through scrape_pipeline(), overlapping reads and
+                  writes with mining, for inputs and outputs on slow storage
+        readers: with pipeline, number of concurrent PDF reads
+        writers: with pipeline, number of concurrent outfile writes
+        queue_size: with pipeline, files held between stages
+        fmt: output format, a key of tm.SINK_FORMATS (default: by the merged
+             outfile's extension, else CSV)
+        flush_rows: with merge, rows buffered before they are written out
+                    (default: tm.SINK_FLUSH_ROWS)
+        flush_seconds: with merge, longest wait before buffered rows are
+                       written out (default: tm.SINK_FLUSH_SECONDS)
+        append: with merge, append to an existing outfile (CSV or JSONL)
+        catalog: course catalog (.xlsx or index .npz) to add full course
+                 titles and units from, or None
+        split_pages: lay out transcripts of more pages than this across
+                     several workers (see __scrape_pool), or None. Not with
+                     pipeline.
+    """
+    import os
+    import time
+    from contextlib import nullcontext
+    import transcript_miner as tm
 
-        beginning_labels = tm.define_college_sections(pdf, figures)
+    pdf_filepaths = collect_inputs(source)
+    if merge:
+        fmt = tm.sink_format(out_path, fmt)
+    else:
+        os.makedirs(out_path, exist_ok=True)
+        fmt = fmt or "csv"
+
+    def outfile(pdf_filepath):
+        if merge:
+            return None
+        name = os.path.splitext(os.path.basename(pdf_filepath))[0]
+        return os.path.join(out_path, name + tm.SINK_FORMATS[fmt].extensions[0])
+
+    flush = {name: value for name, value in (("flush_rows", flush_rows),
+                                             ("flush_seconds", flush_seconds))
+             if value is not None}
+    jobs = [(pdf_filepath, outfile(pdf_filepath)) for pdf_filepath in pdf_filepaths]
+    start = time.perf_counter()
+    with (tm.open_sink(out_path, fmt, append=append, **flush) if merge else nullcontext()) as sink:
+        if pipeline:
+            import asyncio
+            results = asyncio.run(scrape_pipeline(jobs, readers, workers, writers, queue_size,
+                                                  cache, cache_dir, sink, catalog))
+        else:
+            results = __scrape_pool(jobs, workers, cache, cache_dir, sink, catalog,
+                                    split_pages)
+    elapsed = time.perf_counter() - start
+
+    __print_summary(results, elapsed)
+    return results
+
+def __scrape_pool(jobs, workers=None, cache=True, cache_dir=None, sink=None, catalog=None,
+                  split_pages=None):
+    """
+    Returns list of per-file result dicts (see __scrape_one), in job order.
+
+    Files are handed to the pool a few at a time rather than all at once.
+    Transcripts of more than split_pages pages go first, and each is mined
+    from a thread of this process that lays its pages out in chunks on the
+    pool, so that a long transcript keeps every worker busy instead of
+    finishing alone on one of them at the end of the batch.
+
+    Args:
+        jobs: list of (pdf_filepath, outfile_path) pairs
+        workers: number of worker processes (default: os.cpu_count())
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        sink: tm.RecordSink taking the records of jobs whose outfile_path is
+              None, as each finishes, or None to return them in the results
+        catalog: course catalog (.xlsx or index .npz) to add full course
+                 titles and units from, or None
+        split_pages: page count above which a transcript is split across
+                     workers, or None to mine every transcript on one worker
+    """
+    import os
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+                                   wait, FIRST_COMPLETED
+    import transcript_miner as tm
+
+    workers = workers or os.cpu_count()
+    split = set()
+    if split_pages is not None:
+        split = {n for n, (pdf_filepath, outfile_path) in enumerate(jobs)
+                 if tm.count_pages(pdf_filepath) > split_pages}
+    waiting = deque(sorted(range(len(jobs)), key=lambda n: n not in split))
+
+    results, running = dict(), dict()
+    with ProcessPoolExecutor(max_workers=workers, initializer=__init_worker) as executor, \
+         ThreadPoolExecutor(max_workers=workers) as splitter:
+        while waiting or running:
+            # keep the pool's queue short, so that the page chunks of a
+            # split transcript never wait behind the rest of the batch
+            while waiting and len(running) < 2 * workers:
+                n = waiting.popleft()
+                pdf_filepath, outfile_path = jobs[n]
+                if n in split:
+                    future = splitter.submit(__scrape_one, pdf_filepath, outfile_path,
+                                             cache, cache_dir, catalog, executor)
+                else:
+                    future = executor.submit(__scrape_one, pdf_filepath, outfile_path,
+                                             cache, cache_dir, catalog)
+                running[future] = n
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                n = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # the worker process itself died
+                    result = __failed(jobs[n][0], e)
+                if sink is not None:
+                    __sink_records(sink, result)
+                results[n] = result
+                __print_result(result)
+    return [results[n] for n in range(len(jobs))]
+
+def __sink_records(sink, result):
+    """
+    Writes a result's records, with a 'source' column, to the sink and
+    drops them from the result. A failing write fails the file.
+
+    Args:
+        sink: tm.RecordSink
+        result: per-file result dict
+    """
+    records = result["records"]
+    result["records"] = None
+    if records is None:
+        return
+    try:
+        sink.write(records.assign(source=result["source"]))
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
 
-        label_instances = tm.scrape_labels(pdf, beginning_labels, figures)
-        label_instances = tm.clean_labels(label_instances)
+def __failed(pdf_filepath, e):
+    """
+    Returns per-file result dict of a file that could not be scraped
 
-        colleges = tm.group_label_instances_by_college(label_instances)
-        colleges = tm.scrape_plans(pdf, colleges)
-        colleges = tm.scrape_course_targets(pdf, colleges)
+    Args:
+        pdf_filepath: path to transcript pdf
+        e: the exception that stopped it
+    """
+    return {"source": pdf_filepath, "pages": 0, "rows": 0, "seconds": 0.0,
+            "records": None, "error": "%s: %s" % (type(e).__name__, e)}
 
-        tm.gen_csv(pdf, colleges, outfile_path)
+def __print_result(result):
+    """
+    Args:
+        result: per-file result dict
+    """
+    if result["error"]:
+        print("FAILED %s -- %s" % (result["source"], result["error"]))
     else:
-        print("Invalid PDF.")
-        return -1
+        print("ok     %s (%d pages, %d rows, %.2fs)" % \
+              (result["source"], result["pages"], result["rows"], result["seconds"]))
+
+def __print_summary(results, elapsed):
+    """
+    Args:
+        results: list of per-file result dicts
+        elapsed: wall-clock seconds for the whole batch
+    """
+    nfiles = len(results)
+    nfailed = len([result for result in results if result["error"]])
+    npages = sum(result["pages"] for result in results)
+    rate = lambda n: n / elapsed if elapsed > 0 else 0.0
+
+    print("%d files (%d failed), %d pages in %.2fs: %.2f files/s, %.2f pages/s" % \
+          (nfiles, nfailed, npages, elapsed, rate(nfiles), rate(npages)))
+# !SECTION
+
+#%% SECTION: Async pipeline
+async def scrape_pipeline(jobs, readers=4, workers=None, writers=4, queue_size=8,
+                          cache=True, cache_dir=None, sink=None, catalog=None):
+    """
+    Scrapes transcripts through three overlapping stages joined by bounded
+    queues: readers copy each PDF's bytes from its (possibly slow) source into
+    RAM-backed storage (see tm.share_pdf), workers mine them from there in a
+    pool of warm processes, and writers write each outfile to its (possibly
+    slow) storage.
+    While one file is mined, the next ones are already being read and the
+    previous ones written. A full queue holds back the stage feeding it.
+
+    Returns list of per-file result dicts (see __scrape_one), in job order.
+    records is only set for jobs whose outfile_path is None, unless they
+    went to the sink.
+
+    Args:
+        jobs: iterable of (pdf_filepath, outfile_path) pairs
+        readers: number of concurrent PDF reads
+        workers: number of worker processes (default: os.cpu_count())
+        writers: number of concurrent outfile writes
+        queue_size: files held between two stages
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        sink: tm.RecordSink taking the records of jobs whose outfile_path is
+              None, one file at a time, or None to return them in the results
+        catalog: course catalog (.xlsx or index .npz) to add full course
+                 titles and units from, or None
+    """
+    import os
+    import asyncio
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    import transcript_miner as tm
+
+    loop = asyncio.get_running_loop()
+    jobs = deque(enumerate(jobs))
+    workers = workers or os.cpu_count()
+    results = [None] * len(jobs)
+    fetched = asyncio.Queue(maxsize=queue_size)
+    mined = asyncio.Queue(maxsize=queue_size)
+    scrape_one = __scrape_one
+    sink_records = __sink_records
+    sinking = asyncio.Lock()
+
+    async def read():
+        while jobs:
+            n, (pdf_filepath, outfile_path) = jobs.popleft()
+            try:
+                shared = await loop.run_in_executor(io_pool, tm.share_pdf, pdf_filepath)
+            except Exception as e:
+                shared = e
+            await fetched.put((n, pdf_filepath, outfile_path, shared))
+
+    async def mine():
+        while True:
+            job = await fetched.get()
+            if job is None:
+                return
+            n, pdf_filepath, outfile_path, shared = job
+            if isinstance(shared, Exception):
+                result = __failed(pdf_filepath, shared)
+            else:
+                try:
+                    result = await loop.run_in_executor(cpu_pool, scrape_one, shared,
+                                                        None, cache, cache_dir, catalog)
+                except Exception as e:
+                    # the worker process itself died
+                    result = __failed(pdf_filepath, e)
+                shared.unlink()
+                result["source"] = pdf_filepath
+            await mined.put((n, outfile_path, result))
+
+    async def write():
+        while True:
+            job = await mined.get()
+            if job is None:
+                return
+            n, outfile_path, result = job
+            if outfile_path is not None and result["records"] is not None:
+                try:
+                    await loop.run_in_executor(io_pool, tm.write_records,
+                                               result.pop("records"), outfile_path,
+                                               None, result["source"])
+                except Exception as e:
+                    result["error"] = "%s: %s" % (type(e).__name__, e)
+                result["records"] = None
+            elif sink is not None:
+                async with sinking:
+                    await loop.run_in_executor(io_pool, sink_records, sink, result)
+            results[n] = result
+            __print_result(result)
+
+    async def close(queue, tasks):
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+
+    with ThreadPoolExecutor(max_workers=readers + writers) as io_pool, \
+         ProcessPoolExecutor(max_workers=workers, initializer=__init_worker) as cpu_pool:
+        reading = [asyncio.create_task(read()) for _ in range(readers)]
+        mining = [asyncio.create_task(mine()) for _ in range(workers)]
+        writing = [asyncio.create_task(write()) for _ in range(writers)]
+        await asyncio.gather(*reading)
+        await close(fetched, mining)
+        await close(mined, writing)
+
+    return results
+# !SECTION
+
+#%% SECTION: Service mode
+# A local HTTP endpoint in front of the same pool of warm workers as batch
+# mode, so that every request skips the interpreter and import start-up and
+# shares the parse cache.
+#
+#   POST /scrape[?format=csv|json][&path=PDF]
+#        body: the PDF itself, a multipart/form-data upload, or the JSON
+#        {"path": PDF} naming a file on this machine
+#   GET  /health
+#   GET  /metrics
+
+MAX_UPLOAD_BYTES = 64 * 2**20
+
+def __serve_one(pdf_filepath, fmt, cache=True, cache_dir=None, catalog=None):
+    """
+    Service worker. Never raises: failures are reported in the returned dict.
+
+    Returns dict with keys pages, rows, seconds, error, reason (the
+    tm.InvalidPDF reason code of a rejected file) and body, the records
+    rendered as CSV text or as a JSON array.
+
+    Args:
+        pdf_filepath: path to transcript pdf to be scraped, or a tm.SharedPdf
+        fmt: "csv" or "json"
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        catalog: course catalog (.xlsx or index .npz) to add full course
+                 titles and units from, or None
+    """
+    import time
+
+    result = {"pages": 0, "rows": 0, "seconds": 0.0, "error": None, "reason": None,
+              "body": None}
+    start = time.perf_counter()
+    try:
+        records, result["pages"] = mine_transcript(pdf_filepath, cache, cache_dir, catalog)
+        result["rows"] = len(records)
+        if fmt == "json":
+            result["body"] = records.to_json(orient="records")
+        else:
+            result["body"] = records.to_csv(index=False)
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+        result["reason"] = getattr(e, "reason", None)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def serve(host="127.0.0.1", port=8765, workers=None, max_pending=None, timeout=60.0,
+          cache=True, cache_dir=None, catalog=None):
+    """
+    Serves scrape requests until interrupted.
+
+    Requests run on a pool of warm worker processes. At most max_pending run
+    or wait at once; beyond that a request is turned away at once with 503,
+    rather than queueing without bound. A request that takes longer than
+    timeout gets 504; its worker finishes the transcript regardless, and its
+    slot is only freed then.
+
+    Args:
+        host: interface to listen on
+        port: TCP port to listen on
+        workers: number of worker processes (default: os.cpu_count())
+        max_pending: requests admitted at once (default: 4 per worker)
+        timeout: seconds a request may take
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        catalog: course catalog (.xlsx or index .npz) to add full course
+                 titles and units from, or None
+    """
+    import os
+    import json
+    import time
+    import signal
+    import threading
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, TimeoutError
+    from concurrent.futures.process import BrokenProcessPool
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qs
+    import transcript_miner as tm
+
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 4 * workers
+    scrape_one, init_worker = __serve_one, __init_worker
+
+    def start_pool():
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+        # start and warm every worker before taking requests
+        for future in [executor.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+        return executor
+    pool = {"executor": start_pool()}
+
+    def restart_pool(broken):
+        # a worker process died, which breaks the whole pool. Warming the
+        # new pool takes a while, so it is started outside `lock`
+        with restarting:
+            if pool["executor"] is not broken:
+                return  # another request restarted it already
+            # its futures have all failed already, so there is nothing to cancel
+            broken.shutdown(wait=False)
+            executor = start_pool()
+            with lock:
+                pool["executor"] = executor
+
+    slots = threading.BoundedSemaphore(max_pending)
+    lock = threading.Lock()
+    restarting = threading.Lock()
+    started = time.time()
+    metrics = {"requests": 0, "ok": 0, "failed": 0, "rejected": 0, "timeouts": 0,
+               "pending": 0, "pages": 0}
+    latencies = deque(maxlen=1000)
+    inflight = set()
+
+    def count(**deltas):
+        with lock:
+            for key, delta in deltas.items():
+                metrics[key] += delta
+
+    def release(future, upload):
+        if future is not None:
+            with lock:
+                inflight.discard(future)
+        count(pending=-1)
+        slots.release()
+        if upload is not None:
+            upload.unlink()
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            route = urlsplit(self.path).path
+            if route == "/health":
+                self.reply(200, {"status": "ok", "workers": workers})
+            elif route == "/metrics":
+                with lock:
+                    snapshot = dict(metrics, uptime=time.time() - started,
+                                    workers=workers, max_pending=max_pending)
+                    seconds = sorted(latencies)
+                if seconds:
+                    snapshot.update(
+                        latency_mean=sum(seconds) / len(seconds),
+                        latency_p50=seconds[len(seconds) // 2],
+                        latency_p95=seconds[min(len(seconds) - 1, int(0.95 * len(seconds)))])
+                self.reply(200, snapshot)
+            else:
+                self.reply(404, {"error": "Not found."})
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            if url.path != "/scrape":
+                return self.reply(404, {"error": "Not found."})
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            fmt = query.get("format", "csv")
+            if fmt not in ("csv", "json"):
+                return self.reply(400, {"error": "format must be csv or json."})
+            count(requests=1)
+
+            # the body is only read once the request is admitted, so a busy
+            # server does not buffer uploads it turns away; their bodies are
+            # left unread, and the connection is closed after the reply
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_UPLOAD_BYTES:
+                count(failed=1)
+                self.close_connection = True
+                return self.reply(413, {"error": "Upload too large."})
+            if not slots.acquire(blocking=False):
+                count(rejected=1)
+                self.close_connection = True
+                return self.reply(503, {"error": "Too many pending requests."},
+                                  {"Retry-After": "1"})
+            count(pending=1)
+
+            upload, executor = None, pool["executor"]
+            try:
+                body = self.rfile.read(length)
+                pdf_filepath, data = self.source(query, body)
+                if data is not None:
+                    # handed to the worker by name, not pickled
+                    upload = pdf_filepath = tm.share_pdf(data)
+                future = executor.submit(scrape_one, pdf_filepath, fmt, cache, cache_dir, catalog)
+            except BrokenProcessPool as e:
+                release(None, upload)
+                restart_pool(executor)
+                count(failed=1)
+                return self.reply(500, {"error": "%s: %s" % (type(e).__name__, e)})
+            except Exception as e:
+                release(None, upload)
+                count(failed=1)
+                return self.reply(400, {"error": str(e)})
+            with lock:
+                inflight.add(future)
+            future.add_done_callback(lambda future: release(future, upload))
+
+            try:
+                result = future.result(timeout=timeout)
+            except TimeoutError:
+                count(timeouts=1)
+                return self.reply(504, {"error": "Timed out after %gs." % timeout})
+            except BrokenProcessPool as e:
+                restart_pool(executor)
+                count(failed=1)
+                return self.reply(500, {"error": "%s: %s" % (type(e).__name__, e)})
+
+            with lock:
+                latencies.append(result["seconds"])
+            if result["error"]:
+                count(failed=1)
+                return self.reply(422, {"error": result["error"],
+                                        "reason": result["reason"]})
+            count(ok=1, pages=result["pages"])
+
+            headers = {"X-Pages": str(result["pages"]), "X-Rows": str(result["rows"]),
+                       "X-Seconds": "%.3f" % result["seconds"]}
+            if fmt == "json":
+                self.send(200, "application/json",
+                          '{"pages": %d, "rows": %d, "seconds": %.3f, "records": %s}' % \
+                          (result["pages"], result["rows"], result["seconds"], result["body"]),
+                          headers)
+            else:
+                self.send(200, "text/csv", result["body"], headers)
+
+        def source(self, query, body):
+            """
+            Returns tuple of (pdf path, None) or (None, uploaded pdf bytes)
+            """
+            if "path" in query:
+                path = query["path"]
+            elif self.headers.get_content_type() == "multipart/form-data":
+                import email
+                message = email.message_from_bytes(
+                    b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+                for part in message.get_payload():
+                    if part.get_filename() or part.get_param("name", header="content-disposition") == "file":
+                        return None, part.get_payload(decode=True)
+                raise ValueError("No file in the multipart upload.")
+            elif self.headers.get_content_type() == "application/json":
+                path = json.loads(body)["path"]
+            else:
+                if not body:
+                    raise ValueError("Empty request body.")
+                return None, body
+
+            if not os.path.isfile(path):
+                raise ValueError("No such file: %s" % path)
+            return path, None
+
+        def reply(self, status, payload, headers=None):
+            self.send(status, "application/json", json.dumps(payload), headers)
+
+        def send(self, status, content_type, text, headers=None):
+            data = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or dict()).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            print("%s %s" % (self.address_string(), format % args))
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, terminate)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    print("Serving on http://%s:%d with %d workers" % (host, port, workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        # requests still waiting for a worker are dropped, not run on the
+        # way out
+        with lock:
+            waiting = list(inflight)
+        for future in waiting:
+            future.cancel()
+        pool["executor"].shutdown(wait=False)
+# !SECTION
+
+#%% SECTION: Sharded mode
+# A work queue of plain files on a volume shared by every host, so that any
+# number of independent workers can split a batch without a coordinator:
+#
+#   QUEUE/todo/JOB.json     waiting: source PDF, outfile, attempts so far
+#   QUEUE/leases/JOB.CLAIM.json
+#                           claimed; CLAIM is unique to the claim, and the
+#                           file's mtime is the lease heartbeat
+#   QUEUE/done/JOB.json     the per-file result dict of a scraped file
+#   QUEUE/failed/JOB.json   the result of a file that failed, or crashed its
+#                           workers max_attempts times
+#
+# Every state change is a rename, which is atomic on one filesystem (NFS
+# included), so exactly one worker wins each claim and each requeue. A lease
+# whose heartbeat is older than lease_seconds is taken to be a crashed
+# worker's, and goes back to todo. Only the claim's own worker knows CLAIM, so
+# a worker whose lease was reaped can never remove or heartbeat the lease of
+# the job's next claim. The reaper renames a lease to JOB.CLAIM.reaping while
+# it requeues it; a .reaping file left by a reaper that crashed is recovered
+# once it is lease_seconds old. Jobs therefore run at least once; outfiles
+# are renamed into place, so a job that did run twice leaves one whole file.
+# Lease expiry compares file mtimes with the local clock, so the hosts'
+# clocks must agree to well within lease_seconds.
+
+QUEUE_STATES = ("todo", "leases", "done", "failed")
+
+LEASE_SECONDS = 300.0
+MAX_ATTEMPTS = 3
+
+def enqueue(source, out_path, queue_dir, fmt=None):
+    """
+    Adds one job per transcript in `source` to the queue. A transcript that
+    is already queued, in any state, is skipped, so enqueueing again after
+    more files arrive only adds the new ones.
+
+    Returns int, the number of jobs added
+
+    Args:
+        source: directory, glob pattern or manifest file (see collect_inputs)
+        out_path: directory for one outfile per input, on the shared volume
+        queue_dir: queue directory on the shared volume
+        fmt: output format, a key of tm.SINK_FORMATS (default: csv)
+    """
+    import os
+    import hashlib
+    import transcript_miner as tm
+
+    for state in QUEUE_STATES:
+        os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+    os.makedirs(out_path, exist_ok=True)
+    extension = tm.SINK_FORMATS[fmt or "csv"].extensions[0]
+
+    added = 0
+    queued = {__job_of(name) if state == "leases" else name
+              for state in QUEUE_STATES for name in __jobs(queue_dir, state)}
+    queued.update(__job_of(name) for name in __reaping(queue_dir))
+    for pdf_filepath in collect_inputs(source):
+        pdf_filepath = os.path.abspath(pdf_filepath)
+        name = os.path.splitext(os.path.basename(pdf_filepath))[0]
+        job = "%s-%s.json" % (name, hashlib.sha1(pdf_filepath.encode('utf-8')).hexdigest()[:10])
+        if job in queued:
+            continue
+        __write_job(os.path.join(queue_dir, "todo", job),
+                    {"source": pdf_filepath, "attempts": 0,
+                     "outfile": os.path.join(os.path.abspath(out_path), name + extension)})
+        added += 1
+    return added
+
+def work_queue(queue_dir, worker_id=None, lease_seconds=LEASE_SECONDS,
+               max_attempts=MAX_ATTEMPTS, cache=True, cache_dir=None, catalog=None,
+               poll_seconds=None):
+    """
+    Claims and scrapes jobs until the queue is drained: nothing left to do,
+    and no other worker's lease still open that could expire and come back.
+
+    Returns list of per-file result dicts (see __scrape_one) of the jobs this
+    worker finished
+
+    Args:
+        queue_dir: queue directory on the shared volume
+        worker_id: name for this worker in results (default: host:pid)
+        lease_seconds: heartbeat age after which a lease counts as abandoned
+        max_attempts: times a job may be claimed before it is failed
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        catalog: course catalog to enrich records from, or None
+        poll_seconds: wait between looks at a queue with only open leases
+                      (default: lease_seconds / 10)
+    """
+    import os
+    import time
+    import socket
+    import threading
+
+    worker_id = worker_id or "%s:%d" % (socket.gethostname(), os.getpid())
+    poll_seconds = poll_seconds or lease_seconds / 10
+
+    results = []
+    while True:
+        __reap_leases(queue_dir, lease_seconds, max_attempts)
+        lease = __claim_job(queue_dir)
+        if lease is None:
+            if not __jobs(queue_dir, "todo"):
+                if not (__jobs(queue_dir, "leases") or __reaping(queue_dir)):
+                    return results
+                time.sleep(poll_seconds)
+            continue
+
+        stop = threading.Event()
+        def heartbeat():
+            while not stop.wait(lease_seconds / 3):
+                try:
+                    os.utime(lease)
+                except FileNotFoundError:
+                    return  # reaped: another worker has the job now
+        beating = threading.Thread(target=heartbeat, daemon=True)
+        beating.start()
+        try:
+            result = __run_job(lease, worker_id, cache, cache_dir, catalog)
+        finally:
+            stop.set()
+            beating.join()
+
+        # a lease that was reaped meanwhile is another claim's job now, and
+        # that claim records its result
+        if os.path.exists(lease):
+            state = "failed" if result["error"] else "done"
+            __write_job(os.path.join(queue_dir, state, __job_of(os.path.basename(lease))),
+                        result)
+            try:
+                os.remove(lease)
+            except FileNotFoundError:
+                pass
+        results.append(result)
+        __print_result(result)
+
+def run_queue_workers(queue_dir, workers=None, **kwargs):
+    """
+    Runs work_queue() in several processes of this host, and waits for the
+    queue to drain.
+
+    Returns list of per-file result dicts of the jobs this host finished
+
+    Args:
+        queue_dir: queue directory on the shared volume
+        workers: number of worker processes (default: os.cpu_count())
+        kwargs: passed on to work_queue()
+    """
+    import os
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=__init_worker) as executor:
+        futures = [executor.submit(work_queue, queue_dir, **kwargs) for _ in range(workers)]
+        results = [result for future in futures for result in future.result()]
+    __print_summary(results, time.perf_counter() - start)
+    return results
+
+def queue_status(queue_dir):
+    """
+    Returns dict of {state: number of jobs} over QUEUE_STATES
+
+    Args:
+        queue_dir: queue directory on the shared volume
+    """
+    return {state: len(__jobs(queue_dir, state)) for state in QUEUE_STATES}
+
+def __jobs(queue_dir, state):
+    """
+    Returns sorted list of the job names in a state, leaving out files
+    still being written or reaped
+
+    Args:
+        queue_dir: queue directory
+        state: one of QUEUE_STATES
+    """
+    import os
+
+    return sorted(name for name in os.listdir(os.path.join(queue_dir, state))
+                  if name.endswith(".json"))
+
+def __reaping(queue_dir):
+    """
+    Returns sorted list of the leases being reaped (JOB.CLAIM.reaping)
+
+    Args:
+        queue_dir: queue directory
+    """
+    import os
+
+    return sorted(name for name in os.listdir(os.path.join(queue_dir, "leases"))
+                  if name.endswith(".reaping"))
+
+def __job_of(name):
+    """
+    Returns the job name (JOB.json) of a lease or reaping file name
+
+    Args:
+        name: JOB.CLAIM.json or JOB.CLAIM.reaping
+    """
+    return name.rsplit(".", 2)[0] + ".json"
+
+def __claim_job(queue_dir):
+    """
+    Returns path of the lease this worker now holds, or None if no job is
+    waiting
+
+    Args:
+        queue_dir: queue directory
+    """
+    import os
+    import uuid
+
+    for job in __jobs(queue_dir, "todo"):
+        waiting = os.path.join(queue_dir, "todo", job)
+        lease = os.path.join(queue_dir, "leases", "%s.%s.json" % (job[:-len(".json")],
+                                                                   uuid.uuid4().hex))
+        try:
+            # freshen first: a rename keeps the mtime, and a stale one would
+            # make the new lease look expired
+            os.utime(waiting)
+            os.rename(waiting, lease)
+        except FileNotFoundError:
+            continue  # another worker claimed it first
+        return lease
+    return None
+
+def __reap_leases(queue_dir, lease_seconds, max_attempts):
+    """
+    Puts the jobs of expired leases back in todo, or in failed once they
+    have been attempted max_attempts times. Reaping files as old as an
+    expired lease are a crashed reaper's, and are reaped again.
+
+    Args:
+        queue_dir: queue directory
+        lease_seconds: heartbeat age after which a lease counts as abandoned
+        max_attempts: times a job may be claimed before it is failed
+    """
+    import os
+    import json
+    import time
+
+    for name in __jobs(queue_dir, "leases") + __reaping(queue_dir):
+        lease = os.path.join(queue_dir, "leases", name)
+        job = __job_of(name)
+        reaping = os.path.join(queue_dir, "leases", "%s.%d-%d.reaping" % \
+                               (job[:-len(".json")], os.getpid(), time.monotonic_ns()))
+        try:
+            if time.time() - os.stat(lease).st_mtime < lease_seconds:
+                continue
+            os.rename(lease, reaping)
+            # a rename keeps the expired mtime; a fresh one tells other
+            # reapers that this reaping file is not abandoned
+            os.utime(reaping)
+            with open(reaping) as job_file:
+                record = json.load(job_file)
+        except FileNotFoundError:
+            continue  # finished or reaped meanwhile
+        record["attempts"] += 1
+        if record["attempts"] >= max_attempts:
+            record = __failed(record["source"], RuntimeError(
+                "worker lease expired %d times" % record["attempts"]))
+            __write_job(os.path.join(queue_dir, "failed", job), record)
+        else:
+            __write_job(os.path.join(queue_dir, "todo", job), record)
+        os.remove(reaping)
+
+def __run_job(lease, worker_id, cache=True, cache_dir=None, catalog=None):
+    """
+    Returns per-file result dict (see __scrape_one), with the keys worker
+    and attempts added
+
+    Args:
+        lease: path of the claimed job's lease
+        worker_id: name of this worker
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+        catalog: course catalog to enrich records from, or None
+    """
+    import os
+    import json
+
+    with open(lease) as job_file:
+        job = json.load(job_file)
+    directory, name = os.path.split(job["outfile"])
+    stem, extension = os.path.splitext(name)
+    partial = os.path.join(directory, ".%s.%d%s" % (stem, os.getpid(), extension))
+
+    result = __scrape_one(job["source"], partial, cache, cache_dir, catalog)
+    try:
+        if result["error"] is None:
+            os.replace(partial, job["outfile"])
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    result.pop("records")
+    result.update(worker=worker_id, attempts=job["attempts"] + 1, outfile=job["outfile"])
+    return result
+
+def __write_job(path, record):
+    """
+    Writes a job or result record as JSON, renamed into place so no reader
+    ever sees a partial file.
+
+    Args:
+        path: path of the record
+        record: JSON-serializable dict
+    """
+    import os
+    import json
+
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "w") as job_file:
+        json.dump(record, job_file)
+    os.replace(tmp, path)
+# !SECTION
 
 #%%
 if __name__ == "__main__":
@@ -49,20 +1134,262 @@ if __name__ == "__main__":
         description = "Scrape Los Rios CCD Unofficial Transcripts")
 
     argparser.add_argument(
-        "infile", default = "",
-        help = "Path to transcript PDF to be scraped",
+        "infile", nargs = "?", default = "",
+        help = "Path to transcript PDF to be scraped. With --batch: a "
+               "directory, glob pattern or manifest file of PDFs",
         metavar = "PDF_IN"
     )
 
     argparser.add_argument(
-        "outfile", default = "",
-        help = "path to CSV output file",
+        "outfile", nargs = "?", default = "",
+        help = "path to output file (.csv, .jsonl, .parquet, or a .db results "
+               "store). With --batch: output directory, or the merged output "
+               "file with --merge",
         metavar = "CSV_OUT"
     )
 
+    argparser.add_argument(
+        "--batch", action = "store_true",
+        help = "scrape many transcripts across a pool of worker processes"
+    )
+
+    argparser.add_argument(
+        "--workers", type = int, default = None,
+        help = "number of worker processes for --batch and --serve (default: "
+               "CPU count). For a single transcript: split its pages across "
+               "this many processes"
+    )
+
+    argparser.add_argument(
+        "--split-pages", type = int, default = None, metavar = "N",
+        help = "with --batch, lay out transcripts of more than N pages across "
+               "several workers"
+    )
+
+    argparser.add_argument(
+        "--merge", action = "store_true",
+        help = "with --batch, stream all records into one CSV_OUT with a "
+               "'source' column as each file finishes"
+    )
+
+    argparser.add_argument(
+        "--format", dest = "fmt", default = None,
+        choices = ("csv", "jsonl", "parquet", "sqlite"),
+        help = "output format (default: by CSV_OUT's extension, else csv). sqlite "
+               "ingests into a results store; see transcript_store.py"
+    )
+
+    argparser.add_argument(
+        "--flush-rows", type = int, default = None,
+        help = "with --merge, rows buffered before they are written out "
+               "(Parquet row group size)"
+    )
+
+    argparser.add_argument(
+        "--flush-seconds", type = float, default = None,
+        help = "with --merge, longest wait before buffered rows are written out"
+    )
+
+    argparser.add_argument(
+        "--append", action = "store_true",
+        help = "with --merge, append to an existing CSV or JSONL CSV_OUT"
+    )
+
+    argparser.add_argument(
+        "--no-cache", dest = "cache", action = "store_false",
+        help = "always run layout analysis, ignoring the parse cache"
+    )
+
+    argparser.add_argument(
+        "--cache-dir", default = None,
+        help = "parse cache directory (default: $TRANSCRIPT_MINER_CACHE or "
+               "~/.cache/transcript_miner)"
+    )
+
+    argparser.add_argument(
+        "--backend", default = None, choices = ("pdfminer", "pdfquery"),
+        help = "layout backend (default: $TRANSCRIPT_MINER_BACKEND or pdfminer)"
+    )
+
+    argparser.add_argument(
+        "--layout-profile", default = None, choices = ("los_rios", "generic"),
+        help = "layout analysis settings (default: $TRANSCRIPT_MINER_PROFILE or "
+               "los_rios; generic runs all of pdfminer's analysis)"
+    )
+
+    argparser.add_argument(
+        "--profile", action = "store_true",
+        help = "print the time spent in every stage of the pipeline"
+    )
+
+    argparser.add_argument(
+        "--profile-memory", dest = "memory", action = "store_true",
+        help = "like --profile, and also trace peak memory per stage (slow)"
+    )
+
+    argparser.add_argument(
+        "--trace", default = None, metavar = "JSON_OUT",
+        help = "write the profiled stages as a Chrome trace to this file"
+    )
+
+    argparser.add_argument(
+        "--catalog", nargs = "?", default = None, metavar = "CATALOG",
+        const = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                             "courses_scc_catalog-1.xlsx"),
+        help = "add full course titles and units from a course catalog "
+               "spreadsheet or index (default: the SCC catalog in data/)"
+    )
+
+    argparser.add_argument(
+        "--serve", action = "store_true",
+        help = "run a local HTTP scrape service instead of scraping PDF_IN"
+    )
+
+    argparser.add_argument(
+        "--host", default = "127.0.0.1",
+        help = "interface for --serve to listen on"
+    )
+
+    argparser.add_argument(
+        "--port", type = int, default = 8765,
+        help = "port for --serve to listen on"
+    )
+
+    argparser.add_argument(
+        "--max-pending", type = int, default = None,
+        help = "requests --serve admits at once before answering 503 "
+               "(default: 4 per worker)"
+    )
+
+    argparser.add_argument(
+        "--timeout", type = float, default = 60.0,
+        help = "seconds a --serve request may take before answering 504"
+    )
+
+    argparser.add_argument(
+        "--enqueue", action = "store_true",
+        help = "add the PDFs of PDF_IN to the shared work queue --queue, to be "
+               "scraped into the directory CSV_OUT by --work"
+    )
+
+    argparser.add_argument(
+        "--work", action = "store_true",
+        help = "scrape jobs from the shared work queue --queue until it drains, "
+               "with --workers processes"
+    )
+
+    argparser.add_argument(
+        "--queue", default = None, metavar = "DIR",
+        help = "work queue directory, on a volume shared by every host"
+    )
+
+    argparser.add_argument(
+        "--lease", type = float, default = LEASE_SECONDS,
+        help = "seconds without a heartbeat after which --work takes a job "
+               "back from a crashed worker"
+    )
+
+    argparser.add_argument(
+        "--attempts", type = int, default = MAX_ATTEMPTS,
+        help = "times --work claims a job before failing it"
+    )
+
+    argparser.add_argument(
+        "--pipeline", action = "store_true",
+        help = "with --batch, overlap reading PDFs and writing outfiles with mining, "
+               "for inputs or outputs on slow storage"
+    )
+
+    argparser.add_argument(
+        "--readers", type = int, default = 4,
+        help = "concurrent PDF reads for --pipeline"
+    )
+
+    argparser.add_argument(
+        "--writers", type = int, default = 4,
+        help = "concurrent outfile writes for --pipeline"
+    )
+
     args = argparser.parse_args()
+    if not (args.serve or args.work) and not (args.infile and args.outfile):
+        argparser.error("PDF_IN and CSV_OUT are required unless --serve or --work is given")
+    if (args.enqueue or args.work) and not args.queue:
+        argparser.error("--enqueue and --work need --queue")
+    if args.split_pages is not None and args.pipeline:
+        argparser.error("--split-pages does not work with --pipeline")
+    if args.memory:
+        args.profile = True
+    if not (args.serve or args.work or args.batch or args.enqueue):
+        # before pandas and pdfminer are imported, so a bad path fails fast
+        problem = __check_infile(args.infile)
+        if problem is not None:
+            argparser.error(problem)
+    if args.backend:
+        # through the environment, so that worker processes use it too
+        os.environ["TRANSCRIPT_MINER_BACKEND"] = args.backend
+    if args.layout_profile:
+        os.environ["TRANSCRIPT_MINER_PROFILE"] = args.layout_profile
 
-    scrape_transcript(pdf_filepath = args.infile,
-                      outfile_path = args.outfile)
+    if args.catalog:
+        # convert the spreadsheet once, here, rather than in every worker
+        import transcript_catalog
+        try:
+            transcript_catalog.open_catalog(args.catalog, args.cache_dir)
+        except (OSError, ImportError, ValueError) as e:
+            argparser.error("cannot open catalog %s: %s" % (args.catalog, e))
 
-#%%
\ No newline at end of file
+    if args.serve:
+        serve(host = args.host,
+              port = args.port,
+              workers = args.workers,
+              max_pending = args.max_pending,
+              timeout = args.timeout,
+              cache = args.cache,
+              cache_dir = args.cache_dir,
+              catalog = args.catalog)
+    elif args.enqueue:
+        added = enqueue(source = args.infile,
+                        out_path = args.outfile,
+                        queue_dir = args.queue,
+                        fmt = args.fmt)
+        print("%d jobs added; queue: %s" % (added, queue_status(args.queue)))
+    elif args.work:
+        run_queue_workers(queue_dir = args.queue,
+                          workers = args.workers,
+                          lease_seconds = args.lease,
+                          max_attempts = args.attempts,
+                          cache = args.cache,
+                          cache_dir = args.cache_dir,
+                          catalog = args.catalog)
+        print("queue: %s" % queue_status(args.queue))
+    elif args.batch:
+        scrape_batch(source = args.infile,
+                     out_path = args.outfile,
+                     workers = args.workers,
+                     merge = args.merge,
+                     cache = args.cache,
+                     cache_dir = args.cache_dir,
+                     pipeline = args.pipeline,
+                     readers = args.readers,
+                     writers = args.writers,
+                     fmt = args.fmt,
+                     flush_rows = args.flush_rows,
+                     flush_seconds = args.flush_seconds,
+                     append = args.append,
+                     catalog = args.catalog,
+                     split_pages = args.split_pages)
+    else:
+        stats = scrape_transcript(pdf_filepath = args.infile,
+                                  outfile_path = args.outfile,
+                                  cache = args.cache,
+                                  cache_dir = args.cache_dir,
+                                  profile = args.profile,
+                                  memory = args.memory,
+                                  trace_path = args.trace,
+                                  fmt = args.fmt,
+                                  catalog = args.catalog,
+                                  workers = args.workers)
+        if args.profile and isinstance(stats, dict):
+            print_profile(stats)
+
+#%%
@@ -0,0 +1,22 @@
+# Environment:
+# python = 3.74
+# dependencies: pandas, pdfquery, pytest
+
+#%% ANCHOR: Imports
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT] + [os.path.join(ROOT, package) for package in
+                         ("transcript_miner", "transcript_benchmark", "transcript_plotter")]
+
+# ANCHOR: Fixtures
+@pytest.fixture
+def sample0():
+    """
+    Returns str, path of the sample transcript that has reference records
+    (data/sample0_results.csv)
+    """
+    return os.path.join(ROOT, "data", "sample0.pdf")
@@ -0,0 +1,59 @@
+#%% ANCHOR: Imports
+import os
+
+import pandas as pd
+import pytest
+
+import transcript_analytics as ta
+
+# ANCHOR: Repeated courses
+# repeated attempts of a 4-unit course, as (semester, grade, earned, points)
+# rows, with the career totals (attempted, earned, gpa_units, points) they make
+REPEAT_CASES = {
+    "D, then W": ([("Fall 2010", "D", 4, 4), ("Spring 2011", "W", 0, 0)],
+                  (4, 4, 4, 4)),
+    "D, then in progress": ([("Fall 2010", "D", 4, 4), ("Spring 2011", "", 0, 0)],
+                            (8, 4, 4, 4)),
+    "D, then W, then B": ([("Fall 2010", "D", 4, 4), ("Spring 2011", "W", 0, 0),
+                           ("Fall 2011", "B", 4, 12)],
+                          (8, 4, 4, 12)),
+    "F, then D, then C": ([("Fall 2010", "F", 0, 0), ("Spring 2011", "D", 4, 4),
+                           ("Fall 2011", "C", 4, 8)],
+                          (12, 4, 4, 8)),
+}
+
+# ANCHOR: __repeat_records()
+def __repeat_records(attempts):
+    """
+    Returns pd.DataFrame, one student's records of a REPEAT_CASES course
+
+    Args:
+        attempts: list of (semester, grade, earned, points)
+    """
+    return pd.DataFrame([("MATH", "100", "Intermediate Algebra", 4, earned, grade, points,
+                          semester, "", "SCC", "Student, A")
+                         for semester, grade, earned, points in attempts],
+                        columns=("dept", "seq", "title", "attempt", "earned", "grade",
+                                 "points", "semester", "plan", "college", "name"))
+
+# ANCHOR: Tests
+def test_sample0_term_totals(sample0):
+    # the term and cumulative totals printed on the transcript, to 3 places
+    name = os.path.splitext(sample0)[0]
+    records = pd.read_csv(name + "_results.csv", dtype=str, keep_default_na=False)
+    expected = pd.read_csv(name + "_terms.csv", keep_default_na=False)
+
+    totals = ta.term_totals(ta.load_records(records))[list(expected.columns)]
+    pd.testing.assert_frame_equal(totals.round(3).reset_index(drop=True), expected,
+                                  check_dtype=False)
+
+@pytest.mark.parametrize("case", list(REPEAT_CASES))
+def test_repeated_course_totals(case):
+    attempts, expected = REPEAT_CASES[case]
+    totals = ta.career_totals(ta.load_records(__repeat_records(attempts)))
+    assert tuple(totals.loc[0, list(ta.MEASURES)]) == expected
+
+def test_without_repeats_every_attempt_counts():
+    attempts, expected = REPEAT_CASES["F, then D, then C"]
+    totals = ta.career_totals(ta.load_records(__repeat_records(attempts)), repeats=False)
+    assert tuple(totals.loc[0, list(ta.MEASURES)]) == (12, 8, 12, 12)
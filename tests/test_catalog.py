@@ -0,0 +1,87 @@
+#%% ANCHOR: Imports
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+import transcript_catalog as tc
+import transcript_miner as tm
+
+# ANCHOR: Fixtures
+@pytest.fixture
+def catalog_index(tmp_path):
+    """
+    Returns str, path of a catalog index of a few of sample0's courses, with
+    a code written loosely, a duplicate code and a row without one
+    """
+    catalog = pd.DataFrame(
+        [("CHEM 305", "Introduction to Chemistry", "5 Units"),
+         ("biol  102 ", "Essentials of Human Anatomy and Physiology", "4 Units"),
+         ("BIOL 102", "Duplicate of the row above", "1 Unit"),
+         ("ENGWR 300", "College  Composition", "3 Units"),
+         ("", "Row without a code", "1 Unit"),
+         ("STAT 300", "Introduction to Probability and Statistics", "3 Units")],
+        columns=("code", "title", "units"))
+    index_filepath = str(tmp_path / "catalog.npz")
+    tc.build_catalog(catalog, index_filepath)
+    return index_filepath
+
+# ANCHOR: Tests
+def test_index_reloads(catalog_index):
+    catalog = tc.load_catalog(catalog_index)
+
+    assert len(catalog) == 4
+    row = catalog.find_row(tc.course_key("Biol 102"))
+    assert (catalog.titles[row], catalog.units[row]) == \
+           ("Essentials of Human Anatomy and Physiology", "4")
+    assert catalog.titles[catalog.find_row("ENGWR 300")] == "College Composition"
+    assert catalog.find_row("FCS 340") == -1
+    assert catalog.prefix("intro")["code"].tolist() == ["CHEM 305", "STAT 300"]
+
+def test_stale_index_is_rejected(catalog_index, tmp_path):
+    with np.load(catalog_index) as archive:
+        columns = dict(archive)
+    columns["format"] = np.array([tc.CATALOG_FORMAT + 1])
+    stale = str(tmp_path / "stale.npz")
+    np.savez(stale, **columns)
+    with pytest.raises(ValueError):
+        tc.load_catalog(stale)
+
+def test_enrich_mined_rows(sample0, catalog_index, tmp_path):
+    records, npages = main.mine_transcript(sample0, cache_dir=str(tmp_path),
+                                           catalog=catalog_index)
+    assert list(records.columns) == list(tm.RECORD_COLUMNS) + list(tc.ENRICHED_COLUMNS)
+
+    enriched = {"%s %s" % (row.dept, row.seq): (row.catalog_title, row.units)
+                for row in records.itertuples()}
+    assert enriched["BIOL 102"] == ("Essentials of Human Anatomy and Physiology", "4")
+    assert enriched["CHEM 305"] == ("Introduction to Chemistry", "5")
+    assert enriched["STAT 300"] == ("Introduction to Probability and Statistics", "3")
+    assert enriched["FCS 340"] == ("", "")
+    assert sum(title != "" for title in records["catalog_title"]) == \
+           sum(code in ("BIOL 102", "CHEM 305", "ENGWR 300", "STAT 300")
+               for code in records["dept"] + " " + records["seq"])
+
+def test_search_finds_mined_titles(sample0, catalog_index, tmp_path):
+    # the transcript's titles are truncated and abbreviated forms of the
+    # catalog's, e.g. "Essentials Human Anat/Physio"
+    catalog = tc.load_catalog(catalog_index)
+    records, npages = main.mine_transcript(sample0, cache_dir=str(tmp_path),
+                                           catalog=catalog_index)
+    found = records[records["catalog_title"] != ""]
+    assert len(found) > 0
+    for row in found.itertuples():
+        best = catalog.search(row.title, limit=1)
+        assert best.loc[0, "code"] == "%s %s" % (row.dept, row.seq)
+        assert (best.loc[0, "title"], best.loc[0, "units"]) == (row.catalog_title, row.units)
+
+def test_spreadsheet_is_converted_once(tmp_path):
+    pytest.importorskip("openpyxl")
+    catalog = tc.open_catalog(tc.CATALOG_XLSX, str(tmp_path))
+
+    converted = [name for name in os.listdir(str(tmp_path)) if name.startswith("catalog-")]
+    assert len(converted) == 1
+    row = catalog.find_row("CHEM 305")
+    assert (catalog.titles[row], catalog.units[row]) == ("Introduction to Chemistry", "5")
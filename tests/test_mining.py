@@ -0,0 +1,66 @@
+#%% ANCHOR: Imports
+import os
+
+import pandas as pd
+import pytest
+
+import main
+import transcript_miner as tm
+
+# ANCHOR: __as_text()
+def __as_text(records):
+    """
+    Returns pd.DataFrame, records as they are written to CSV
+
+    Args:
+        records: pd.DataFrame of records
+    """
+    return records.fillna("").astype(str).reset_index(drop=True)
+
+# ANCHOR: Tests
+@pytest.mark.parametrize("cached", [False, True])
+def test_sample0_matches_reference(sample0, cached, tmp_path):
+    expected = pd.read_csv(os.path.splitext(sample0)[0] + "_results.csv", dtype=str,
+                           keep_default_na=False)
+    if cached:
+        # once to fill the cache, once from it
+        main.mine_transcript(sample0, cache=True, cache_dir=str(tmp_path))
+    records, npages = main.mine_transcript(sample0, cache=cached, cache_dir=str(tmp_path))
+
+    assert npages == 6
+    assert list(records.columns) == list(tm.RECORD_COLUMNS)
+    pd.testing.assert_frame_equal(__as_text(records), __as_text(expected))
+
+def test_bad_file_is_rejected(sample0):
+    with pytest.raises(tm.InvalidPDF):
+        main.mine_transcript(os.path.join(os.path.dirname(sample0), "bad_file0.pdf"),
+                             cache=False)
+
+def test_changed_page_is_laid_out_alone(sample0, tmp_path, monkeypatch):
+    cold = tm.load_layout(sample0, cache=False)
+    cache_dir = str(tmp_path)
+    tm.load_layout(sample0, cache_dir=cache_dir)
+
+    # as if the transcript was pulled again with its third page changed: no
+    # whole-file entry, and no entry for that page
+    fingerprint = tm.page_fingerprints(sample0)[2]
+    for name in os.listdir(cache_dir):
+        if not name.startswith("page-") or name.startswith("page-%s-" % fingerprint):
+            os.remove(os.path.join(cache_dir, name))
+    laid_out = []
+    layout_page = getattr(tm, "__layout_page")
+    def spy(pdf, n, *args):
+        laid_out.append(n)
+        return layout_page(pdf, n, *args)
+    monkeypatch.setattr(tm, "__layout_page", spy)
+
+    warm = tm.load_layout(sample0, cache_dir=cache_dir)
+    assert laid_out == [2]
+    for name in ("pages", "lines"):
+        pd.testing.assert_frame_equal(warm[name].reset_index(drop=True),
+                                      cold[name].reset_index(drop=True))
+    # mined from the whole-file entry the warm layout was stored under
+    records, npages = main.mine_transcript(sample0, cache_dir=cache_dir)
+    expected = pd.read_csv(os.path.splitext(sample0)[0] + "_results.csv", dtype=str,
+                           keep_default_na=False)
+    pd.testing.assert_frame_equal(__as_text(records), __as_text(expected))
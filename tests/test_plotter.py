@@ -0,0 +1,38 @@
+#%% ANCHOR: Imports
+import os
+
+import pytest
+
+pytest.importorskip("matplotlib")
+import transcript_miner as tm
+import transcript_plotter as tp
+
+# ANCHOR: Tests
+def test_render_png(sample0, tmp_path):
+    npages, written = tp.render_overlays(sample0, str(tmp_path / "sample0"), "png")
+
+    assert npages == 6
+    assert [os.path.basename(png) for png in written] == \
+           ["page_%03d.png" % pageid for pageid in range(1, 7)]
+    for png in written:
+        with open(png, "rb") as f:
+            assert f.read(8) == b"\x89PNG\r\n\x1a\n"
+
+def test_render_pdf(sample0, tmp_path):
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+
+    out_path = str(tmp_path / "sample0.pdf")
+    npages, written = tp.render_overlays(sample0, out_path)
+
+    assert npages == 6 and written == [out_path]
+    with open(out_path, "rb") as f:
+        assert len(list(PDFPage.create_pages(PDFDocument(PDFParser(f))))) == 6
+
+def test_course_boxes_span_the_row(sample0):
+    pages, boxes = tp.transcript_overlays(sample0)
+    courses = boxes[boxes["kind"] == "Course"]
+
+    assert len(courses) == 36
+    assert set(courses["x1"]) == {tm.COL1_X_VALS["points"][1], tm.COL2_X_VALS["points"][1]}
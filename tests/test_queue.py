@@ -0,0 +1,87 @@
+#%% ANCHOR: Imports
+import os
+import json
+import time
+
+import pandas as pd
+import pytest
+
+import main
+
+claim_job = getattr(main, "__claim_job")
+reap_leases = getattr(main, "__reap_leases")
+
+# ANCHOR: Fixtures
+@pytest.fixture
+def queue(sample0, tmp_path):
+    """
+    Returns str, a queue directory holding one job, to scrape sample0
+    """
+    queue_dir = str(tmp_path / "queue")
+    assert main.enqueue(sample0, str(tmp_path / "out"), queue_dir) == 1
+    return queue_dir
+
+# ANCHOR: __age()
+def __age(path, seconds):
+    """
+    Sets the file's mtime that many seconds back, as if its heartbeat stopped
+    """
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+# ANCHOR: __job()
+def __job(queue_dir, state):
+    """
+    Returns dict, the only job record in a state
+    """
+    names = os.listdir(os.path.join(queue_dir, state))
+    assert len(names) == 1
+    with open(os.path.join(queue_dir, state, names[0])) as job_file:
+        return json.load(job_file)
+
+# ANCHOR: Tests
+def test_expired_lease_goes_back_to_todo_once(queue):
+    lease = claim_job(queue)
+    assert main.queue_status(queue) == {"todo": 0, "leases": 1, "done": 0, "failed": 0}
+
+    reap_leases(queue, lease_seconds=60, max_attempts=3)
+    assert os.path.exists(lease)  # still heartbeating
+
+    __age(lease, 120)
+    for _ in range(3):
+        reap_leases(queue, lease_seconds=60, max_attempts=3)
+    assert main.queue_status(queue) == {"todo": 1, "leases": 0, "done": 0, "failed": 0}
+    assert __job(queue, "todo")["attempts"] == 1
+
+    # the next claim is a lease of its own, which the reaped worker cannot touch
+    assert claim_job(queue) != lease
+    assert not os.path.exists(lease)
+
+def test_crashed_reaper_is_recovered(queue):
+    lease = claim_job(queue)
+    # a reaper that died between taking the lease and writing the job back
+    job = os.path.basename(lease).rsplit(".", 2)[0]
+    reaping = os.path.join(queue, "leases", job + ".999-1.reaping")
+    os.rename(lease, reaping)
+    __age(reaping, 120)
+
+    reap_leases(queue, lease_seconds=60, max_attempts=3)
+    assert os.listdir(os.path.join(queue, "leases")) == []
+    assert __job(queue, "todo")["attempts"] == 1
+
+def test_job_fails_after_max_attempts(queue):
+    for _ in range(2):
+        __age(claim_job(queue), 120)
+        reap_leases(queue, lease_seconds=60, max_attempts=2)
+    assert main.queue_status(queue) == {"todo": 0, "leases": 0, "done": 0, "failed": 1}
+    assert "lease expired 2 times" in __job(queue, "failed")["error"]
+
+def test_work_drains_the_queue(sample0, queue, tmp_path):
+    results = main.work_queue(queue, worker_id="test", cache_dir=str(tmp_path / "cache"))
+
+    assert [result["error"] for result in results] == [None]
+    assert main.queue_status(queue) == {"todo": 0, "leases": 0, "done": 1, "failed": 0}
+    written = pd.read_csv(__job(queue, "done")["outfile"], dtype=str, keep_default_na=False)
+    expected = pd.read_csv(os.path.splitext(sample0)[0] + "_results.csv", dtype=str,
+                           keep_default_na=False)
+    pd.testing.assert_frame_equal(written, expected)
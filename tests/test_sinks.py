@@ -0,0 +1,96 @@
+#%% ANCHOR: Imports
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import main
+import transcript_miner as tm
+
+# ANCHOR: Fixtures
+@pytest.fixture(scope="module")
+def mined(tmp_path_factory):
+    """
+    Returns list of (pdf path, pd.DataFrame of its records), for sample0 and
+    sample2
+    """
+    data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+    cache_dir = str(tmp_path_factory.mktemp("cache"))
+    return [(os.path.join(data, name), main.mine_transcript(os.path.join(data, name),
+                                                            cache_dir=cache_dir)[0])
+            for name in ("sample0.pdf", "sample2.pdf")]
+
+# ANCHOR: __read_back()
+def __read_back(filename, fmt):
+    """
+    Returns pd.DataFrame of the rows of an output file, as text
+
+    Args:
+        filename: path of the file
+        fmt: its format, a key of tm.SINK_FORMATS
+    """
+    if fmt == "csv":
+        records = pd.read_csv(filename, dtype=str, keep_default_na=False)
+    elif fmt == "jsonl":
+        records = pd.read_json(filename, lines=True, dtype=False)
+    else:
+        records = pd.read_parquet(filename)
+    return records.fillna("").astype(str).reset_index(drop=True)
+
+# ANCHOR: __as_text()
+def __as_text(records):
+    """
+    Returns pd.DataFrame, records as text, the way __read_back() reads them
+    """
+    return records.fillna("").astype(str).reset_index(drop=True)
+
+# ANCHOR: Tests
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_append_across_batches(mined, fmt, tmp_path):
+    filename = str(tmp_path / ("all" + tm.SINK_FORMATS[fmt].extensions[0]))
+    for n, (pdf_filepath, records) in enumerate(mined):
+        # a few rows per flush, and a new sink per batch
+        with tm.open_sink(filename, fmt, flush_rows=5, append=n > 0) as sink:
+            sink.write(records)
+
+    expected = pd.concat([records for pdf_filepath, records in mined], ignore_index=True)
+    pd.testing.assert_frame_equal(__read_back(filename, fmt), __as_text(expected))
+    if fmt == "csv":
+        with open(filename) as csv_file:
+            assert sum(line.startswith("dept,seq,") for line in csv_file) == 1
+
+def test_parquet_row_groups(mined, tmp_path):
+    pytest.importorskip("pyarrow")
+    filename = str(tmp_path / "all.parquet")
+    with tm.open_sink(filename, flush_rows=5) as sink:
+        for pdf_filepath, records in mined:
+            sink.write(records)
+
+    expected = pd.concat([records for pdf_filepath, records in mined], ignore_index=True)
+    pd.testing.assert_frame_equal(__read_back(filename, "parquet"), __as_text(expected))
+    with pytest.raises(ValueError):
+        tm.open_sink(filename, append=True)
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl", "parquet"])
+def test_merged_batch_matches_per_file_output(mined, fmt, tmp_path):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for pdf_filepath, records in mined:
+        shutil.copy(pdf_filepath, str(inputs))
+    extension = tm.SINK_FORMATS[fmt].extensions[0]
+
+    main.scrape_batch(str(inputs), str(tmp_path / "out"), workers=1, fmt=fmt, cache=False)
+    main.scrape_batch(str(inputs), str(tmp_path / ("all" + extension)), workers=1,
+                      merge=True, fmt=fmt, cache=False)
+
+    merged = __read_back(str(tmp_path / ("all" + extension)), fmt)
+    for pdf_filepath, records in mined:
+        name = os.path.splitext(os.path.basename(pdf_filepath))[0]
+        rows = merged[merged["source"].map(os.path.basename) == os.path.basename(pdf_filepath)]
+        per_file = __read_back(str(tmp_path / "out" / (name + extension)), fmt)
+        pd.testing.assert_frame_equal(rows.drop(columns="source").reset_index(drop=True),
+                                      per_file)
+    assert len(merged) == sum(len(records) for pdf_filepath, records in mined)
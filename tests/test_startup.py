@@ -0,0 +1,11 @@
+#%% ANCHOR: Imports
+import pytest
+
+import transcript_benchmark as tb
+
+# ANCHOR: Tests
+@pytest.mark.parametrize("check", tb.STARTUP_CHECKS, ids=[check[0] for check in tb.STARTUP_CHECKS])
+def test_startup_within_budget(check):
+    result, = tb.startup_suite(repeat=3, checks=[check])
+    assert not result["heavy"], "imports " + ", ".join(result["heavy"])
+    assert result["import_ms"] <= result["budget_ms"]
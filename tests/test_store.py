@@ -0,0 +1,57 @@
+#%% ANCHOR: Imports
+import os
+
+import pandas as pd
+import pytest
+
+import transcript_store as ts
+
+# ANCHOR: Fixtures
+@pytest.fixture
+def records(sample0):
+    """
+    Returns pd.DataFrame, sample0's reference records
+    """
+    return pd.read_csv(os.path.splitext(sample0)[0] + "_results.csv", dtype=str,
+                       keep_default_na=False)
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    Returns ResultsStore, empty, closed after the test
+    """
+    with ts.open_store(str(tmp_path / "results.db")) as store:
+        yield store
+
+# ANCHOR: Tests
+def test_ingest_again_replaces_rows(store, records):
+    assert store.ingest([("digest0", "sample0.pdf", records)]) == 36
+    assert store.ingest([("digest0", "renamed.pdf", records.iloc[:10])]) == 10
+    assert store.summary() == {"transcripts": 1, "courses": 10, "students": 1, "colleges": 2}
+    assert set(store.find()["source"]) == {"renamed.pdf"}
+
+    store.ingest([("digest1", "sample0_copy.pdf", records)])
+    assert store.summary()["transcripts"] == 2
+    assert len(store.find()) == 46
+
+def test_find_since_reads_the_semester_year(store, records):
+    store.ingest([("digest0", "sample0.pdf", records)])
+    found = store.find(since=2016)
+
+    assert len(found) == 7
+    assert (found["year"] >= 2016).all()
+    assert set(found["semester"]) == {semester for semester in records["semester"]
+                                      if int(semester[-4:]) >= 2016}
+    assert len(store.find(course="CHEM 305", grade="W", college="ARC", since=2015)) == 1
+
+def test_find_name_is_a_prefix(store, records):
+    other = records.iloc[:3].assign(name="Gu_rra, 100%")
+    store.ingest([("digest0", "sample0.pdf", records), ("digest1", "other.pdf", other)])
+
+    assert len(store.find(name="Guerra, J")) == 36
+    assert len(store.find(name="guerra")) == 36
+    assert len(store.find(name="Jessica")) == 0
+    # LIKE wildcards in a name match only themselves
+    assert len(store.find(name="Gu_rra")) == 3
+    assert len(store.find(name="Gu_rra, 100%")) == 3
+    assert len(store.find(name="G%")) == 0
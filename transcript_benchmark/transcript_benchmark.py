@@ -0,0 +1,557 @@
+# Environment:
+# python = 3.74
+# dependencies: pandas, pdfquery
+
+#%% ANCHOR: Imports
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "transcript_miner"), os.path.dirname(os.path.abspath(__file__)),
+                ROOT]
+
+import main
+import transcript_miner as tm
+import transcript_analytics as ta
+import transcript_generator as tg
+
+#%% SECTION: Stage timing
+
+# ANCHOR: Global Constants
+# pipeline stages of main.scrape_transcript, in the order they run, each timed
+# as the sum of these outermost tm.profiling() spans
+STAGE_SPANS = {"load": ("load_layout",),
+               "validate": ("rejection_reason",),
+               "tokenize": ("tokenize_layout",),
+               "colleges": ("define_college_sections",),
+               "labels": ("scrape_semesters_and_plans", "group_semesters_by_college"),
+               "courses": ("scrape_courses",),
+               "records": ("prepare_records",),
+               "csv": ("write_records",)}
+STAGES = tuple(STAGE_SPANS)
+
+SCALING_PAGES = (1, 2, 5, 10, 20, 50)
+
+# a stage is reported as regressed when its fastest run slows by this factor
+REGRESSION_RATIO = 1.25
+
+# stages faster than this are too noisy to compare against a baseline
+MIN_COMPARED_SECONDS = 0.005
+
+# ANCHOR: time_stages()
+def time_stages(pdf_filepath, outfile_path, cache=False, cache_dir=None):
+    """
+    Runs main.mine_transcript once, and writes its records as
+    main.scrape_transcript does, under tm.profiling().
+
+    Returns tuple of (dict of {stage: seconds}, records, npages)
+
+    Raises tm.InvalidPDF if the file is not a valid transcript.
+
+    Args:
+        pdf_filepath: path to transcript pdf to be scraped
+        outfile_path: path of the CSV outfile
+        cache: whether the load stage may read the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+    """
+    with tm.profiling() as profile:
+        records, npages = main.mine_transcript(pdf_filepath, cache, cache_dir)
+        tm.write_records(records, outfile_path, source=pdf_filepath)
+
+    # spans nested in another (e.g. parse_layout in load_layout) are already
+    # part of its time
+    spans = profile["spans"]
+    spent = spans[spans["depth"] == 0].groupby("name")["seconds"].sum()
+    seconds = {stage: float(spent.reindex(list(names)).fillna(0.0).sum())
+               for stage, names in STAGE_SPANS.items()}
+    return seconds, records, npages
+
+# ANCHOR: benchmark_file()
+def benchmark_file(pdf_filepath, repeat=3, expected=None, cache=False, cache_dir=None):
+    """
+    Returns dict with keys source, pages, rows, repeat, correct, stages and
+    total. stages maps each stage to its min, median and mean seconds over
+    the repeats; total holds the same for the whole pipeline.
+
+    Args:
+        pdf_filepath: path to transcript pdf to be scraped
+        repeat: number of timed runs
+        expected: pd.DataFrame of the records the run should produce, or None
+                  to skip the correctness check (correct is then None)
+        cache: whether the load stage may read the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        outfile_path = os.path.join(workdir, "records.csv")
+        runs = []
+        for _ in range(repeat):
+            seconds, records, npages = time_stages(pdf_filepath, outfile_path,
+                                                   cache, cache_dir)
+            runs.append(seconds)
+
+    runs = pd.DataFrame(runs, columns=STAGES)
+    runs["total"] = runs.sum(axis=1)
+    summary = {column: {"min": runs[column].min(),
+                        "median": runs[column].median(),
+                        "mean": runs[column].mean()}
+               for column in runs.columns}
+
+    return {"source": pdf_filepath,
+            "pages": npages,
+            "rows": len(records),
+            "repeat": repeat,
+            "correct": None if expected is None else same_records(records, expected),
+            "stages": {stage: summary[stage] for stage in STAGES},
+            "total": summary["total"]}
+
+# ANCHOR: same_records()
+def same_records(records, expected):
+    """
+    Returns bool, whether records hold the same values as expected, compared
+    as they are written to CSV
+
+    Args:
+        records: pd.DataFrame from tm.prepare_records()
+        expected: pd.DataFrame of expected records
+    """
+    as_text = lambda df: df.fillna("").astype(str).reset_index(drop=True)
+    records, expected = as_text(records), as_text(expected)
+    return list(records.columns) == list(expected.columns) and records.equals(expected)
+
+# ANCHOR: expected_records()
+def expected_records(pdf_filepath):
+    """
+    Returns pd.DataFrame of the reference records kept next to a sample
+    transcript as <name>_results.csv, or None when there are none.
+
+    Args:
+        pdf_filepath: path to transcript pdf
+    """
+    reference = os.path.splitext(pdf_filepath)[0] + "_results.csv"
+    if not os.path.isfile(reference):
+        return None
+    return pd.read_csv(reference, dtype=str, keep_default_na=False)
+# !SECTION
+
+#%% SECTION: Suites
+
+# ANCHOR: scaling_suite()
+def scaling_suite(pages=SCALING_PAGES, repeat=3, ncolleges=2, seed=0, workdir=None):
+    """
+    Benchmarks synthetic transcripts of increasing length, checking every
+    run against the records the generator expects.
+
+    Returns list of result dicts from benchmark_file(), one per page count,
+    each with the extra keys semesters and colleges.
+
+    Args:
+        pages: page counts to generate
+        repeat: number of timed runs per transcript
+        ncolleges: college sections per transcript
+        seed: generator seed
+        workdir: directory to keep the generated PDFs in (default: a
+                 temporary directory, removed afterwards)
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = workdir or tmpdir
+        os.makedirs(workdir, exist_ok=True)
+        results = []
+        for npages in pages:
+            pdf_filepath = os.path.join(workdir, "synthetic_%03d.pdf" % npages)
+            expected = tg.generate_transcript(pdf_filepath, npages=npages,
+                                              ncolleges=min(ncolleges, npages), seed=seed)
+            result = benchmark_file(pdf_filepath, repeat, expected)
+            result.update(source=os.path.basename(pdf_filepath),
+                          semesters=int(expected["semester"].nunique()),
+                          colleges=int(expected["college"].nunique()))
+            results.append(result)
+            __print_result(result)
+    return results
+
+# ANCHOR: file_suite()
+def file_suite(pdf_filepaths, repeat=3, cache=False, cache_dir=None):
+    """
+    Benchmarks real transcripts, checking each against its reference records
+    when there are any (see expected_records).
+
+    Returns list of result dicts from benchmark_file()
+
+    Args:
+        pdf_filepaths: paths to transcript pdfs
+        repeat: number of timed runs per transcript
+        cache: whether the load stage may read the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+    """
+    results = []
+    for pdf_filepath in pdf_filepaths:
+        result = benchmark_file(pdf_filepath, repeat, expected_records(pdf_filepath),
+                                cache, cache_dir)
+        results.append(result)
+        __print_result(result)
+    return results
+
+# ANCHOR: layout_suite()
+def layout_suite(pdf_filepaths, variants, repeat=3):
+    """
+    Times the layout stage of every transcript under each variant of the
+    layout settings, and checks that the variants produce the same CSV.
+
+    Returns list of dicts with keys source, pages, identical and variants,
+    which maps each variant to the min, median and mean seconds of layout
+    per page
+
+    Args:
+        pdf_filepaths: paths to transcript pdfs
+        variants: dict of {name: keyword arguments of tm.load_layout()}, the
+                  first of them the one the others are compared against
+        repeat: number of timed runs per transcript and variant
+    """
+    names = list(variants)
+    results = []
+    for pdf_filepath in pdf_filepaths:
+        result = {"source": pdf_filepath, "variants": dict()}
+        csvs = set()
+        for name in names:
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                layout = tm.load_layout(pdf_filepath, cache=False, **variants[name])
+                runs.append(time.perf_counter() - start)
+            npages = len(layout["pages"])
+            csvs.add(main.mine_layout(layout).to_csv(index=False))
+            runs = pd.Series(runs) / npages
+            result["variants"][name] = {"min": runs.min(), "median": runs.median(),
+                                        "mean": runs.mean()}
+        result.update(pages=npages, identical=len(csvs) == 1)
+        results.append(result)
+
+        per_page = " ".join("%s=%.0fms/page" % (name, 1000 * result["variants"][name]["min"])
+                            for name in names)
+        speedup = result["variants"][names[0]]["min"] / result["variants"][names[-1]]["min"]
+        print("%-24s %3d pages  %s  %.2fx  %s" % \
+              (os.path.basename(pdf_filepath), npages, per_page, speedup,
+               "identical" if result["identical"] else "DIFFERENT CSV"))
+    return results
+
+# ANCHOR: Startup budgets
+# modules that pull in pandas, pdfminer, lxml or matplotlib, none of which a
+# CLI call that fails before mining should wait for
+HEAVY_MODULES = ("pandas", "numpy", "pdfminer", "pdfquery", "lxml", "matplotlib")
+
+# (label, python arguments, modules it must not import, budget of total
+#  import time in ms as reported by python -X importtime)
+STARTUP_CHECKS = (
+    ("main.py --help", ["main.py", "--help"], HEAVY_MODULES, 60),
+    ("main.py missing.pdf", ["main.py", "missing.pdf", "out.csv"], HEAVY_MODULES, 60),
+    ("import transcript_miner", ["-c", "import transcript_miner"],
+     ("pdfquery", "lxml", "matplotlib"), 900),
+    ("import transcript_plotter", ["-c", "import transcript_plotter"], HEAVY_MODULES, 30),
+)
+
+# ANCHOR: startup_suite()
+def startup_suite(repeat=5, checks=STARTUP_CHECKS):
+    """
+    Runs each check in a fresh interpreter under python -X importtime, and
+    holds it to its import time budget and forbidden modules.
+
+    Returns list of dicts with keys label, seconds (fastest wall time),
+    import_ms (total import time of that run), budget_ms, heavy (forbidden
+    modules it imported) and ok
+
+    Args:
+        repeat: runs per check
+        checks: tuples of (label, python arguments, forbidden modules,
+                budget in ms), see STARTUP_CHECKS
+    """
+    import subprocess
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.join(ROOT, "transcript_miner"), os.path.join(ROOT, "transcript_plotter")] +
+        [path for path in [os.environ.get("PYTHONPATH")] if path]))
+    results = []
+    for label, args, forbidden, budget_ms in checks:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=ROOT,
+                                 env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                 text=True)
+            seconds = time.perf_counter() - start
+            if best is None or seconds < best[0]:
+                best = (seconds, run.stderr)
+
+        seconds, report = best
+        imported, import_us = set(), 0
+        for line in report.splitlines():
+            if not line.startswith("import time:") or "[us]" in line:
+                continue
+            self_us, cumulative_us, module = line[len("import time:"):].split("|")
+            import_us += int(self_us)
+            imported.add(module.strip().split(".")[0])
+        heavy = sorted(imported.intersection(forbidden))
+        result = {"label": label, "seconds": seconds, "import_ms": import_us / 1000,
+                  "budget_ms": budget_ms, "heavy": heavy,
+                  "ok": not heavy and import_us / 1000 <= budget_ms}
+        results.append(result)
+        print("%-26s %6.0f ms  imports %6.0f / %4d ms  %s" % \
+              (label, 1000 * seconds, result["import_ms"], budget_ms,
+               "ok" if result["ok"] else "OVER BUDGET" if not heavy
+               else "imports " + ", ".join(heavy)))
+    return results
+
+# students in the timed batch of analytics_suite
+ANALYTICS_STUDENTS = 5000
+
+# ANCHOR: analytics_suite()
+def analytics_suite(students=ANALYTICS_STUDENTS, repeat=3):
+    """
+    Checks the term totals of every sample with reference totals, kept next
+    to it as <name>_terms.csv (the totals printed on the transcript), against
+    its <name>_results.csv records; then times every analytics total over a
+    batch of that many students, made by repeating the first sample's records.
+
+    Returns dict with keys checked (dict of {reference: bool}), students,
+    rows and seconds (the fastest run of load_records and all three totals)
+
+    Args:
+        students: students in the timed batch
+        repeat: number of timed runs
+    """
+    import glob
+
+    checked, samples = dict(), []
+    for reference in sorted(glob.glob(os.path.join(ROOT, "data", "*_terms.csv"))):
+        records = pd.read_csv(reference[:-len("_terms.csv")] + "_results.csv", dtype=str,
+                              keep_default_na=False)
+        expected = pd.read_csv(reference, dtype=str, keep_default_na=False)
+        totals = ta.term_totals(ta.load_records(records))[list(expected.columns)]
+        for column in ta.MEASURES + ("gpa",):
+            for name in (column, "cum_" + column):
+                totals[name] = totals[name].map(lambda value: "%.3f" % value)
+        name = os.path.basename(reference)
+        checked[name] = totals.reset_index(drop=True).equals(expected)
+        samples.append(records)
+        print("%-26s %s" % (name, "ok" if checked[name] else "WRONG TOTALS"))
+
+    if not samples:
+        return {"checked": checked, "students": 0, "rows": 0, "seconds": None}
+    sample = samples[0]
+    batch = pd.concat([sample] * students, ignore_index=True)
+    batch["source"] = np.repeat(["student_%05d.pdf" % n for n in range(students)], len(sample))
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        columns = ta.load_records(batch)
+        ta.term_totals(columns), ta.career_totals(columns), ta.subject_units(columns)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    print("%d students, %d rows: %.0f ms, %.0f rows/s" % \
+          (students, len(batch), 1000 * best, len(batch) / best))
+    return {"checked": checked, "students": students, "rows": len(batch), "seconds": best}
+
+# ANCHOR: __print_result()
+def __print_result(result):
+    """
+    Args:
+        result: result dict from benchmark_file()
+    """
+    correct = {True: "ok", False: "WRONG", None: "--"}[result["correct"]]
+    stages = " ".join("%s=%.1f" % (stage, 1000 * result["stages"][stage]["median"])
+                      for stage in STAGES)
+    print("%-24s %3d pages %4d rows %-5s total=%.1fms  %s" % \
+          (result["source"], result["pages"], result["rows"], correct,
+           1000 * result["total"]["median"], stages))
+# !SECTION
+
+#%% SECTION: Results
+
+# ANCHOR: write_results()
+def write_results(results, json_filepath, cache=False, layouts=None):
+    """
+    Writes the results, with the environment they were measured in, as JSON.
+
+    Args:
+        results: list of result dicts from benchmark_file()
+        json_filepath: path of the JSON outfile
+        cache: whether the load stage read the parse cache
+        layouts: list of result dicts from layout_suite(), or None
+    """
+    import pdfminer
+
+    report = {"created": datetime.now(timezone.utc).isoformat(),
+              "environment": {"python": platform.python_version(),
+                              "platform": platform.platform(),
+                              "pandas": pd.__version__,
+                              "pdfminer": pdfminer.__version__},
+              "cache": cache,
+              "stages": list(STAGES),
+              "backend": tm.layout_backend().name,
+              "profile": tm.layout_profile(),
+              "results": results}
+    if layouts is not None:
+        report["layouts"] = layouts
+    with open(json_filepath, "w") as json_file:
+        json.dump(report, json_file, indent=2)
+
+# ANCHOR: compare_results()
+def compare_results(baseline, results, ratio=REGRESSION_RATIO):
+    """
+    Compares the fastest run of every stage against a baseline report,
+    matching results by source. The minimum is the least noisy of the
+    summaries, since interference only ever adds time.
+
+    Returns list of (source, stage, baseline seconds, seconds) for every
+    stage that got slower by more than ratio
+
+    Args:
+        baseline: report dict loaded from a JSON file of write_results()
+        results: list of result dicts from benchmark_file()
+        ratio: slowdown factor that counts as a regression
+    """
+    before = {result["source"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        if result["source"] not in before:
+            continue
+        for stage in STAGES + ("total",):
+            old = before[result["source"]]
+            old = (old["total"] if stage == "total" else old["stages"][stage])["min"]
+            new = (result["total"] if stage == "total" else result["stages"][stage])["min"]
+            if new > MIN_COMPARED_SECONDS and new > ratio * old:
+                regressions.append((result["source"], stage, old, new))
+    return regressions
+# !SECTION
+
+#%%
+if __name__ == "__main__":
+    import argparse
+
+    argparser = argparse.ArgumentParser(\
+        description = "Benchmark the transcript mining pipeline stage by stage")
+
+    argparser.add_argument(
+        "infiles", nargs = "*", metavar = "PDF_IN",
+        help = "transcript PDFs to benchmark; a <name>_results.csv next to a "
+               "PDF is used to check its records"
+    )
+
+    argparser.add_argument(
+        "--pages", type = int, nargs = "*", default = None,
+        help = "page counts of the synthetic scaling suite (default: %s, or "
+               "none when PDF_IN is given)" % " ".join(map(str, SCALING_PAGES))
+    )
+
+    argparser.add_argument(
+        "--colleges", type = int, default = 2,
+        help = "college sections per synthetic transcript"
+    )
+
+    argparser.add_argument(
+        "--seed", type = int, default = 0,
+        help = "seed of the synthetic transcripts"
+    )
+
+    argparser.add_argument(
+        "--repeat", type = int, default = 3,
+        help = "timed runs per transcript"
+    )
+
+    argparser.add_argument(
+        "--cache", action = "store_true",
+        help = "let the load stage read the parse cache (default: always run "
+               "layout analysis)"
+    )
+
+    argparser.add_argument(
+        "--backends", action = "store_true",
+        help = "instead, compare the layout backends' speed per page and CSV "
+               "output on PDF_IN (default: the data/ samples)"
+    )
+
+    argparser.add_argument(
+        "--profiles", action = "store_true",
+        help = "instead, compare the layout profiles the same way"
+    )
+
+    argparser.add_argument(
+        "--analytics", action = "store_true",
+        help = "instead, check the GPA totals against the samples' printed totals "
+               "and time them over a batch of %d students" % ANALYTICS_STUDENTS
+    )
+
+    argparser.add_argument(
+        "--startup", action = "store_true",
+        help = "instead, check the CLI's start-up time and imports against "
+               "their budgets (see STARTUP_CHECKS)"
+    )
+
+    argparser.add_argument(
+        "--keep", default = None, metavar = "DIR",
+        help = "keep the synthetic transcripts in this directory"
+    )
+
+    argparser.add_argument(
+        "--out", default = None, metavar = "JSON_OUT",
+        help = "write the results to this JSON file"
+    )
+
+    argparser.add_argument(
+        "--baseline", default = None, metavar = "JSON_IN",
+        help = "report stages slower than in this earlier JSON results file"
+    )
+
+    args = argparser.parse_args()
+
+    if args.analytics:
+        analytics = analytics_suite(repeat=args.repeat)
+        sys.exit(0 if all(analytics["checked"].values()) else 1)
+
+    if args.startup:
+        startup = startup_suite(args.repeat)
+        sys.exit(0 if all(result["ok"] for result in startup) else 1)
+
+    if args.backends or args.profiles:
+        import glob
+        pdf_filepaths = args.infiles or sorted(glob.glob(os.path.join(ROOT, "data", "sample*.pdf")))
+        if args.backends:
+            variants = {name: {"backend": name} for name in tm.LAYOUT_BACKENDS}
+        else:
+            variants = {name: {"profile": name} for name in tm.LAYOUT_PROFILES}
+        layouts = layout_suite(pdf_filepaths, variants, args.repeat)
+        if args.out:
+            write_results([], args.out, layouts=layouts)
+        sys.exit(0 if all(result["identical"] for result in layouts) else 1)
+
+    pages = args.pages
+    if pages is None:
+        pages = () if args.infiles else SCALING_PAGES
+
+    results = file_suite(args.infiles, args.repeat, args.cache)
+    results += scaling_suite(pages, args.repeat, args.colleges, args.seed, args.keep)
+
+    if args.out:
+        write_results(results, args.out, args.cache)
+
+    failed = [result["source"] for result in results if result["correct"] is False]
+    for source in failed:
+        print("WRONG RECORDS: %s" % source)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as json_file:
+            regressions = compare_results(json.load(json_file), results)
+        for source, stage, old, new in regressions:
+            print("REGRESSION: %s %s %.1fms -> %.1fms" % (source, stage, 1000 * old, 1000 * new))
+
+    sys.exit(1 if failed or regressions else 0)
+
+#%%
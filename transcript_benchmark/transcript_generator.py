@@ -0,0 +1,475 @@
+# Environment:
+# python = 3.74
+# dependencies: pandas, pdfminer (font metrics only)
+
+#%% ANCHOR: Imports
+import random
+
+import pandas as pd
+from pdfminer.fontmetrics import FONT_METRICS
+
+#%% SECTION: Synthetic Los Rios transcripts
+# Writes transcripts in the Los Rios CCD unofficial transcript layout, with
+# every page's text drawn inside one form XObject (one LTFigure per page, as
+# in the real documents), together with the records the miner should return.
+
+# ANCHOR: Global Constants
+PAGEWIDTH = 792
+PAGEHEIGHT = 612
+PAGEHEADING = 'Los Rios CCD Unofficial Transcript - All'
+
+# baselines of the first and lowest body rows of a column
+TOP_BASELINE = 512
+BOTTOM_BASELINE = 76
+
+# the right column is the left column shifted by this much
+COLUMN_OFFSET = 350
+
+FONT = 'Helvetica'
+FONT_WIDTHS = FONT_METRICS[FONT][1]
+BODY_SIZE = 6
+HEADER_SIZE = 8
+LINE_PITCH = 6.936
+
+# widest description line, so that wrapped titles stay inside the column
+DESCRIPTION_WIDTH = 70
+
+# ANCHOR: Left column x positions
+# (x, alignment): 'l' is the left edge, 'r' the right edge, 'c' the centre
+X_DEPT = (72.4, 'l')
+X_SEQ = (122.8, 'l')
+X_DESCRIPTION = (162.4, 'l')
+X_ATTEMPTED = (264.65, 'r')
+X_EARNED = (301.85, 'r')
+X_GRADE = (321.5, 'c')
+X_UNITS = (338.1, 'r')
+X_POINTS = (374.35, 'r')
+X_LABEL = (72.05, 'l')
+X_PLAN = (135.45, 'l')
+X_TOTALS = (150.94, 'l')
+X_HEADING = (223.0, 'c')
+X_COLLEGE = (221.4, 'c')
+
+# ANCHOR: Vertical spacing
+# distance from the previous row's baseline to this row's
+GAP_COLLEGE = 24.0
+GAP_SEMESTER = 17.7
+GAP_PLAN = 7.1
+GAP_TABLE_HEADER = 11.0
+GAP_FIRST_COURSE = 9.2
+GAP_TERM_HEADER = 10.8
+GAP_TOTALS = 10.65
+GAP_CUM_HEADER = 14.3
+GAP_PROGRESS = 14.3
+GAP_STANDING = 6.9
+
+# ANCHOR: Content pools
+COLLEGES = ('ARC', 'SCC', 'CRC', 'FLC')
+TERMS = ('Spring', 'Summer', 'Fall')
+PLANS = ('Registered Nursing Major', 'Nursing (RN) Major',
+         'Pre-Allied Health and Nursing Major', 'Undeclared',
+         'Business Administration Major', 'Computer Science Major')
+COURSES = (('BIOL', '102', 'Essentials Human Anat/Physio'),
+           ('BIOL', '430', 'Anatomy and Physiology'),
+           ('CHEM', '305', 'Intro to Chemistry'),
+           ('ENGWR', '300', 'College Composition'),
+           ('ENGWR', '302', 'Adv Comp&Critical Think'),
+           ('ENGRD', '11', 'Reading Skill Dvlpmt'),
+           ('ENGLB', '55', 'Individ Reading Skills'),
+           ('MATH', '120', 'Intermediate Algebra'),
+           ('STAT', '300', 'Intro Probability and Stats'),
+           ('PSYC', '300', 'General Principles'),
+           ('NUTRI', '300', 'Nutrition'),
+           ('HIST', '310', 'History of the United States'),
+           ('COMM', '301', 'Intro to Public Speaking'),
+           ('CISC', '310', 'Intro to Computer Information Science and Literacy'),
+           ('NURSE', '400W', 'Nursing Process and Clinical Judgement Laboratory'),
+           ('KINES', '300', 'Fitness'))
+UNITS = ('0.500', '1.000', '2.000', '3.000', '4.000', '5.000')
+GRADES = {'A': 4, 'B': 3, 'C': 2, 'D': 1, 'F': 0, 'W': None, 'CR': None,
+          'P': None, '': None}
+NAMES = (('Guerra', 'Jessica A'), ('Nguyen', 'Thomas'), ('Smith', 'Maria L'),
+         ('Okafor', 'Chidi'), ('Park', 'Min-Jun'))
+
+RECORD_COLUMNS = ("dept", "seq", "title", "attempt", "earned", "grade", "points",
+                  "semester", "plan", "college", "name")
+
+# ANCHOR: generate_transcript()
+def generate_transcript(pdf_filepath, npages=None, nsemesters=None, ncolleges=1, seed=0):
+    """
+    Writes a synthetic transcript to pdf_filepath. Semesters flow down the
+    left column, then the right, then onto the next page, breaking between
+    rows, so that long transcripts hold semesters spanning columns and pages.
+
+    Returns pd.DataFrame of the records the miner should produce, in
+    transcript order, with the same columns as the miner's records.
+
+    Args:
+        pdf_filepath: path of the PDF to write
+        npages: fill exactly this many pages with semesters
+        nsemesters: write this many semesters (when npages is None)
+        ncolleges: number of college sections the semesters are split across
+        seed: random seed; the same arguments always produce the same file
+    """
+    if (npages is None) == (nsemesters is None):
+        raise ValueError("Pass exactly one of npages or nsemesters.")
+    rng = random.Random(seed)
+    last, first = rng.choice(NAMES)
+    terms = __iter_terms(rng)
+
+    flow, records = __Flow(), []
+    for n in range(nsemesters if nsemesters is not None else 10**6):
+        if nsemesters is not None:
+            college = n * ncolleges // nsemesters
+        else:
+            # college sections share the pages out evenly
+            college = min(flow.column * ncolleges // (2 * npages), ncolleges - 1)
+        starts_college = college != flow.college
+
+        semester, plan = next(terms), rng.choice(PLANS)
+        courses = [__random_course(rng) for _ in range(rng.randint(1, 6))]
+        block = __semester_rows(semester, plan, courses)
+        if starts_college:
+            block.insert(0, __college_row(COLLEGES[college % len(COLLEGES)]))
+
+        trial = flow.copy()
+        trial.place(block)
+        if npages is not None and trial.column >= 2 * npages:
+            if n < ncolleges:
+                raise ValueError("%d pages cannot hold %d colleges." % (npages, ncolleges))
+            break
+
+        flow = trial
+        flow.college = college
+        records.extend(dict(course, semester=semester, plan=plan,
+                            college=COLLEGES[college % len(COLLEGES)],
+                            name="%s, %s" % (last, first))
+                       for course in courses)
+
+    pages = flow.pages(npages)
+    for page in pages:
+        __add_page_header(page, last, first)
+    __write_pdf(pdf_filepath, pages)
+
+    return pd.DataFrame(records, columns=RECORD_COLUMNS)
+
+# ANCHOR: __iter_terms()
+def __iter_terms(rng):
+    """
+    Returns generator of semester headings in chronological order, with
+    summer terms included at random.
+
+    Args:
+        rng: random.Random
+    """
+    year = 2008
+    while True:
+        for term in TERMS:
+            if term != 'Summer' or rng.random() < 0.4:
+                yield "%s %d" % (term, year)
+        year += 1
+
+# ANCHOR: __random_course()
+def __random_course(rng):
+    """
+    Returns dict of one course record, without the semester-level fields
+
+    Args:
+        rng: random.Random
+    """
+    dept, seq, title = rng.choice(COURSES)
+    units = rng.choice(UNITS)
+    grade = rng.choice(tuple(GRADES))
+    if grade in ('F', 'W', ''):
+        earned = '0.000'
+    else:
+        earned = units
+    points = '%.3f' % (float(units) * (GRADES[grade] or 0))
+    return {"dept": dept, "seq": seq, "title": title, "attempt": units,
+            "earned": earned, "grade": grade, "points": points}
+
+# ANCHOR: __wrap()
+def __wrap(text, width, size=BODY_SIZE):
+    """
+    Returns list of lines of text, each at most width points wide
+
+    Args:
+        text: text to wrap at spaces
+        width: line width in points
+        size: font size
+    """
+    lines = []
+    for word in text.split(" "):
+        if lines and __text_width(lines[-1] + " " + word, size) <= width:
+            lines[-1] += " " + word
+        else:
+            lines.append(word)
+    return lines
+
+# ANCHOR: __text_width()
+def __text_width(text, size):
+    """
+    Returns float width of text in points
+
+    Args:
+        text: text set in FONT
+        size: font size
+    """
+    return sum(FONT_WIDTHS.get(char, 556) for char in text) * size / 1000
+
+#%% SECTION: Rows
+# A row is a tuple (gap, depth, items): gap is the distance from the previous
+# row's baseline, depth how far the row's last line sits below its baseline,
+# and items a list of (dy, (x, align), text, size) relative to the left
+# column. Rows are never split across columns.
+
+# ANCHOR: __college_row()
+def __college_row(college):
+    """
+    Returns row tuple
+
+    Args:
+        college: college abbreviation
+    """
+    text = "----------Beginning of %s Record----------" % college
+    return (GAP_COLLEGE, 0, [(0, X_COLLEGE, text, HEADER_SIZE)])
+
+# ANCHOR: __semester_rows()
+def __semester_rows(semester, plan, courses):
+    """
+    Returns list of row tuples for one semester: heading, plan, course table,
+    term totals and cumulative totals
+
+    Args:
+        semester: semester heading
+        plan: plan name
+        courses: list of course dicts from __random_course()
+    """
+    rows = [(GAP_SEMESTER, 0, [(0, X_HEADING, semester, BODY_SIZE)]),
+            (GAP_PLAN, 0, [(0, X_LABEL, "Plan:", BODY_SIZE),
+                           (0, X_PLAN, plan, BODY_SIZE)]),
+            (GAP_TABLE_HEADER, 0, __cells([(X_DEPT, "Course"),
+                                           (X_DESCRIPTION, "Description"),
+                                           (X_ATTEMPTED, "Attempted"),
+                                           (X_EARNED, "Earned"),
+                                           ((313.5, 'l'), "Grade"),
+                                           (X_POINTS, "Points")]))]
+
+    gap = GAP_FIRST_COURSE
+    for course in courses:
+        title = __wrap(course["title"], DESCRIPTION_WIDTH)
+        items = __cells([(X_DEPT, course["dept"]), (X_SEQ, course["seq"]),
+                         (X_ATTEMPTED, course["attempt"]),
+                         (X_EARNED, course["earned"]), (X_GRADE, course["grade"]),
+                         (X_POINTS, course["points"])])
+        items += [(i * LINE_PITCH, X_DESCRIPTION, line, BODY_SIZE)
+                  for i, line in enumerate(title)]
+        depth = (len(title) - 1) * LINE_PITCH
+        rows.append((gap, depth, items))
+        gap = LINE_PITCH
+
+    attempted = sum(float(course["attempt"]) for course in courses)
+    points = sum(float(course["points"]) for course in courses)
+    gpa = points / attempted
+    for heading, gap, label in (("Term", GAP_TERM_HEADER, "Term GPA"),
+                                ("Cum", GAP_CUM_HEADER, "Cum GPA")):
+        rows.append((gap, 0, __cells([((238.25, 'l'), "Attempted"),
+                                      ((282.5, 'l'), "Earned GPA Units"),
+                                      (X_POINTS, "Points")])))
+        rows.append((GAP_TOTALS, 0, __cells([(X_LABEL, label),
+                                             (X_TOTALS, "%.3f %s Totals" % (gpa, heading)),
+                                             (X_ATTEMPTED, "%.3f" % attempted),
+                                             (X_EARNED, "%.3f" % attempted),
+                                             (X_UNITS, "%.3f" % attempted),
+                                             (X_POINTS, "%.3f" % points)])))
+    rows.append((GAP_PROGRESS, 0, [(0, (72.0, 'l'), "Progress TERM PCT : 100% CUM PCT : 100%",
+                                    BODY_SIZE)]))
+    rows.append((GAP_STANDING, 0, [(0, X_LABEL, "Academic Standing: Good Standing",
+                                    BODY_SIZE)]))
+    return rows
+
+# ANCHOR: __cells()
+def __cells(cells):
+    """
+    Returns list of row items for cells on the row's baseline, skipping
+    empty cells
+
+    Args:
+        cells: list of ((x, align), text)
+    """
+    return [(0, x, text, BODY_SIZE) for x, text in cells if text]
+
+# ANCHOR: __Flow
+class __Flow:
+    """
+    Places rows top to bottom down the columns of consecutive pages.
+    """
+    def __init__(self):
+        self.column = 0
+        self.college = None
+        self.baseline = None
+        self.items = []
+
+    def copy(self):
+        flow = object.__new__(type(self))
+        flow.__dict__.update(self.__dict__, items=list(self.items))
+        return flow
+
+    def place(self, rows):
+        for gap, depth, items in rows:
+            baseline = TOP_BASELINE if self.baseline is None else self.baseline - gap
+            if baseline - depth < BOTTOM_BASELINE:
+                self.column += 1
+                baseline = TOP_BASELINE
+            self.baseline = baseline - depth
+            offset = COLUMN_OFFSET * (self.column % 2)
+            self.items.extend((self.column // 2, x + offset, align, baseline - dy, text, size)
+                              for dy, (x, align), text, size in items)
+
+    def pages(self, npages=None):
+        """
+        Returns list of pages, each a list of (x, align, baseline, text, size)
+        """
+        pages = [[] for _ in range(npages or self.column // 2 + 1)]
+        for pageid, x, align, baseline, text, size in self.items:
+            pages[pageid].append((x, align, baseline, text, size))
+        return pages
+
+# ANCHOR: __add_page_header()
+def __add_page_header(page, last, first):
+    """
+    Args:
+        page: list of page items, extended in place
+        last: student's last name
+        first: student's first name
+    """
+    page.extend([(72.0, 'l', 577, "Name: %s,%s" % (last, first), HEADER_SIZE),
+                 (396.0, 'c', 577, PAGEHEADING, HEADER_SIZE),
+                 (511.2, 'l', 577, "This is an unofficial transcript.", HEADER_SIZE),
+                 (72.0, 'l', 526, "Print Date: 03/27/2019", HEADER_SIZE)])
+# !SECTION
+
+#%% SECTION: PDF writer
+# ANCHOR: __write_pdf()
+def __write_pdf(pdf_filepath, pages):
+    """
+    Writes a minimal PDF: per page, a content stream that draws a single form
+    XObject holding all of the page's text, set in the standard FONT.
+
+    Args:
+        pdf_filepath: path of the PDF to write
+        pages: list of pages from __Flow.pages()
+    """
+    npages = len(pages)
+    # objects 1-3 are the catalog, page tree and font; then per page: the
+    # page, its content stream and its form XObject
+    page_ref = lambda i: 4 + 3 * i
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               ("<< /Type /Pages /Kids [%s] /Count %d >>" % \
+                (" ".join("%d 0 R" % page_ref(i) for i in range(npages)), npages)).encode(),
+               ("<< /Type /Font /Subtype /Type1 /BaseFont /%s "
+                "/Encoding /WinAnsiEncoding >>" % FONT).encode()]
+
+    for i, page in enumerate(pages):
+        objects.append(("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                        "/Resources << /XObject << /Fm0 %d 0 R >> >> "
+                        "/Contents %d 0 R >>" % \
+                        (PAGEWIDTH, PAGEHEIGHT, page_ref(i) + 2, page_ref(i) + 1)).encode())
+        objects.append(__stream(b"", b"q /Fm0 Do Q"))
+        objects.append(__stream(("/Type /XObject /Subtype /Form /BBox [0 0 %d %d] "
+                                 "/Resources << /Font << /F1 3 0 R >> >> " % \
+                                 (PAGEWIDTH, PAGEHEIGHT)).encode(),
+                                __text_ops(page)))
+
+    out, offsets = [b"%PDF-1.4\n"], []
+    size = len(out[0])
+    for n, body in enumerate(objects, start=1):
+        offsets.append(size)
+        chunk = b"%d 0 obj\n" % n + body + b"\nendobj\n"
+        out.append(chunk)
+        size += len(chunk)
+
+    out.append(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.extend(b"%010d 00000 n \n" % offset for offset in offsets)
+    out.append(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % \
+               (len(objects) + 1, size))
+
+    with open(pdf_filepath, "wb") as pdf_file:
+        pdf_file.write(b"".join(out))
+
+# ANCHOR: __stream()
+def __stream(entries, data):
+    """
+    Returns bytes of a stream object
+
+    Args:
+        entries: extra dictionary entries
+        data: stream contents
+    """
+    return b"<< " + entries + b"/Length %d >>\nstream\n" % len(data) + data + \
+           b"\nendstream"
+
+# ANCHOR: __text_ops()
+def __text_ops(page):
+    """
+    Returns bytes of content stream operators drawing every item of the page
+
+    Args:
+        page: list of (x, align, baseline, text, size)
+    """
+    ops = []
+    for x, align, baseline, text, size in page:
+        width = __text_width(text, size)
+        x = {'l': x, 'r': x - width, 'c': x - width / 2}[align]
+        escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        ops.append("BT /F1 %g Tf %.3f %.3f Td (%s) Tj ET" % (size, x, baseline, escaped))
+    return "\n".join(ops).encode("latin-1")
+# !SECTION
+
+#%%
+if __name__ == "__main__":
+    import argparse
+
+    argparser = argparse.ArgumentParser(\
+        description = "Write a synthetic Los Rios CCD Unofficial Transcript")
+
+    argparser.add_argument(
+        "outfile", metavar = "PDF_OUT",
+        help = "path of the transcript PDF to write"
+    )
+
+    argparser.add_argument(
+        "--pages", type = int, default = None,
+        help = "number of pages to fill (default: 1 unless --semesters is given)"
+    )
+
+    argparser.add_argument(
+        "--semesters", type = int, default = None,
+        help = "number of semesters to write instead of filling --pages"
+    )
+
+    argparser.add_argument(
+        "--colleges", type = int, default = 1,
+        help = "number of college sections"
+    )
+
+    argparser.add_argument(
+        "--seed", type = int, default = 0,
+        help = "random seed"
+    )
+
+    argparser.add_argument(
+        "--expected", default = None, metavar = "CSV_OUT",
+        help = "also write the records the miner should produce to this CSV"
+    )
+
+    args = argparser.parse_args()
+
+    npages = args.pages if args.pages or args.semesters else 1
+    records = generate_transcript(args.outfile, npages = npages,
+                                  nsemesters = args.semesters,
+                                  ncolleges = args.colleges, seed = args.seed)
+    if args.expected:
+        records.to_csv(args.expected, index = False)
+
+#%%
@@ -0,0 +1,388 @@
+# Environment:
+# python = 3.74
+# dependencies: pandas, numpy
+
+#%% ANCHOR: Imports
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+#%% SECTION: Record columns
+# Mined records of any number of students, held as typed numpy columns:
+# students, colleges, departments, courses and grades as integer codes into
+# their category arrays, semesters as an ordinal, units and points as floats.
+# Every total below is one grouped pass over these arrays (a lexsort and
+# np.add.reduceat), however many students the records hold.
+
+# ANCHOR: Global Constants
+# grade points per unit of the grades that count toward GPA
+GRADE_POINTS = {"A": 4.0, "B": 3.0, "C": 2.0, "D": 1.0, "F": 0.0, "FW": 0.0}
+
+# withdrawals: on the record, but not attempted units
+WITHDRAWN_GRADES = ("W", "MW", "EW")
+
+# grades that a later attempt of the same course replaces in the totals
+SUBSTANDARD_GRADES = ("D", "F", "FW", "NC", "NP")
+
+# order of the terms within a year
+TERM_ORDER = {"Winter": 0, "Spring": 1, "Summer": 2, "Fall": 3}
+SEMESTER = re.compile(r'^\s*(Winter|Spring|Summer|Fall)\s+(\d{4})\s*$')
+
+# summed per group, in this order, by the totals below
+MEASURES = ("attempted", "earned", "gpa_units", "points")
+
+# ANCHOR: RecordColumns
+class RecordColumns:
+    """
+    Columns of mined records, one array element per course row. The *_codes
+    arrays index into the category arrays of the same name: grade_codes into
+    grades, and so on.
+
+        student_codes, students: who took the course; the record's source
+            file when the records have one, else the student's name
+        college_codes, colleges: college, e.g. "SCC"
+        dept_codes, depts: subject prefix, e.g. "BIOL"
+        course_codes, courses: "DEPT SEQ", e.g. "BIOL 102"
+        grade_codes, grades: grade as mined ("" while in progress)
+        term: year * 4 + TERM_ORDER of the semester, -1 if unreadable
+        attempt, earned, points: float64 columns of the records
+    """
+    __slots__ = ("student_codes", "students", "college_codes", "colleges",
+                 "dept_codes", "depts", "course_codes", "courses",
+                 "grade_codes", "grades", "term", "attempt", "earned", "points")
+
+    def __len__(self):
+        return len(self.term)
+
+    def __repr__(self):
+        return "RecordColumns(%d rows, %d students)" % (len(self), len(self.students))
+
+# ANCHOR: load_records()
+def load_records(records):
+    """
+    Returns RecordColumns
+
+    Args:
+        records: pd.DataFrame from tm.prepare_records(), or any frame with its
+                 columns, e.g. a merged batch outfile with a 'source' column
+    """
+    columns = RecordColumns()
+    text = lambda value: "" if pd.isna(value) else str(value).strip()
+    upper = lambda value: text(value).upper()
+
+    student = "source" if "source" in records.columns else "name"
+    columns.student_codes, columns.students = __categories(records[student], text)
+    columns.college_codes, columns.colleges = __categories(records["college"], text)
+    columns.dept_codes, columns.depts = __categories(records["dept"], upper)
+    seq_codes, seqs = __categories(records["seq"], text)
+    course_codes, courses = pd.factorize(columns.dept_codes * max(len(seqs), 1) + seq_codes)
+    columns.course_codes = course_codes
+    columns.courses = np.array(["%s %s" % (columns.depts[course // max(len(seqs), 1)],
+                                           seqs[course % max(len(seqs), 1)])
+                                for course in courses], dtype=object)
+    columns.grade_codes, columns.grades = __categories(records["grade"], upper)
+
+    term_codes, terms = __categories(records["semester"], text)
+    columns.term = np.array([semester_term(term) for term in terms] + [-1],
+                            dtype=np.int64)[term_codes]
+    for name in ("attempt", "earned", "points"):
+        codes, values = pd.factorize(records[name])
+        values = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce') \
+                   .fillna(0.0).to_numpy(dtype=np.float64)
+        setattr(columns, name, np.append(values, 0.0)[codes])
+    return columns
+
+# ANCHOR: __categories()
+def __categories(values, normalize):
+    """
+    Normalizes only the distinct values of a column, rather than every row.
+
+    Returns tuple of (codes, categories): np.ndarray of int codes and the
+    np.ndarray of normalized values (dtype object) they index
+
+    Args:
+        values: pd.Series of a record column
+        normalize: function of one raw value to its normalized str
+    """
+    codes, uniques = pd.factorize(values)
+    normalized = [normalize(value) for value in uniques]
+    if (codes < 0).any():
+        # factorize codes missing values -1; they normalize like any other value
+        normalized.append(normalize(None))
+        codes = np.where(codes < 0, len(uniques), codes)
+    categories, merged = pd.factorize(pd.Series(normalized, dtype=object))
+    return categories[codes], np.asarray(merged, dtype=object)
+
+# ANCHOR: semester_term()
+def semester_term(semester):
+    """
+    Returns int, the ordinal of the semester (year * 4 + TERM_ORDER), or -1
+
+    Args:
+        semester: semester as mined, e.g. "Spring 2016"
+    """
+    found = SEMESTER.match(semester)
+    if found is None:
+        return -1
+    return int(found.group(2)) * 4 + TERM_ORDER[found.group(1)]
+
+# ANCHOR: term_name()
+def term_name(term):
+    """
+    Returns str, the semester of a term ordinal, e.g. "Spring 2016"
+
+    Args:
+        term: ordinal from semester_term()
+    """
+    if term < 0:
+        return ""
+    names = {order: name for name, order in TERM_ORDER.items()}
+    return "%s %d" % (names[term % 4], term // 4)
+# !SECTION
+
+#%% SECTION: Totals
+
+# ANCHOR: counted_measures()
+def counted_measures(columns, repeats=True):
+    """
+    Returns dict of {measure: np.ndarray} for every row, over MEASURES:
+        attempted: units attempted; 0 for withdrawals
+        earned: units earned
+        gpa_units: units attempted with a grade in GRADE_POINTS
+        points: grade points
+    A row replaced by a later attempt of its course (see repeated_rows)
+    counts toward none of them but attempted.
+
+    Args:
+        columns: RecordColumns from load_records()
+        repeats: leave out the rows that later attempts replace
+    """
+    graded = np.isin(columns.grades, list(GRADE_POINTS))[columns.grade_codes]
+    withdrawn = np.isin(columns.grades, WITHDRAWN_GRADES)[columns.grade_codes]
+    counted = ~repeated_rows(columns) if repeats else np.ones(len(columns), dtype=bool)
+
+    return {"attempted": np.where(withdrawn, 0.0, columns.attempt),
+            "earned": np.where(counted, columns.earned, 0.0),
+            "gpa_units": np.where(graded & counted, columns.attempt, 0.0),
+            "points": np.where(counted, columns.points, 0.0)}
+
+# ANCHOR: repeated_rows()
+def repeated_rows(columns):
+    """
+    Course repetition: when a student completes a course again at the same
+    college after a substandard grade (SUBSTANDARD_GRADES), the earlier
+    attempt stays on the record but leaves the student's units and GPA. A
+    later withdrawal, or an attempt still in progress, replaces nothing.
+
+    Returns np.ndarray of bool, True for the rows a later attempt replaces
+
+    Args:
+        columns: RecordColumns from load_records()
+    """
+    order = np.lexsort((columns.term, columns.course_codes, columns.college_codes,
+                        columns.student_codes))
+    if len(order) == 0:
+        return np.zeros(0, dtype=bool)
+    key = np.stack([columns.student_codes, columns.college_codes,
+                    columns.course_codes], axis=1)[order]
+    new_course = np.ones(len(order), dtype=bool)
+    new_course[1:] = (key[1:] != key[:-1]).any(axis=1)
+    course = np.cumsum(new_course) - 1
+
+    # a row has a later attempt when a completed attempt of the same course
+    # comes after it in this order: find the last completed one per course
+    completed = ~np.isin(columns.grades, WITHDRAWN_GRADES + ("",))[columns.grade_codes]
+    position = np.where(completed[order], np.arange(len(order)), -1)
+    last_completed = np.full(course[-1] + 1, -1)
+    np.maximum.at(last_completed, course, position)
+    later = last_completed[course] > np.arange(len(order))
+
+    substandard = np.isin(columns.grades, SUBSTANDARD_GRADES)[columns.grade_codes]
+    replaced = np.zeros(len(order), dtype=bool)
+    replaced[order] = later & substandard[order]
+    return replaced
+
+# ANCHOR: __group_totals()
+def __group_totals(keys, measures):
+    """
+    Sums every measure per distinct combination of keys, in one pass.
+
+    Returns tuple of (order, starts, sums): order sorts the rows by the keys
+    (the last key first), starts is where each group begins in that order,
+    and sums maps each measure to its np.ndarray of per-group totals
+
+    Args:
+        keys: list of integer np.ndarrays, the most significant last
+        measures: dict of {measure: np.ndarray} from counted_measures()
+    """
+    order = np.lexsort(keys)
+    if len(order) == 0:
+        return order, order, {name: np.zeros(0) for name in measures}
+    sorted_keys = np.stack([key[order] for key in keys], axis=1)
+    starts = np.flatnonzero(np.r_[True, (sorted_keys[1:] != sorted_keys[:-1]).any(axis=1)])
+    sums = {name: np.add.reduceat(values[order], starts) for name, values in measures.items()}
+    return order, starts, sums
+
+# ANCHOR: __gpa()
+def __gpa(points, gpa_units):
+    """
+    Returns np.ndarray of GPAs, 0 where there are no GPA units
+
+    Args:
+        points: np.ndarray of grade points
+        gpa_units: np.ndarray of GPA units
+    """
+    return np.divide(points, gpa_units, out=np.zeros_like(points), where=gpa_units > 0)
+
+# ANCHOR: term_totals()
+def term_totals(columns, repeats=True):
+    """
+    Totals per student, college and semester, as the transcript prints them
+    under each semester: the term's totals and GPA, then the cumulative
+    totals and GPA at that college up to and including the term.
+
+    Returns pd.DataFrame with the columns student, college, semester, term,
+    the MEASURES, gpa, then cum_<measure> for each of the MEASURES and
+    cum_gpa, ordered by student, college and term
+
+    Args:
+        columns: RecordColumns from load_records()
+        repeats: leave out the rows that later attempts replace
+    """
+    order, starts, sums = __group_totals(
+        [columns.term, columns.college_codes, columns.student_codes],
+        counted_measures(columns, repeats))
+    first = order[starts]
+
+    term_codes, terms = pd.factorize(columns.term[first])
+    totals = pd.DataFrame({"student": columns.students[columns.student_codes[first]],
+                           "college": columns.colleges[columns.college_codes[first]],
+                           "semester": np.array([term_name(term) for term in terms],
+                                                dtype=object)[term_codes],
+                           "term": columns.term[first]})
+    for name in MEASURES:
+        totals[name] = sums[name]
+    totals["gpa"] = __gpa(sums["points"], sums["gpa_units"])
+
+    # running sums restart at every student and college
+    section = columns.student_codes[first] * max(len(columns.colleges), 1) + \
+              columns.college_codes[first]
+    restart = np.flatnonzero(np.r_[True, section[1:] != section[:-1]])
+    lengths = np.diff(np.r_[restart, len(section)])
+    for name in MEASURES:
+        running = np.cumsum(sums[name])
+        offset = np.r_[0.0, running][restart]
+        totals["cum_" + name] = running - np.repeat(offset, lengths)
+    totals["cum_gpa"] = __gpa(totals["cum_points"].to_numpy(), totals["cum_gpa_units"].to_numpy())
+    return totals
+
+# ANCHOR: career_totals()
+def career_totals(columns, by_college=True, repeats=True):
+    """
+    Returns pd.DataFrame with the columns student (and college, with
+    by_college), the MEASURES and gpa; one row per student (and college)
+
+    Args:
+        columns: RecordColumns from load_records()
+        by_college: total each college separately, as the transcript's
+                    "Career Totals" do, instead of across colleges
+        repeats: leave out the rows that later attempts replace
+    """
+    keys = [columns.student_codes]
+    if by_college:
+        keys.insert(0, columns.college_codes)
+    order, starts, sums = __group_totals(keys, counted_measures(columns, repeats))
+    first = order[starts]
+
+    totals = pd.DataFrame({"student": columns.students[columns.student_codes[first]]})
+    if by_college:
+        totals["college"] = columns.colleges[columns.college_codes[first]]
+    for name in MEASURES:
+        totals[name] = sums[name]
+    totals["gpa"] = __gpa(sums["points"], sums["gpa_units"])
+    return totals
+
+# ANCHOR: subject_units()
+def subject_units(columns, repeats=True):
+    """
+    Returns pd.DataFrame with the columns student, dept, the MEASURES and
+    gpa; one row per student and subject prefix, across colleges
+
+    Args:
+        columns: RecordColumns from load_records()
+        repeats: leave out the rows that later attempts replace
+    """
+    order, starts, sums = __group_totals([columns.dept_codes, columns.student_codes],
+                                         counted_measures(columns, repeats))
+    first = order[starts]
+
+    totals = pd.DataFrame({"student": columns.students[columns.student_codes[first]],
+                           "dept": columns.depts[columns.dept_codes[first]]})
+    for name in MEASURES:
+        totals[name] = sums[name]
+    totals["gpa"] = __gpa(sums["points"], sums["gpa_units"])
+    return totals
+# !SECTION
+
+#%%
+if __name__ == "__main__":
+    import sys
+    import time
+    import argparse
+
+    argparser = argparse.ArgumentParser(\
+        description = "Compute GPAs and units from mined records")
+
+    argparser.add_argument(
+        "records", metavar = "RECORDS",
+        help = "records written by main.py: .csv, .jsonl, .parquet, or a .db results store"
+    )
+
+    argparser.add_argument(
+        "--totals", default = "terms", choices = ("terms", "careers", "colleges", "subjects"),
+        help = "per semester (default), per student, per student and college, or "
+               "per student and subject prefix"
+    )
+
+    argparser.add_argument(
+        "--no-repeats", dest = "repeats", action = "store_false",
+        help = "count every attempt of a repeated course"
+    )
+
+    argparser.add_argument(
+        "--out", default = None, metavar = "CSV_OUT",
+        help = "write the totals to this CSV file instead of printing them"
+    )
+
+    args = argparser.parse_args()
+
+    extension = os.path.splitext(args.records)[1].lower()
+    if extension in (".db", ".sqlite", ".sqlite3"):
+        import transcript_store
+        with transcript_store.ResultsStore(args.records) as store:
+            records = store.find()
+    elif extension in (".jsonl", ".ndjson"):
+        records = pd.read_json(args.records, lines=True, dtype=False)
+    elif extension == ".parquet":
+        records = pd.read_parquet(args.records)
+    else:
+        records = pd.read_csv(args.records, dtype=str, keep_default_na=False)
+
+    start = time.perf_counter()
+    columns = load_records(records)
+    if args.totals == "terms":
+        totals = term_totals(columns, args.repeats)
+    elif args.totals == "subjects":
+        totals = subject_units(columns, args.repeats)
+    else:
+        totals = career_totals(columns, args.totals == "colleges", args.repeats)
+    elapsed = time.perf_counter() - start
+
+    if args.out:
+        totals.to_csv(args.out, index=False, float_format="%.3f")
+    else:
+        print(totals.to_string(index=False, float_format="%.3f"))
+    print("%d rows of %d students in %.1f ms" % (len(columns), len(columns.students),
+                                                 1000 * elapsed), file=sys.stderr)
@@ -0,0 +1,358 @@
+# Environment:
+# python = 3.74
+# dependencies: pandas, numpy, openpyxl (converting the catalog spreadsheet only)
+
+#%% ANCHOR: Imports
+import os
+import re
+import hashlib
+import functools
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+#%% SECTION: Catalog index
+# The SCC course catalog, converted once from its spreadsheet into a compact
+# numpy archive so that enriching mined records never re-reads the xlsx:
+#
+#   codes, titles, units: one UTF-8 blob plus end offsets per column
+#   key_hashes, key_rows: 64-bit hashes of the normalized "DEPT SEQ" course
+#       codes, sorted, with the row each belongs to (the dept+seq index)
+#   title_order: rows sorted by lowercased title (the prefix index)
+#   trigrams, trigram_ends, trigram_rows: sorted 32-bit hashes of every
+#       title trigram, with the rows holding each (the trigram index)
+
+# ANCHOR: Global Constants
+CATALOG_XLSX = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "data", "courses_scc_catalog-1.xlsx")
+CATALOG_FORMAT = 1
+
+# distinct course codes whose lookups are kept in memory
+LOOKUP_CACHE_SIZE = 4096
+
+# columns added to mined records by Catalog.enrich()
+ENRICHED_COLUMNS = ("catalog_title", "units")
+
+UNITS_SUFFIX = re.compile(r'\s*Units?\s*$', re.IGNORECASE)
+
+# ANCHOR: course_key()
+def course_key(code):
+    """
+    Returns str, the normalized course code, e.g. "BIOL 102"
+
+    Args:
+        code: department code and course number, e.g. "biol  102 "
+    """
+    return " ".join(code.upper().split())
+
+# ANCHOR: key_hashes()
+def key_hashes(keys):
+    """
+    Returns np.ndarray of uint64 hashes, stable across processes
+
+    Args:
+        keys: iterable of normalized course codes
+    """
+    return np.array([int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(),
+                                    'little') for key in keys], dtype=np.uint64)
+
+# ANCHOR: title_trigrams()
+def title_trigrams(text):
+    """
+    Returns set of uint32 hashes of the lowercased text's trigrams
+
+    Args:
+        text: title or query text
+    """
+    text = " %s " % " ".join(text.lower().split())
+    return {int.from_bytes(hashlib.blake2b(text[n:n + 3].encode('utf-8'),
+                                           digest_size=4).digest(), 'little')
+            for n in range(len(text) - 2)}
+
+# ANCHOR: __pack_texts()
+def __pack_texts(texts):
+    """
+    Returns tuple of (uint8 blob, int64 end offsets)
+
+    Args:
+        texts: list of str
+    """
+    texts = [text.encode('utf-8') for text in texts]
+    return (np.frombuffer(b''.join(texts), dtype=np.uint8),
+            np.cumsum([len(text) for text in texts], dtype=np.int64))
+
+# ANCHOR: __unpack_texts()
+def __unpack_texts(blob, ends):
+    """
+    Returns list of str
+
+    Args:
+        blob: uint8 blob from __pack_texts()
+        ends: end offsets from __pack_texts()
+    """
+    blob, ends = blob.tobytes(), ends.tolist()
+    starts = [0] + ends[:-1]
+    return [blob[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+
+# ANCHOR: read_catalog_xlsx()
+def read_catalog_xlsx(xlsx_filepath=CATALOG_XLSX):
+    """
+    Returns pd.DataFrame with columns code, title and units, one row per
+    course of the spreadsheet's first sheet
+
+    Args:
+        xlsx_filepath: path of the catalog spreadsheet
+    """
+    sheet = pd.read_excel(xlsx_filepath, sheet_name=0, dtype=str)
+    return pd.DataFrame({"code": sheet["course_code"],
+                         "title": sheet["course_title"],
+                         "units": sheet["units"]})
+
+# ANCHOR: build_catalog()
+def build_catalog(catalog, filename_out):
+    """
+    Writes the catalog index. Rows without a course code are dropped; when
+    a code appears more than once, its first row wins.
+
+    Args:
+        catalog: pd.DataFrame with columns code, title and units, e.g. from
+                 read_catalog_xlsx()
+        filename_out: path of the index (.npz)
+    """
+    catalog = catalog.fillna("").astype(str)
+    catalog = catalog.assign(code=[course_key(code) for code in catalog["code"]],
+                             title=[" ".join(title.split()) for title in catalog["title"]],
+                             units=[UNITS_SUFFIX.sub("", units.strip()) for units in catalog["units"]])
+    catalog = catalog[catalog["code"] != ""].drop_duplicates("code").reset_index(drop=True)
+    codes, titles = catalog["code"].tolist(), catalog["title"].tolist()
+
+    columns = {"format": np.array([CATALOG_FORMAT])}
+    for name in ("code", "title", "units"):
+        columns[name + "_blob"], columns[name + "_ends"] = __pack_texts(catalog[name].tolist())
+
+    hashes = key_hashes(codes)
+    order = np.argsort(hashes, kind='stable')
+    columns["key_hashes"], columns["key_rows"] = hashes[order], order.astype(np.int32)
+
+    columns["title_order"] = np.array(sorted(range(len(titles)),
+                                             key=lambda row: titles[row].lower()), dtype=np.int32)
+
+    postings = dict()
+    for row, title in enumerate(titles):
+        for trigram in title_trigrams(title):
+            postings.setdefault(trigram, []).append(row)
+    trigrams = sorted(postings)
+    columns["trigrams"] = np.array(trigrams, dtype=np.uint32)
+    columns["trigram_ends"] = np.cumsum([len(postings[t]) for t in trigrams], dtype=np.int64)
+    columns["trigram_rows"] = np.array([row for t in trigrams for row in postings[t]],
+                                       dtype=np.int32)
+
+    tmp = "%s.%d.tmp" % (filename_out, os.getpid())
+    with open(tmp, 'wb') as index_file:
+        np.savez_compressed(index_file, **columns)
+    os.replace(tmp, filename_out)
+
+# ANCHOR: Catalog
+class Catalog:
+    """
+    A catalog index, see load_catalog(). Course code lookups go through an
+    LRU cache, so enriching a batch costs one index probe per distinct
+    course, however many rows share it.
+    """
+    def __init__(self, codes, titles, units, columns):
+        self.codes, self.titles, self.units = codes, titles, units
+        self.key_hashes, self.key_rows = columns["key_hashes"], columns["key_rows"]
+        self.title_order = columns["title_order"]
+        self.trigrams = columns["trigrams"]
+        self.trigram_ends = columns["trigram_ends"]
+        self.trigram_rows = columns["trigram_rows"]
+        self.sorted_titles = [self.titles[row].lower() for row in self.title_order]
+        # row -1 picks the trailing "" of courses not in the catalog
+        self.enriched = {"catalog_title": np.array(titles + [""], dtype=object),
+                         "units": np.array(units + [""], dtype=object)}
+        self.lookup = functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self.find_row)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def find_row(self, key):
+        """
+        Returns int row of the course code, or -1. Use the cached lookup()
+        instead.
+
+        Args:
+            key: course code from course_key()
+        """
+        key_hash = key_hashes([key])[0]
+        n = np.searchsorted(self.key_hashes, key_hash)
+        while n < len(self.key_hashes) and self.key_hashes[n] == key_hash:
+            row = int(self.key_rows[n])
+            if self.codes[row] == key:
+                return row
+            n += 1
+        return -1
+
+    def enrich(self, records):
+        """
+        Returns copy of records with the ENRICHED_COLUMNS added: the full
+        catalog title and the units of every course found in the catalog,
+        or empty strings
+
+        Args:
+            records: pd.DataFrame with dept and seq columns, e.g. from
+                     tm.prepare_records()
+        """
+        depts, dept_uniques = pd.factorize(records["dept"])
+        seqs, seq_uniques = pd.factorize(records["seq"])
+        # one code per distinct (dept, seq) pair, -1 where either is missing
+        pairs = np.where((depts < 0) | (seqs < 0), -1,
+                         depts.astype(np.int64) * len(seq_uniques) + seqs)
+        codes, pair_uniques = pd.factorize(pairs)
+        found = [-1 if pair < 0 else
+                 self.lookup(course_key("%s %s" % (dept_uniques[pair // len(seq_uniques)],
+                                                   seq_uniques[pair % len(seq_uniques)])))
+                 for pair in pair_uniques]
+        rows = np.array(found, dtype=np.int64)[codes]
+        return records.assign(**{name: column[rows] for name, column in self.enriched.items()})
+
+    def prefix(self, text, limit=20):
+        """
+        Returns pd.DataFrame of the courses whose title starts with text,
+        case-insensitively, in title order
+
+        Args:
+            text: title prefix
+            limit: most rows to return
+        """
+        text = " ".join(text.lower().split())
+        n = bisect_left(self.sorted_titles, text)
+        rows = []
+        while n < len(self.sorted_titles) and len(rows) < limit and \
+              self.sorted_titles[n].startswith(text):
+            rows.append(int(self.title_order[n]))
+            n += 1
+        return self.__frame(rows)
+
+    def search(self, text, limit=20):
+        """
+        Returns pd.DataFrame of the courses whose title shares the most
+        trigrams with text, best first, with a score column (the share of
+        the text's trigrams found in the title). Finds titles from truncated
+        or abbreviated ones, e.g. "Essentials Human Anat/Physio".
+
+        Args:
+            text: title, or part of one
+            limit: most rows to return
+        """
+        trigrams = np.array(sorted(title_trigrams(text)), dtype=np.uint32)
+        found = np.searchsorted(self.trigrams, trigrams)
+        found = found[(found < len(self.trigrams)) &
+                      (self.trigrams[np.minimum(found, len(self.trigrams) - 1)] == trigrams)]
+        starts = np.where(found > 0, self.trigram_ends[found - 1], 0)
+        postings = [self.trigram_rows[start:end]
+                    for start, end in zip(starts, self.trigram_ends[found])]
+        if len(postings) == 0:
+            return self.__frame([]).assign(score=[])
+
+        hits = np.bincount(np.concatenate(postings), minlength=len(self.codes))
+        rows = np.argsort(-hits, kind='stable')[:limit]
+        rows = rows[hits[rows] > 0]
+        return self.__frame(rows.tolist()).assign(score=hits[rows] / len(trigrams))
+
+    def __frame(self, rows):
+        """
+        Returns pd.DataFrame with columns code, title and units
+
+        Args:
+            rows: list of catalog rows
+        """
+        return pd.DataFrame({"code": [self.codes[row] for row in rows],
+                             "title": [self.titles[row] for row in rows],
+                             "units": [self.units[row] for row in rows]})
+
+# ANCHOR: load_catalog()
+def load_catalog(index_filepath):
+    """
+    Returns Catalog
+
+    Args:
+        index_filepath: catalog index written by build_catalog()
+    """
+    with np.load(index_filepath, allow_pickle=False) as archive:
+        if int(archive["format"][0]) != CATALOG_FORMAT:
+            raise ValueError("Catalog index %s is out of date; rebuild it." % index_filepath)
+        texts = [__unpack_texts(archive[name + "_blob"], archive[name + "_ends"])
+                 for name in ("code", "title", "units")]
+        columns = {name: archive[name] for name in ("key_hashes", "key_rows", "title_order",
+                                                    "trigrams", "trigram_ends", "trigram_rows")}
+    return Catalog(*texts, columns)
+
+# ANCHOR: open_catalog()
+@functools.lru_cache(maxsize=None)
+def open_catalog(catalog_filepath=CATALOG_XLSX, cache_dir=None):
+    """
+    Returns Catalog, loaded once per process. A spreadsheet is converted to
+    an index in the parse cache directory the first time it is opened, and
+    again whenever its content changes.
+
+    Args:
+        catalog_filepath: catalog index (.npz), or catalog spreadsheet
+        cache_dir: where converted spreadsheets are kept (default:
+                   tm.CACHE_DIR)
+    """
+    if catalog_filepath.lower().endswith(".npz"):
+        return load_catalog(catalog_filepath)
+
+    import transcript_miner as tm
+
+    cache_dir = tm.CACHE_DIR if cache_dir is None else cache_dir
+    content = hashlib.sha256()
+    with open(catalog_filepath, 'rb') as xlsx_file:
+        content.update(xlsx_file.read())
+    index_filepath = os.path.join(cache_dir, "catalog-%s-%d.npz" %
+                                  (content.hexdigest()[:32], CATALOG_FORMAT))
+    if not os.path.isfile(index_filepath):
+        os.makedirs(cache_dir, exist_ok=True)
+        build_catalog(read_catalog_xlsx(catalog_filepath), index_filepath)
+    return load_catalog(index_filepath)
+# !SECTION
+
+#%%
+if __name__ == "__main__":
+    import argparse
+
+    argparser = argparse.ArgumentParser(\
+        description = "Convert the course catalog spreadsheet to an index, or search it")
+
+    argparser.add_argument(
+        "catalog", nargs = "?", default = CATALOG_XLSX, metavar = "CATALOG",
+        help = "catalog spreadsheet (.xlsx) or index (.npz)"
+    )
+
+    argparser.add_argument(
+        "--out", default = None, metavar = "NPZ_OUT",
+        help = "write the index of the spreadsheet to this file"
+    )
+
+    argparser.add_argument(
+        "--search", default = None, metavar = "TITLE",
+        help = "list the courses whose titles best match TITLE"
+    )
+
+    argparser.add_argument(
+        "--prefix", default = None, metavar = "TITLE",
+        help = "list the courses whose titles start with TITLE"
+    )
+
+    args = argparser.parse_args()
+
+    if args.out:
+        build_catalog(read_catalog_xlsx(args.catalog), args.out)
+        print("%d courses -> %s" % (len(load_catalog(args.out)), args.out))
+    if args.search or args.prefix:
+        catalog = load_catalog(args.out) if args.out else open_catalog(args.catalog)
+        found = catalog.search(args.search) if args.search else catalog.prefix(args.prefix)
+        print(found.to_string(index=False))
+
+#%%
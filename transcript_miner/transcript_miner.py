@@ -1,10 +1,584 @@
 # Environment:
 # python = 3.74
-# dependencies: pandas, pdfquery, numpy, matplotlib (test suite only)
+# dependencies: pandas, pdfminer.six, numpy, pdfquery (pdfquery backend only),
+#               matplotlib (test suite only)
 
 #%% ANCHOR: Imports
+import io
+import os
+import re
+import mmap
+import json
+import time
+import hashlib
+import functools
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from bisect import bisect_right
+from itertools import count
+
+import numpy as np
 import pandas as pd
-import pdfquery as pq
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.converter import TextConverter, PDFPageAggregator
+from pdfminer.layout import LAParams
+from pdfminer.pdftypes import resolve1
+from pdfminer.psparser import LIT
+
+#%% SECTION: Instrumentation
+# Opt-in profiling of the pipeline. Stages are timed as nested spans, each
+# with its call count, the elements it scanned and matched, and optionally
+# its peak traced memory. With no profile active, an instrumented call costs
+# one global lookup.
+
+# ANCHOR: Profile state
+# the active profile dict (see profiling), or None
+PROFILE = None
+NULL_SPAN = nullcontext()
+
+# ANCHOR: profiling()
+@contextmanager
+def profiling(memory=False):
+    """
+    Profiles every instrumented call made inside the with-block.
+
+    Yields profile dict, filled in when the block exits:
+        spans: pd.DataFrame, one row per call; name, start, seconds, depth,
+            scanned, matched and peak_bytes (NaN when memory is False)
+        stages: pd.DataFrame indexed by name, in first-call order; calls,
+            seconds, scanned, matched and peak_bytes (the largest of any call)
+
+    Args:
+        memory: also trace peak memory per span with tracemalloc, which
+                slows the profiled code down severalfold
+    """
+    global PROFILE
+    if PROFILE is not None:
+        raise RuntimeError("A profile is already active.")
+
+    tracing = memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    profile = {"memory": memory, "origin": time.perf_counter(), "open": [], "closed": []}
+    PROFILE = profile
+    try:
+        yield profile
+    finally:
+        PROFILE = None
+        if tracing:
+            tracemalloc.stop()
+        spans = pd.DataFrame(profile.pop("closed"), columns=("name", "start", "seconds",
+                                                             "depth", "scanned", "matched",
+                                                             "peak_bytes"))
+        profile["spans"] = spans.sort_values(by="start", kind="stable").reset_index(drop=True)
+        profile["stages"] = profile["spans"].groupby("name", sort=False).agg(
+            calls=("seconds", "size"), seconds=("seconds", "sum"),
+            scanned=("scanned", "sum"), matched=("matched", "sum"),
+            peak_bytes=("peak_bytes", "max"))
+        del profile["open"], profile["origin"]
+
+# ANCHOR: span()
+def span(name):
+    """
+    Returns a context manager timing the with-block as a span called name,
+    or a no-op one when no profile is active.
+
+    Args:
+        name: span name
+    """
+    if PROFILE is None:
+        return NULL_SPAN
+    return __open_span(PROFILE, name)
+
+# ANCHOR: instrumented()
+def instrumented(name):
+    """
+    Returns decorator that times every call of the function as a span
+
+    Args:
+        name: span name
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if PROFILE is None:
+                return func(*args, **kwargs)
+            with __open_span(PROFILE, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# ANCHOR: count_elements()
+def count_elements(scanned=0, matched=0):
+    """
+    Adds to the elements scanned and matched by the innermost open span
+
+    Args:
+        scanned: number of elements examined
+        matched: number of elements kept
+    """
+    if PROFILE is not None and PROFILE["open"]:
+        record = PROFILE["open"][-1]
+        record["scanned"] += scanned
+        record["matched"] += matched
+
+# ANCHOR: __open_span()
+@contextmanager
+def __open_span(profile, name):
+    """
+    Args:
+        profile: the active profile dict
+        name: span name
+    """
+    stack = profile["open"]
+    record = {"name": name, "depth": len(stack), "scanned": 0, "matched": 0,
+              "peak_bytes": np.nan}
+    if profile["memory"]:
+        # the tracemalloc peak is shared, so hand what it holds so far to the
+        # enclosing span before restarting it for this one
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        record["_base"] = record["_peak"] = current
+    stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        end = time.perf_counter()
+        stack.pop()
+        record["start"] = start - profile["origin"]
+        record["seconds"] = end - start
+        if profile["memory"]:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(record.pop("_peak"), peak)
+            record["peak_bytes"] = peak - record.pop("_base")
+            if stack:
+                stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+        profile["closed"].append(record)
+
+# ANCHOR: write_chrome_trace()
+def write_chrome_trace(profile, filename_out):
+    """
+    Writes the spans of a profile in the Chrome trace event format, for
+    chrome://tracing or https://ui.perfetto.dev
+
+    Args:
+        profile: profile dict from profiling()
+        filename_out: name of json file to output
+    """
+    events = []
+    for record in profile["spans"].itertuples(index=False):
+        args = {"scanned": int(record.scanned), "matched": int(record.matched)}
+        if not np.isnan(record.peak_bytes):
+            args["peak_bytes"] = int(record.peak_bytes)
+        events.append({"name": record.name, "cat": "transcript_miner", "ph": "X",
+                       "ts": 1e6 * record.start, "dur": 1e6 * record.seconds,
+                       "pid": os.getpid(), "tid": 0, "args": args})
+    with open(filename_out, "w") as trace_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+# !SECTION
+
+#%% SECTION: PDF input
+# Everything that reads a PDF (precheck, page fingerprints, the cache key and
+# the layout backends) opens it with open_pdf(), from a path or a SharedPdf.
+# A path is memory-mapped, so pdfminer reads straight from the page cache and
+# workers reading the same file share its pages rather than each holding a
+# copy. A SharedPdf holds PDF bytes the dispatcher already has, e.g. an
+# upload, copied once into a file in RAM-backed storage (/dev/shm, where
+# there is one) that workers map the same way: only its path is pickled to
+# the worker, never the bytes.
+
+# ANCHOR: Shared PDF constants
+SHARED_PDF_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# ANCHOR: SharedPdf
+class SharedPdf:
+    """
+    A PDF copied into a file of its own by share_pdf(). Pickles to just its
+    path and size; the process that shared the PDF unlinks the file once
+    every worker is done with it.
+    """
+    __slots__ = ("path", "size")
+
+    def __init__(self, path, size):
+        self.path, self.size = path, size
+
+    def unlink(self):
+        """ Removes the file. Only for the process that created it. """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __repr__(self):
+        return "SharedPdf(%r, %d)" % (self.path, self.size)
+
+# ANCHOR: share_pdf()
+def share_pdf(source):
+    """
+    Copies a PDF into a new file in SHARED_PDF_DIR (the temp directory if
+    there is none)
+
+    Returns SharedPdf, which the caller must unlink()
+
+    Args:
+        source: the PDF's bytes, or a path to read them from
+    """
+    import shutil
+    import tempfile
+
+    descriptor, path = tempfile.mkstemp(prefix="transcript-", suffix=".pdf",
+                                        dir=SHARED_PDF_DIR)
+    try:
+        with os.fdopen(descriptor, 'wb') as shared_file:
+            if isinstance(source, (str, os.PathLike)):
+                with open(source, 'rb') as pdf_file:
+                    shutil.copyfileobj(pdf_file, shared_file, 2**20)
+            else:
+                shared_file.write(source)
+            size = shared_file.tell()
+    except BaseException:
+        os.remove(path)
+        raise
+    return SharedPdf(path, size)
+
+# ANCHOR: open_pdf()
+def open_pdf(source):
+    """
+    Returns a read-only binary file of the PDF, without reading it into
+    memory: a memory map of the file, or of a SharedPdf's file. Use as a
+    context manager, or close() it.
+
+    Args:
+        source: path to transcript pdf, or a SharedPdf
+    """
+    if isinstance(source, SharedPdf):
+        source = source.path
+
+    with open(source, 'rb') as pdf_file:
+        if os.fstat(pdf_file.fileno()).st_size == 0:
+            return io.BytesIO(b'')  # an empty file cannot be mapped
+        # the map keeps its own handle on the file
+        return mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+# ANCHOR: content_digest()
+def content_digest(source):
+    """
+    Returns str, the hex SHA-256 of the PDF's bytes
+
+    Args:
+        source: path to transcript pdf, or a SharedPdf
+    """
+    content = hashlib.sha256()
+    with open_pdf(source) as pdf_file:
+        for chunk in iter(lambda: pdf_file.read(2**20), b''):
+            content.update(chunk)
+    return content.hexdigest()
+# !SECTION
+
+#%% SECTION: Layout backends
+# A backend lays out one page at a time and hands back the page as a tree of
+# positioned layout elements, which __extract_page() flattens into the text
+# lines the miner reads. Both backends build the same tree: pdfminer's layout
+# objects, re-nested by bounding box containment the way pdfquery nests them,
+# with coordinates rounded to 3 digits and whitespace-normalized text.
+#
+#   pdfquery: pdfquery's lxml tree, as the miner always used
+#   pdfminer: the same tree built straight from pdfminer.six's layout, as
+#             plain LayoutNodes with float coordinates: no lxml elements, no
+#             attributes stringified and re-parsed for every comparison
+#
+# The backend is picked by name, or by $TRANSCRIPT_MINER_BACKEND, so that it
+# reaches worker processes too. Either backend lays out pages with the
+# analysis settings of a layout profile (see LAYOUT_PROFILES), picked the same
+# way, by name or by $TRANSCRIPT_MINER_PROFILE.
+
+# ANCHOR: Backend constants
+DEFAULT_BACKEND = "pdfminer"
+
+# layout objects pdfquery folds into their parent's text
+MERGE_TAGS = ('LTChar', 'LTAnno')
+
+# pdfquery's pattern, character for character: its "\u10000-\u10FFFF" reads
+# as "\u1000", "0-\u10FF", "FF", and text is stripped the same way here
+INVALID_XML_CHARS = re.compile(u'[^\u0020-\uD7FF\u0009\u000A\u000D\uE000-\uFFFD\u10000-\u10FFFF]+')
+WHITESPACE = re.compile(r'\s+')
+
+# ANCHOR: PdfqueryBackend
+class PdfqueryBackend:
+    """
+    Lays out pages through pdfquery's lxml tree.
+    """
+    name = "pdfquery"
+
+    def __init__(self, pdf_filepath, profile=None):
+        # pdfquery (with lxml and pyquery) is only loaded when it is used
+        import pdfquery as pq
+
+        self.file = open_pdf(pdf_filepath)
+        self.pdf = pq.PDFQuery(self.file)
+        resources = PDFResourceManager()
+        self.pdf.device = layout_device(resources, profile)
+        self.pdf.interpreter = PDFPageInterpreter(resources, self.pdf.device)
+
+    def page(self, n):
+        """
+        Returns the LTPage element of page n (0-based)
+
+        Raises StopIteration past the last page
+        """
+        # pdfminer numbers pages in the order it lays them out
+        self.pdf.device.pageno = n + 1
+        return next(self.pdf.get_tree(n).getroot().iter('LTPage'))
+
+    def release(self):
+        """ Drops the elements of the pages laid out so far. """
+        # pdfquery pins every element it has ever built
+        self.pdf._elements = []
+
+    def close(self):
+        self.file.close()
+
+# ANCHOR: LayoutNode
+class LayoutNode:
+    """
+    A layout element of PdfminerBackend's page trees, with the parts of the
+    lxml element API the miner reads: tag, get(), text, iter(),
+    getchildren(), len() and iteration over children, and layout, the
+    pdfminer object it was built from.
+    """
+    __slots__ = ("tag", "attrib", "box", "text", "layout", "parent", "children")
+
+    def __init__(self, tag, attrib, box, layout):
+        self.tag, self.attrib, self.box, self.layout = tag, attrib, box, layout
+        self.text, self.parent = None, None
+        # a dict, for ordered children with O(1) removal
+        self.children = dict()
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    def append(self, child):
+        if child.parent is not None:
+            del child.parent.children[child]
+        child.parent = self
+        self.children[child] = None
+
+    def getchildren(self):
+        return list(self.children)
+
+    def iter(self, tag=None):
+        """ Yields the node and its descendants in document order. """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if tag is None or node.tag == tag:
+                yield node
+            stack.extend(reversed(list(node.children)))
+
+    def __iter__(self):
+        return iter(list(self.children))
+
+    def __len__(self):
+        return len(self.children)
+
+    def __repr__(self):
+        return "LayoutNode(%r, %r)" % (self.tag, self.text)
+
+# ANCHOR: PdfminerBackend
+class PdfminerBackend:
+    """
+    Lays out pages with pdfminer.six directly, building LayoutNode trees.
+    """
+    name = "pdfminer"
+
+    def __init__(self, pdf_filepath, profile=None):
+        self.file = open_pdf(pdf_filepath)
+        self.document = PDFDocument(PDFParser(self.file))
+        resources = PDFResourceManager()
+        self.device = layout_device(resources, profile)
+        self.interpreter = PDFPageInterpreter(resources, self.device)
+        self.pages, self.remaining = [], PDFPage.create_pages(self.document)
+
+    def page(self, n):
+        """
+        Returns the LayoutNode of page n (0-based)
+
+        Raises StopIteration past the last page
+        """
+        while len(self.pages) <= n:
+            self.pages.append(next(self.remaining))
+        page = self.pages[n]
+
+        self.device.pageno = n + 1
+        self.interpreter.process_page(page)
+        layout = self.device.get_result()
+        root = self._node(layout, None)
+        for annot in resolve1(page.annots) or ():
+            self._append_sorted(root, self._annot_node(resolve1(annot)))
+        self._clean_text(root)
+        return root
+
+    def release(self):
+        """ Nothing is pinned between pages. """
+
+    def close(self):
+        self.file.close()
+
+    def _node(self, element, root):
+        """
+        Returns LayoutNode of a pdfminer layout element, after placing its
+        descendants under root by bounding box containment (pdfquery's
+        _xmlize, with resort on)
+        """
+        if hasattr(element, 'x0'):
+            attrib = {k: float(round(v, 3) if type(v) == float else v)
+                      for k, v in zip(LINE_ATTRIBS, (element.y0, element.y1, element.x0,
+                                                     element.x1, element.width, element.height))}
+            box = (attrib['x0'], attrib['x1'], attrib['y0'], attrib['y1'])
+        else:
+            attrib, box = dict(), None
+        node = LayoutNode(type(element).__name__, attrib, box, element)
+        root = node if root is None else root
+
+        if hasattr(element, 'get_text'):
+            node.text = INVALID_XML_CHARS.sub('', element.get_text())
+
+        if hasattr(element, '__iter__'):
+            last = None
+            for child in element:
+                child = self._node(child, root)
+                if child.tag in MERGE_TAGS:
+                    if node.text and child.text in node.text:
+                        continue
+                    elif last is not None and last.tag in MERGE_TAGS:
+                        last.text += child.text
+                        continue
+                self._append_sorted(root, child)
+                last = child
+        return node
+
+    def _annot_node(self, annot):
+        """
+        Returns LayoutNode of a page annotation, placed by its Rect
+        """
+        rect = annot.get('Rect')
+        if rect is None:
+            return LayoutNode('Annot', dict(), None, annot)
+        x0, y0, x1, y1 = [float(resolve1(v)) for v in resolve1(rect)]
+        attrib = {'y0': y0, 'y1': y1, 'x0': x0, 'x1': x1, 'width': x1 - x0, 'height': y1 - y0}
+        return LayoutNode('Annot', attrib, (x0, x1, y0, y1), annot)
+
+    def _append_sorted(self, root, node):
+        """
+        Adds node under the deepest descendant of root that contains it,
+        moving root's children that node contains under node
+        """
+        box = node.box
+        for child in list(root.children):
+            if box is None or child.box is None:
+                continue
+            inner = child.box
+            if inner[0] <= box[0] and inner[1] >= box[1] and \
+               inner[2] <= box[2] and inner[3] >= box[3]:
+                self._append_sorted(child, node)
+                return
+            if box[0] <= inner[0] and box[1] >= inner[1] and \
+               box[2] <= inner[2] and box[3] >= inner[3]:
+                self._append_sorted(node, child)
+        root.append(node)
+
+    def _clean_text(self, node):
+        """
+        Normalizes whitespace, and removes each child's text from its
+        parent's (pdfquery's _clean_text)
+        """
+        if node.text:
+            node.text = WHITESPACE.sub(' ', node.text)
+        for child in list(node.children):
+            self._clean_text(child)
+            if node.text:
+                if child.text is None:
+                    break  # where pdfquery's str.find(None) gives up
+                node.text = node.text.replace(child.text, '', 1)
+
+# ANCHOR: ClippingAggregator
+class ClippingAggregator(PDFPageAggregator):
+    """
+    A PDFPageAggregator that drops every character lying entirely below
+    min_y as it is drawn, so layout analysis never sees it.
+    """
+    def __init__(self, resources, laparams=None, min_y=None):
+        PDFPageAggregator.__init__(self, resources, laparams=laparams)
+        self.min_y = -np.inf if min_y is None else min_y
+
+    def render_char(self, *args):
+        adv = PDFPageAggregator.render_char(self, *args)
+        if self.cur_item._objs[-1].y1 < self.min_y:
+            self.cur_item._objs.pop()
+        return adv
+
+# ANCHOR: Backend registry
+LAYOUT_BACKENDS = {backend.name: backend for backend in (PdfqueryBackend, PdfminerBackend)}
+
+# ANCHOR: layout_backend()
+def layout_backend(name=None):
+    """
+    Returns the backend class called name, else the one named by
+    $TRANSCRIPT_MINER_BACKEND, else DEFAULT_BACKEND's
+
+    Args:
+        name: a key of LAYOUT_BACKENDS, or None
+    """
+    name = name or os.environ.get("TRANSCRIPT_MINER_BACKEND") or DEFAULT_BACKEND
+    if name not in LAYOUT_BACKENDS:
+        raise ValueError("Unknown layout backend: %s" % name)
+    return LAYOUT_BACKENDS[name]
+
+# ANCHOR: layout_profile()
+def layout_profile(name=None):
+    """
+    Returns str, the name of the layout profile called name, else of the one
+    named by $TRANSCRIPT_MINER_PROFILE, else DEFAULT_PROFILE
+
+    Args:
+        name: a key of LAYOUT_PROFILES, or None
+    """
+    name = name or os.environ.get("TRANSCRIPT_MINER_PROFILE") or DEFAULT_PROFILE
+    if name not in LAYOUT_PROFILES:
+        raise ValueError("Unknown layout profile: %s" % name)
+    return name
+
+# ANCHOR: profile_laparams()
+@functools.lru_cache(maxsize=None)
+def profile_laparams(name):
+    """
+    Returns LAParams of the layout profile, built once per process
+
+    Args:
+        name: a key of LAYOUT_PROFILES
+    """
+    return LAParams(**LAYOUT_PROFILES[name]["laparams"])
+
+# ANCHOR: layout_device()
+def layout_device(resources, profile=None):
+    """
+    Returns ClippingAggregator laying out pages with the layout profile
+
+    Args:
+        resources: PDFResourceManager
+        profile: a key of LAYOUT_PROFILES (default: see layout_profile)
+    """
+    profile = layout_profile(profile)
+    return ClippingAggregator(resources, laparams=profile_laparams(profile),
+                              min_y=LAYOUT_PROFILES[profile]["min_y"])
+# !SECTION
 
 #%% SECTION: Define Mining Functions
 
@@ -37,344 +611,1397 @@ COL2_X_VALS = {
     'points':      (700,791),
 }
 
-# ANCHOR: valid_pdf()
-def valid_pdf(pdf):
+# cells whose baseline sits this far above a dept cell still share its row
+ROW_TOLERANCE = 1
+
+# ANCHOR: Token kinds
+COLLEGE = 'college'
+SEMESTER = 'semester'
+PLAN = 'plan'
+POINTS = 'points'
+CELL = 'cell'
+TOKEN_KINDS = (COLLEGE, SEMESTER, PLAN, POINTS, CELL)
+
+COURSE_COLUMNS = ("dept", "seq", "x0", "y0", "x1", "y1", "pageid", "description",
+                  "attempted", "earned", "grade", "points")
+
+# course table column -> output record column
+RECORD_FIELDS = {"description": "title", "attempted": "attempt"}
+
+RECORD_COLUMNS = ("dept", "seq", "title", "attempt", "earned", "grade", "points",
+                  "semester", "plan", "college", "name")
+
+SEMESTER_HEADING = re.compile(r'^(Spring|Summer|Fall|Winter) \d{4}$')
+PAGEHEADING = 'Los Rios CCD Unofficial Transcript - All'
+
+# ANCHOR: Layout
+# layout analysis settings handed to pdfminer, with the height below which
+# characters are dropped before analysis; part of the parse cache key.
+#   generic:  pdfminer's full analysis, as pdfquery runs it by default
+#   los_rios: only what the miner reads from this fixed two-column format.
+#             Every stage orders lines by their position, never by the
+#             reading order pdfminer infers by grouping text boxes
+#             hierarchically, which is quadratic in the boxes on a page and
+#             most of the time of the generic profile; a boxes_flow outside
+#             [-1, 1] skips it. Nothing on the pages is vertical, and the
+#             footer below BOTTOM_OF_PAGE holds no course rows. The header
+#             stays in: it holds PAGEHEADING and the student's name.
+LAYOUT_PROFILES = {
+    "generic":  {"laparams": {'all_texts': True, 'detect_vertical': True},
+                 "min_y": None},
+    "los_rios": {"laparams": {'all_texts': True, 'detect_vertical': False,
+                              'boxes_flow': 2},
+                 "min_y": BOTTOM_OF_PAGE},
+}
+DEFAULT_PROFILE = "los_rios"
+
+# per-line geometry kept from the layout, in layout attribute order
+LINE_ATTRIBS = ('y0', 'y1', 'x0', 'x1', 'width', 'height')
+
+LAYOUT_PAGE_COLUMNS = ("pageid", "x0", "y0", "x1", "y1", "nfigures")
+LAYOUT_LINE_COLUMNS = ("pageid", "text") + LINE_ATTRIBS + ("indexed", "token")
+
+# ANCHOR: Rejection reasons
+REJECT_UNREADABLE = 'unreadable'        # not a PDF pdfminer can parse
+REJECT_NO_PAGES = 'no_pages'            # the page tree is empty
+REJECT_PAGE_SIZE = 'page_size'          # first page is not PAGEWIDTH x PAGEHEIGHT
+REJECT_NO_HEADING = 'no_heading'        # first page's text lacks PAGEHEADING
+REJECT_HEADING_COUNT = 'heading_count'  # PAGEHEADINGs do not match the figures
+
+# ANCHOR: InvalidPDF
+class InvalidPDF(ValueError):
     """
-    Returns bool
+    Raised when a file is not a transcript; reason is one of the REJECT_*
+    codes.
+    """
+    def __init__(self, reason, detail=None):
+        self.reason = reason
+        message = "Invalid PDF (%s)." % reason
+        super().__init__(message if detail is None else "%s %s" % (message, detail))
+
+# ANCHOR: TextLine
+class TextLine:
+    """
+    A text line of the token stream, with its coordinates parsed to floats
+    once, when the layout is extracted.
+    """
+    __slots__ = ("pageid", "text", "x0", "y0", "x1", "y1")
+
+    def __init__(self, pageid, text, x0, y0, x1, y1):
+        self.pageid, self.text = pageid, text
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+
+    @property
+    def pageside(self):
+        """ whether the line is in the right page column """
+        return self.x0 > HALFPAGEWIDTH
+
+    def __repr__(self):
+        return "TextLine(%r, %r, %g, %g, %g, %g)" % \
+               (self.pageid, self.text, self.x0, self.y0, self.x1, self.y1)
+
+# ANCHOR: CollegeSection
+class CollegeSection:
+    """
+    A college's section of the transcript, from its heading up to the next
+    college's heading.
+    """
+    __slots__ = ("name", "heading", "last_pageid", "semesters")
+
+    def __init__(self, name, heading, last_pageid):
+        self.name, self.heading, self.last_pageid = name, heading, last_pageid
+        self.semesters = []
+
+    def __repr__(self):
+        return "CollegeSection(%r, %d semesters)" % (self.name, len(self.semesters))
+
+# ANCHOR: Semester
+class Semester:
+    """
+    A semester: its heading, its plan, the "Points" label that ends its course
+    rows, and its courses, a pd.DataFrame in the columns of COURSE_COLUMNS.
+    Course rows stay columnar rather than becoming one record each.
+    """
+    __slots__ = ("name", "heading", "plan", "end", "courses")
+
+    def __init__(self, heading):
+        self.name, self.heading = heading.text, heading
+        self.plan, self.end, self.courses = "", None, None
+
+    def __repr__(self):
+        return "Semester(%r, %r)" % (self.name, self.plan)
+
+# ANCHOR: load_layout()
+@instrumented("load_layout")
+def load_layout(pdf_filepath, cache=True, cache_dir=None, max_bytes=None, backend=None,
+                profile=None, executor=None):
+    """
+    Runs pdfminer layout analysis on the PDF, or reads its text lines back
+    from the parse cache when the same file was laid out before with the same
+    pdfminer version and layout profile. On a miss, pages whose content was laid
+    out before, e.g. in an earlier pull of the same transcript, are read back
+    one by one (see load_layout_pages), so only new or changed pages are laid
+    out. Given an executor, the pages are laid out in chunks across its
+    worker processes (see layout_pages) and stitched back together.
+
+    Returns layout dict of {"pages": pd.DataFrame, "lines": pd.DataFrame},
+    the text lines the miner reads, the same whether they come from pdfminer
+    or from the parse cache.
+        pages: one row per page; pageid, x0, y0, x1, y1 and nfigures.
+        lines: one row per text line; pageid, text, LINE_ATTRIBS, and
+            indexed: the line is one of the page's text lines, rather than
+                     text found only inside a figure
+            token: position in the token stream (see tokenize_layout), or -1
+
+    Raises InvalidPDF if the file is rejected by precheck_pdf() or its first
+    page is not a transcript page.
+
+    Args:
+        pdf_filepath: path to transcript pdf, or a SharedPdf
+        cache: whether to use the parse cache
+        cache_dir: parse cache directory (default: CACHE_DIR)
+        max_bytes: parse cache size bound (default: CACHE_MAX_BYTES)
+        backend: a key of LAYOUT_BACKENDS (default: see layout_backend)
+        profile: a key of LAYOUT_PROFILES (default: see layout_profile)
+        executor: concurrent.futures.Executor to lay out pages on, or None
+                  to lay them out in this process
+    """
+    if not cache:
+        if executor is not None:
+            return load_layout_pages(pdf_filepath, None, backend, profile, executor)
+        return __parse_layout(pdf_filepath, backend, profile)
+
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entry = os.path.join(cache_dir, cache_key(pdf_filepath, profile) + ".npz")
+
+    layout = __read_cache_entry(entry)
+    if layout is None:
+        layout = load_layout_pages(pdf_filepath, cache_dir, backend, profile, executor)
+        __write_cache_entry(entry, layout)
+        prune_cache(cache_dir, max_bytes)
+    return layout
+
+# ANCHOR: __parse_layout()
+@instrumented("parse_layout")
+def __parse_layout(pdf_filepath, backend=None, profile=None):
+    """
+    Returns layout dict (see load_layout)
+
+    Raises InvalidPDF when precheck_pdf() rejects the file, or as soon as the
+    first page's layout fails rejection_reason(), without laying out the
+    rest of the document.
+
+    Args:
+        pdf_filepath: path to transcript pdf, or a SharedPdf
+        backend: a key of LAYOUT_BACKENDS (default: see layout_backend)
+        profile: a key of LAYOUT_PROFILES (default: see layout_profile)
+    """
+    precheck_pdf(pdf_filepath)
+    pages = []
+    for page in iter_layout_pages(pdf_filepath, backend, profile):
+        if not pages:
+            reason = rejection_reason(page)
+            if reason is not None:
+                raise InvalidPDF(reason)
+        pages.append(page)
+    return concat_layouts(pages)
+
+# ANCHOR: iter_layout_pages()
+def iter_layout_pages(pdf_filepath, backend=None, profile=None):
+    """
+    Lays out the PDF one page at a time. Each page's tree is dropped as soon
+    as its text lines are extracted, so peak memory holds a single page tree
+    no matter how long the transcript is.
+
+    Yields one layout dict (see load_layout) per page, in page order.
+    Token positions are numbered across the whole document, so the pages
+    can be joined with concat_layouts().
+
+    Args:
+        pdf_filepath: path to transcript pdf, or a SharedPdf
+        backend: a key of LAYOUT_BACKENDS (default: see layout_backend)
+        profile: a key of LAYOUT_PROFILES (default: see layout_profile)
+    """
+    pdf = layout_backend(backend)(pdf_filepath, profile)
+    ntokens = 0
+    try:
+        for n in count():
+            try:
+                page, ntokens = __layout_page(pdf, n, ntokens)
+            except StopIteration:
+                return
+            yield page
+    finally:
+        pdf.close()
+
+# ANCHOR: __layout_page()
+def __layout_page(pdf, n, ntokens=0):
+    """
+    Lays out a single page, which need not follow the last page laid out.
+
+    Returns tuple of (layout dict of the page, ntokens)
+
+    Raises StopIteration past the last page
+
+    Args:
+        pdf: layout backend instance (see LAYOUT_BACKENDS)
+        n: 0-based page number
+        ntokens: number of tokens on the preceding pages
+    """
+    with span("pdfminer_layout"):
+        page = pdf.page(n)
+    page, lines, ntokens = __extract_page(page, ntokens)
+    pdf.release()
+    return __layout_frames([page], lines), ntokens
+
+# ANCHOR: concat_layouts()
+def concat_layouts(layouts):
+    """
+    Returns layout dict joining the given layouts, in order
 
     Args:
-        pdf: loaded pdfquery pdf object
+        layouts: list of layout dicts, e.g. pages from iter_layout_pages()
     """
-    pageheading = 'Los Rios CCD Unofficial Transcript - All'
-    pageheadings = pdf.pq('LTTextLineHorizontal:contains("%s")' % pageheading)
+    if len(layouts) == 0:
+        return __layout_frames([], [])
+    return {key: pd.concat([layout[key] for layout in layouts], ignore_index=True)
+            for key in ("pages", "lines")}
 
-    valid_headings = [i[0].text.strip(" ") == pageheading.strip(" ")
-                      for i in pageheadings].count(True) == len(pdf.pq('LTFigure'))
-    valid_pagewidth = PAGEWIDTH == round(float(pdf.get_layout(1).bbox[2]))
-    valid_pageheight = PAGEHEIGHT == round(float(pdf.get_layout(1).bbox[3]))
+# ANCHOR: __layout_frames()
+def __layout_frames(pages, lines):
+    """
+    Returns layout dict
 
-    return all([valid_headings, valid_pagewidth, valid_pageheight])
+    Args:
+        pages: list of page records
+        lines: list of line records
+    """
+    lines = pd.DataFrame(lines, columns=LAYOUT_LINE_COLUMNS)
+    return {"pages": pd.DataFrame(pages, columns=LAYOUT_PAGE_COLUMNS),
+            "lines": lines.astype({"indexed": bool, "token": np.int64})}
 
-# ANCHOR: scrape_labels()
-def define_college_sections(pdf, figures):
+# ANCHOR: __extract_page()
+@instrumented("extract_page")
+def __extract_page(page, ntokens):
     """
-    Returns Pandas DataFrame.
+    Returns tuple of (page record, list of line records, ntokens)
 
     Args:
-        pdf: loaded pdfquery pdf object
-        figures: list of LTFigure objects scraped from the PDF
+        page: LTPage element
+        ntokens: number of tokens on the preceding pages
     """
-    colleges = []
-    idx=0
+    pageid = page.layout.pageid
+    x0, y0, x1, y1 = page.layout.bbox
+    figures = list(page.iter('LTFigure'))
+    record = {"pageid": pageid, "x0": x0, "y0": y0, "x1": x1, "y1": y1,
+              "nfigures": len(figures)}
+
+    lines, rows = [], dict()
+    nscanned = 0
+    for line in page.iter('LTTextLineHorizontal'):
+        # text lines either carry their own text, or wrap children that do
+        for j in (line if len(line) > 0 else [line]):
+            nscanned += 1
+            if j.text != None:
+                rows.setdefault(j, len(lines))
+                lines.append(__line_record(pageid, j, True))
+
     for figure in figures:
-        pageid = float(figure.iterancestors('LTPage').__next__().layout.pageid)
         for instance_wrapper in figure:
             for instance in instance_wrapper.getchildren():
-                if "----------Beginning" in instance.text:
-                    new_attribs = {"name": instance.text.split(" ")[2],
-                                   "n":idx,
-                                   "pageid": pageid,
-                                   "last_pageid": None,
-                                # '-y0' and 'pageside' are for easy top-to-bottom sorting
-                                   "-y0": -1*float(instance.get('y0')),
-                                   "pageside": float(instance.attrib['x0']) > HALFPAGEWIDTH,
-                                   "semesters": object,}
-                    colleges.append(dict(instance.attrib, **new_attribs))
-                    idx+=1
+                nscanned += 1
+                if instance.text == None:
+                    continue
+                if instance in rows:
+                    lines[rows[instance]]["token"] = ntokens
+                else:
+                    lines.append(__line_record(pageid, instance, False, ntokens))
+                ntokens += 1
+
+    count_elements(nscanned, len(lines))
+    return record, lines, ntokens
+
+# ANCHOR: __line_record()
+def __line_record(pageid, element, indexed, token=-1):
+    """
+    Returns dict
+
+    Args:
+        pageid: page of the element
+        element: lxml layout element carrying text
+        indexed: whether the element is one of the page's text lines
+        token: position in the token stream, or -1
+    """
+    record = {k: float(element.get(k)) for k in LINE_ATTRIBS}
+    record.update({"pageid": pageid, "text": element.text,
+                   "indexed": indexed, "token": token})
+    return record
+
+# ANCHOR: count_pages()
+def count_pages(pdf_filepath):
+    """
+    Returns int number of pages, read from the page tree's root alone, or 0
+    if the file cannot be parsed
+
+    Args:
+        pdf_filepath: path to transcript pdf, or a SharedPdf
+    """
+    with open_pdf(pdf_filepath) as pdf_file:
+        try:
+            document = PDFDocument(PDFParser(pdf_file))
+            return int(resolve1(resolve1(document.catalog['Pages'])['Count']))
+        except Exception:
+            return 0
+
+# ANCHOR: precheck_pdf()
+@instrumented("precheck_pdf")
+def precheck_pdf(pdf_filepath):
+    """
+    Rejects files that cannot be transcripts before any layout analysis, in
+    two tiers of increasing cost: first the page tree alone (page count and
+    the first page's MediaBox), then the text of the first page, read without
+    layout analysis, which must hold PAGEHEADING.
+
+    Returns int number of pages
+
+    Raises InvalidPDF with the reason code of the first failed check
+
+    Args:
+        pdf_filepath: path to transcript pdf, or a SharedPdf
+    """
+    with open_pdf(pdf_filepath) as pdf_file:
+        try:
+            pages = list(PDFPage.create_pages(PDFDocument(PDFParser(pdf_file))))
+        except Exception as e:
+            raise InvalidPDF(REJECT_UNREADABLE, "%s: %s" % (type(e).__name__, e))
+        if len(pages) == 0:
+            raise InvalidPDF(REJECT_NO_PAGES)
+
+        x0, y0, x1, y1 = pages[0].mediabox
+        if (round(x1 - x0), round(y1 - y0)) != (PAGEWIDTH, PAGEHEIGHT):
+            raise InvalidPDF(REJECT_PAGE_SIZE, "First page is %gx%g." % (x1 - x0, y1 - y0))
+
+        text = io.StringIO()
+        resources = PDFResourceManager()
+        device = TextConverter(resources, text, laparams=None)
+        try:
+            PDFPageInterpreter(resources, device).process_page(pages[0])
+        except Exception as e:
+            raise InvalidPDF(REJECT_UNREADABLE, "%s: %s" % (type(e).__name__, e))
+        if PAGEHEADING not in text.getvalue():
+            raise InvalidPDF(REJECT_NO_HEADING)
+
+    return len(pages)
+
+# ANCHOR: rejection_reason()
+@instrumented("rejection_reason")
+def rejection_reason(layout):
+    """
+    The full check, on laid-out pages: every page figure must carry one
+    PAGEHEADING, and the first page must be PAGEWIDTH x PAGEHEIGHT.
+
+    Returns the REJECT_* code the layout fails, or None if it is valid
+
+    Args:
+        layout: layout dict from load_layout()
+    """
+    pages, lines = layout["pages"], layout["lines"]
+    if len(pages) == 0:
+        return REJECT_NO_PAGES
+
+    headings = lines[lines["indexed"]]["text"].str.strip(" ") == PAGEHEADING
+    count_elements(len(headings), int(headings.sum()))
+    if headings.sum() != pages["nfigures"].sum():
+        return REJECT_HEADING_COUNT
+    if (PAGEWIDTH != round(float(pages.at[0, 'x1']))) or \
+       (PAGEHEIGHT != round(float(pages.at[0, 'y1']))):
+        return REJECT_PAGE_SIZE
+    return None
+
+# ANCHOR: valid_pdf()
+def valid_pdf(layout):
+    """
+    Returns bool
+
+    Args:
+        layout: layout dict from load_layout()
+    """
+    return rejection_reason(layout) is None
 
-    colleges = pd.DataFrame.from_records(colleges, index=("n", "name"))
-    colleges = colleges.apply(lambda df_col: \
-                                pd.to_numeric(df_col, errors='ignore')).round(decimals=0)
+# ANCHOR: tokenize_layout()
+@instrumented("tokenize_layout")
+def tokenize_layout(layout):
+    """
+    Classifies every text line of the layout once, so that the label stages
+    below read from the resulting record stream instead of each re-walking
+    every figure.
 
-    return __find_college_section_ends(colleges, len(figures))
+    Returns dict of {kind: [TextLine, ...]}, each list in document order, for
+    the kinds COLLEGE, SEMESTER, PLAN, POINTS and CELL
 
-# ANCHOR: __find_college_section_ends()
-def __find_college_section_ends(colleges, maxpageid):
+    Args:
+        layout: layout dict from load_layout()
     """
-    Returns a Pandas DataFrame
+    tokens = {kind: [] for kind in TOKEN_KINDS}
+    lines = layout["lines"]
+    nscanned = len(lines)
+    lines = lines[lines["token"] >= 0].sort_values(by="token")
+    for line in zip(*(lines[k].tolist() for k in TextLine.__slots__)):
+        line = TextLine(*line)
+        tokens[__classify(line.text)].append(line)
+    count_elements(nscanned, len(lines))
+    return tokens
+
+# ANCHOR: __classify()
+def __classify(text):
+    """
+    Returns the token kind of a single line of text
 
     Args:
-        colleges: pandas dataframe
+        text: text of a layout instance
+    """
+    label = text.strip(" ")
+    if "----------Beginning" in label:
+        return COLLEGE
+    elif SEMESTER_HEADING.match(label):
+        return SEMESTER
+    elif label.strip(":") == "Plan":
+        return PLAN
+    elif label == "Points":
+        return POINTS
+    else:
+        return CELL
+
+# ANCHOR: define_college_sections()
+@instrumented("define_college_sections")
+def define_college_sections(tokens, maxpageid):
+    """
+    Returns list of CollegeSection, in document order, each without its
+    semesters (see group_semesters_by_college)
+
+    Args:
+        tokens: record stream from tokenize_layout()
         maxpageid: the page number of the final page of the transcript
     """
-    # find the pageid of the last page of each college section
-    for n, row in colleges.iterrows():
-        if n[0] < (len(colleges) - 1):
-            colleges.xs(n[0]).at[n[1], 'last_pageid'] = colleges.iloc[n[0]+1].pageid - 1
-        else:
-            colleges.xs(n[0]).at[n[1], 'last_pageid'] = maxpageid
+    colleges = [CollegeSection(heading.text.split(" ")[2], heading, maxpageid)
+                for heading in tokens[COLLEGE]]
+    # a college section ends on the page before the next one begins
+    for college, following in zip(colleges, colleges[1:]):
+        college.last_pageid = following.heading.pageid - 1
+
+    count_elements(len(tokens[COLLEGE]), len(colleges))
     return colleges
 
+# ANCHOR: student_name()
+def student_name(layout):
+    """
+    Returns str
+
+    Args:
+        layout: layout dict from load_layout()
+    """
+    lines = layout["lines"]
+    names = lines[lines["indexed"] & lines["text"].str.contains("Name: ", regex=False)]
+    name = names["text"].iloc[0].split("Name: ")[1]
+    return ", ".join(part.strip(" ") for part in name.split(","))
+
 # ANCHOR: scrape_semesters_and_plans()
-def scrape_semesters_and_plans(pdf, figures):
+@instrumented("scrape_semesters_and_plans")
+def scrape_semesters_and_plans(tokens):
     """
+    Returns list of Semester in reading order, with their plans and the
+    labels that end their course rows, but without their courses (see
+    scrape_courses)
+
     Args:
-        pdf: loaded pdfquery pdf object
-        figures: list of LTFigure objects scraped from the PDF
+        tokens: record stream from tokenize_layout()
     """
+    semesters = sorted((Semester(heading) for heading in tokens[SEMESTER]),
+                       key=__heading_order)
+    count_elements(len(tokens[SEMESTER]), len(semesters))
 
-    seasons = ["Spring", "Summer", "Fall", "Winter",]
-    labels = ["Plan",]
+    for semester, plan in zip(semesters, __find_semester_plans(tokens, semesters)):
+        semester.plan = plan
+    __find_semester_section_ends(tokens, semesters)
+    return semesters
 
-    plans = []
-    semesters = []
+# ANCHOR: __find_semester_plans()
+def __find_semester_plans(tokens, semesters):
+    """
+    Returns list of plan names, one per semester.
 
-    for figure in figures:
-        pageid = float(figure.iterancestors('LTPage').__next__().layout.pageid)
-
-        for label in seasons+labels:
-            for instance_wrapper in figure:
-                for instance in instance_wrapper.getchildren():
-                    if label in instance.text:
-                        if any([s in label for s in seasons]):
-                            attribs = instance.attrib
-                            plan_name = attribs
-                            new_attribs ={"name": instance.text,
-                                          "plan": "",
-                                          "courses": object,
-                                          "pageid":pageid,
-                                          "end_pageid": None,
-                                          "end_x": None,
-                                          "end_y": None,
-                                          "-y0":-1 * float(instance.get('y0')),
-                                          "pageside": float(instance.attrib['x0']) > HALFPAGEWIDTH,
-                                          "end_pageside": False #placeholder value
-                                         }
-                            semesters.append(dict(attribs, **new_attribs))
-
-                        elif label == instance.text.strip(" ").strip(":"):
-                            plans.append(instance.text) # TODO: FIX: needs to append target, not label
-
-    for n, plan in enumerate(plans):
-        semesters[n]['plan'] = plan
-
-    semesters = pd.DataFrame.from_records(semesters).apply( \
-                                lambda df_col: pd.to_numeric(df_col, \
-                                    errors='ignore')).round(decimals=0)
-
-    semesters = semesters.sort_values(by=["pageid", "pageside", "-y0"])
-    semesters = semesters.reset_index(drop=True)
-    semesters.index = semesters.index.rename('n')
-    semesters = semesters.set_index([semesters.index, 'name'])
-
-    return __find_semester_section_ends(pdf, figures, semesters)
+    A plan name is the text to the right of a "Plan:" label on the same row
+    and in the same page column. Each semester takes the first plan that
+    follows its heading in reading order, provided it comes before the next
+    semester heading.
+
+    Args:
+        tokens: record stream from tokenize_layout()
+        semesters: list of Semester in reading order
+    """
+    rows = dict()
+    for label in tokens[PLAN]:
+        rows[(label.pageid, label.pageside, round(label.y0))] = label
+
+    names = dict()
+    for cell in tokens[CELL]:
+        label = rows.get((cell.pageid, cell.pageside, round(cell.y0)))
+        if (label is None) or (cell.x0 < label.x1):
+            continue
+        if (label not in names) or (cell.x0 < names[label][0]):
+            names[label] = (cell.x0, cell.text.strip(" "))
+
+    plans = sorted(((__line_order(label.pageid, label.pageside, label.y0),
+                     names.get(label, (None, ""))[1]) for label in tokens[PLAN]),
+                   key=lambda plan: plan[0])
+    orders = [order for order, name in plans]
+
+    starts = [__heading_order(semester) for semester in semesters]
+    names = []
+    for start, end in zip(starts, starts[1:] + [np.inf]):
+        i = bisect_right(orders, start)
+        names.append(plans[i][1] if (i < len(plans)) and (orders[i] < end) else "")
+    return names
+
+# ANCHOR: __reading_order()
+def __reading_order(df):
+    """
+    Returns a Pandas Series holding a single sortable key equivalent to
+    sorting by ["pageid", "pageside", "-y0"].
+
+    Args:
+        df: pandas dataframe with pageid, pageside and -y0 columns
+    """
+    return __line_order(df['pageid'], df['pageside'], -1 * df['-y0'])
+
+# ANCHOR: __line_order()
+def __line_order(pageid, pageside, y0):
+    """
+    Returns the reading-order key of __reading_order() for scalars or arrays
+
+    Args:
+        pageid: page number
+        pageside: whether in the right page column
+        y0: height on the page
+    """
+    return (pageid * 2 + pageside) * 10 * PAGEHEIGHT - y0
+
+# ANCHOR: __heading_order()
+def __heading_order(section):
+    """
+    Returns the reading-order key of a CollegeSection's or Semester's heading,
+    at its rounded height
+
+    Args:
+        section: CollegeSection or Semester
+    """
+    heading = section.heading
+    return __line_order(heading.pageid, heading.pageside, round(heading.y0))
 
 # ANCHOR: __find_semester_section_ends()
-def __find_semester_section_ends(pdf, figures, semesters):
-    label = "Points"
-    points = []
-    idx=0
+def __find_semester_section_ends(tokens, semesters):
+    """
+    Every semester is followed by three "Points" labels, in the course table
+    header, the term totals and the cumulative totals. The term totals label
+    marks where the semester's course rows end, so in reading order every
+    third label starting from the second belongs, positionally, to the next
+    semester.
 
-    for figure in figures:
-        pageid = float(figure.iterancestors('LTPage').__next__().layout.pageid)
-        for instance_wrapper in figure:
-            for instance in instance_wrapper.getchildren():
-                if label in instance.text:
-                    attribs = instance.attrib
-                    plan_name = attribs
-                    new_attribs ={"pageid":pageid,
-                                  "-y0":-1 * float(instance.get('y0')),
-                                  "pageside": float(instance.attrib['x0']) > HALFPAGEWIDTH
-                                  }
-                    points.append(dict(attribs, **new_attribs))
-
-    points = pd.DataFrame.from_records(points).apply( \
-                                lambda df_col: pd.to_numeric(df_col, \
-                                    errors='ignore')).round(decimals=0)
-    points = points.sort_values(by=["pageid", "pageside", "-y0"]).reset_index(drop=True)
-    points = points[(points.index - 1)%3==0].reset_index(drop=True)
-
-    for i, row in semesters.iterrows():
-        semesters.xs(i[0]).at[i[1], 'end_pageid'] = points.iloc[i[0]].pageid
-        semesters.xs(i[0]).at[i[1], 'end_x'] = points.iloc[i[0]].x1
-        semesters.xs(i[0]).at[i[1], 'end_y'] = points.iloc[i[0]].y0
-        semesters.xs(i[0]).at[i[1], 'end_pageside'] = float(points.iloc[i[0]].x0) > HALFPAGEWIDTH
+    Sets the end of every semester.
 
-    return semesters
+    Args:
+        tokens: record stream from tokenize_layout()
+        semesters: list of Semester in reading order
+    """
+    points = sorted(tokens[POINTS], key=lambda label: \
+                        __line_order(label.pageid, label.pageside, round(label.y0)))[1::3]
+    if len(points) < len(semesters):
+        raise ValueError("Found %d semester ends for %d semesters." % \
+                         (len(points), len(semesters)))
+
+    for semester, end in zip(semesters, points):
+        semester.end = end
 
 # ANCHOR: group_semesters_by_college()
+@instrumented("group_semesters_by_college")
 def group_semesters_by_college(colleges, semesters):
-    for n, row in colleges.iterrows():
-        pageid = colleges.iloc[n[0]].pageid
-        end_pageid = colleges.iloc[n[0]].last_pageid
-        colleges.xs(n[0]).at[n[1], 'semesters'] = semesters[(semesters['pageid'] >= pageid) & \
-                                                        (semesters['end_pageid'] <= end_pageid)]
+    """
+    Assigns each semester to the last college section heading that precedes
+    it in reading order.
+
+    Returns colleges, with their semesters set
+
+    Args:
+        colleges: list of CollegeSection from define_college_sections()
+        semesters: list of Semester from scrape_semesters_and_plans()
+    """
+    for college in colleges:
+        college.semesters = []
+    if len(colleges) == 0:
+        return colleges
+
+    college_order = np.array([__heading_order(college) for college in colleges], dtype=float)
+    rank = np.argsort(college_order, kind='stable')
+    n = np.searchsorted(college_order[rank],
+                        [__heading_order(semester) for semester in semesters],
+                        side='right') - 1
+
+    # semesters above the first college heading belong to no college
+    for k, semester in zip(n, semesters):
+        if k >= 0:
+            colleges[rank[k]].semesters.append(semester)
     return colleges
 
+# ANCHOR: bin_course_cells()
+@instrumented("bin_course_cells")
+def bin_course_cells(layout):
+    """
+    Bins every indexed text line of the layout into a course table column, by
+    the COL1_X_VALS/COL2_X_VALS x-intervals, and into the row band of the
+    nearest dept cell at or above it, in one vectorized pass over the whole
+    document. Lines outside every column interval, or outside the page body,
+    are dropped.
+
+    Returns pd.DataFrame with one row per cell; the layout line columns plus
+        field: the COLX key of the cell's column
+        pageside: whether the cell is in the right page column
+        order: reading-order key of the cell's bottom edge
+        top: reading-order key of the cell's top edge
+        row: position of the row's dept cell in the frame, or -1
+        on_row: whether the cell lies within its dept cell's y-range
+
+    Args:
+        layout: layout dict from load_layout()
+    """
+    lines = layout["lines"]
+    lines = lines[lines["indexed"]].reset_index(drop=True)
+
+    bins = sorted((x0, x1, field) for COLX in (COL1_X_VALS, COL2_X_VALS)
+                                  for field, (x0, x1) in COLX.items())
+    starts = np.array([x0 for x0, x1, field in bins], dtype=float)
+    ends = np.array([x1 for x0, x1, field in bins], dtype=float)
+    fields = np.array([field for x0, x1, field in bins], dtype=object)
+
+    b = np.searchsorted(starts, lines['x0'].to_numpy(), side='right') - 1
+    inside = (b >= 0) & (lines['x1'].to_numpy() <= ends[np.maximum(b, 0)]) & \
+             (lines['y0'].to_numpy() >= BOTTOM_OF_PAGE) & \
+             (lines['y1'].to_numpy() <= TOP_OF_PAGE)
+
+    cells = lines[inside].reset_index(drop=True)
+    cells['text'] = cells['text'].str.strip(" ")
+    cells['field'] = fields[b[inside]]
+    cells['pageside'] = cells['x0'] > HALFPAGEWIDTH
+    cells['-y0'] = -1 * cells['y0']
+    cells['order'] = __reading_order(cells)
+    cells['top'] = cells['order'] + cells['y0'] - cells['y1']
+
+    # every cell belongs to the last dept cell at or above it in its column
+    anchors = np.flatnonzero((cells['field'] == 'dept').to_numpy())
+    anchors = anchors[np.argsort(cells['order'].to_numpy()[anchors], kind='stable')]
+    row = np.searchsorted(cells['order'].to_numpy()[anchors],
+                          cells['order'].to_numpy() + ROW_TOLERANCE, side='right') - 1
+    row = np.where(row >= 0, anchors[np.maximum(row, 0)], -1)
+
+    column = (cells['pageid'] * 2 + cells['pageside']).to_numpy()
+    row[column != column[row]] = -1
+    cells['row'] = row
+
+    y0, y1 = cells['y0'].to_numpy(), cells['y1'].to_numpy()
+    cells['on_row'] = (row >= 0) & (y0 >= y0[row]) & (y1 <= y1[row])
+    count_elements(len(lines), len(cells))
+    return cells
+
 # ANCHOR: scrape_courses()
-def scrape_courses(pdf, colleges):
-    #TODO: Fix, apparent not scraping course targets.
-    for n, college in colleges.iterrows():
-        for i, semester in college['semesters'].iterrows():
-            multipage = semester.pageid == semester.end_pageid
-            samecolumn = semester.pageside == semester.end_pageside
-            pageid = semester.pageid
-            if (samecolumn) and (not multipage):
-                y1 = semester.y0 - 18
-                y0 = semester.end_y
-                if not semester.pageside:
-                    x0 = COL1_X_VALS['dept'][0]
-                    x1 = COL1_X_VALS['dept'][1]
-                else:
-                    x0 = COL2_X_VALS['dept'][0]
-                    x1 = COL2_X_VALS['dept'][1]
-                # SCRAPE
-                courses = scrape_course_bbox(pdf, x0, y0, x1, y1, pageid)
-
-            elif (not samecolumn) and (not multipage):
-                y1 = semester.y0 - 18
-                y0 = BOTTOM_OF_PAGE
-                x0 = COL1_X_VALS['dept'][0]
-                x1 = COL1_X_VALS['dept'][1]
-                courses = scrape_course_bbox(pdf, x0, y0, x1, y1, pageid)
-                y1 = TOP_OF_PAGE
-                y0 = semester.end_y
-                x0 = COL2_X_VALS['dept'][0]
-                x1 = COL2_X_VALS['dept'][1]
-                courses.append(scrape_course_bbox(pdf, x0, y0, x1, y1, pageid))
-
-            elif (multipage):
-                y1 = semester.y0 - 18
-                y0 = BOTTOM_OF_PAGE
-                x0 = COL2_X_VALS['dept'][0]
-                x1 = COL2_X_VALS['dept'][1]
-                courses = scrape_course_bbox(pdf, x0, y0, x1, y1, pageid)
-
-                y1 = TOP_OF_PAGE
-                y0 = semester.end_y
-                x0 = COL2_X_VALS['dept'][0]
-                x1 = COL2_X_VALS['dept'][1]
-                courses.append(scrape_course_bbox(pdf, x0, y0, x1, y1, pageid+1))
-
-            #colleges.loc[n[1]].semesters.iloc[i[0]].courses = courses
-            colleges.xs(n[0]).at[n[1], 'semesters'].xs(i[0]).at[i[1], 'courses'] = courses
+@instrumented("scrape_courses")
+def scrape_courses(layout, colleges):
+    """
+    Sets the courses of every semester to a pd.DataFrame in the columns of
+    COURSE_COLUMNS, one row per course.
+
+    Returns colleges
+
+    Args:
+        layout: layout dict from load_layout()
+        colleges: list of CollegeSection from group_semesters_by_college()
+    """
+    semesters = [semester for college in colleges for semester in college.semesters]
+    if len(semesters) == 0:
+        courses = dict()
+    else:
+        courses = __assemble_courses(bin_course_cells(layout), semesters)
+    count_elements(matched=sum(len(semester) for semester in courses.values()))
+
+    for i, semester in enumerate(semesters):
+        semester.courses = courses[i] if i in courses else pd.DataFrame(columns=COURSE_COLUMNS)
     return colleges
 
-# ANCHOR: __prepare_courses()
-def __prepare_courses(pdf, courses):
+# ANCHOR: __assemble_courses()
+def __assemble_courses(cells, semesters):
     """
-    Combines course departments and course numbers into single objects, then
-    scrapes target data (description, attempted credits, earned credits, etc...)
-    for each course object.
+    A semester's course rows run down from below its heading to its end
+    marker, continuing at the top of the next page column whenever they
+    reach the bottom of one. In reading-order keys that is a single interval
+    per semester, so each cell finds its semester with one searchsorted.
 
-    Returns pd.DataFrame
+    Returns dict of {semester position: pd.DataFrame of its courses}
 
     Args:
-        courses: list of tuples, each containing pairs of dicts
+        cells: pandas dataframe from bin_course_cells()
+        semesters: list of Semester with their section ends, in the order
+                   of the colleges
+    """
+    start = np.array([__heading_order(semester) + 18 for semester in semesters], dtype=float)
+    end = np.array([__line_order(semester.end.pageid, semester.end.pageside,
+                                 round(semester.end.y0)) for semester in semesters], dtype=float)
+
+    rank = np.argsort(start, kind='stable')
+    k = np.searchsorted(start[rank], cells['top'].to_numpy(), side='right') - 1
+    semester = rank[np.maximum(k, 0)]
+    within = (k >= 0) & (cells['order'].to_numpy() <= end[semester])
+    semester = np.where(within, semester, -1)
+
+    # a cell counts only when it shares the semester of its row's dept cell
+    row = cells['row'].to_numpy()
+    keep = (row >= 0) & (semester >= 0) & (semester == semester[row])
+    cells = cells[keep].assign(semester=semester[keep])
+
+    depts = cells[cells.index == cells['row']]
+    seqs = cells[(cells['field'] == 'seq') & cells['on_row']].groupby('row')[['text', 'x1']].last()
+    values = cells[(cells['field'] != 'description') & cells['on_row']]
+    values = values.groupby(['row', 'field'])['text'].last().unstack()
+    # descriptions wrap onto the lines below their row
+    descriptions = cells[cells['field'] == 'description'].sort_values(by='order')
+    descriptions = descriptions.groupby('row')['text'].agg(" ".join)
+
+    courses = pd.DataFrame({
+        "dept":        depts['text'],
+        "seq":         seqs['text'],
+        "x0":          depts['x0'],
+        "y0":          depts['y0'],
+        "x1":          seqs['x1'],
+        "y1":          depts['y1'],
+        "pageid":      depts['pageid'],
+        "description": descriptions,
+        "semester":    depts['semester'],
+        "order":       depts['order']}, index=depts.index)
+    for field in ("attempted", "earned", "grade", "points"):
+        courses[field] = values[field] if field in values else np.nan
+
+    courses = courses[courses['seq'].notna()].fillna("").sort_values(by='order')
+    semester = courses.pop('semester').to_numpy()
+    courses = courses[list(COURSE_COLUMNS)].reset_index(drop=True)
+
+    # courses are in reading order, so each semester is one contiguous slice
+    bounds = np.flatnonzero(np.diff(semester)) + 1
+    return {semester[start]: courses.iloc[start:stop]
+            for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(semester)])}
+
+# ANCHOR: prepare_records()
+@instrumented("prepare_records")
+def prepare_records(layout, colleges):
+    """
+    Returns pd.DataFrame with one row per course, in the columns of
+    RECORD_COLUMNS
+
+    Args:
+        layout: layout dict from load_layout()
+        colleges: list of CollegeSection from scrape_courses()
+    """
+    semesters = [(college, semester) for college in colleges
+                                     for semester in college.semesters]
+    if len(semesters) == 0:
+        return pd.DataFrame(columns=RECORD_COLUMNS)
+
+    records = pd.concat([semester.courses for college, semester in semesters],
+                        ignore_index=True).rename(columns=RECORD_FIELDS)
+    ncourses = [len(semester.courses) for college, semester in semesters]
+    records['semester'] = np.repeat([semester.name.strip(" ") for college, semester in semesters],
+                                    ncourses)
+    records['plan'] = np.repeat([semester.plan for college, semester in semesters], ncourses)
+    records['college'] = np.repeat([college.name for college, semester in semesters], ncourses)
+    records['name'] = student_name(layout)
+
+    records = records[list(RECORD_COLUMNS)]
+    count_elements(matched=len(records))
+    return records
+
+# ANCHOR: gen_csv()
+@instrumented("gen_csv")
+def gen_csv(records, filename_out):
+    """
+    Args:
+        records: pd.DataFrame from prepare_records()
+        filename_out: name of csv file to output
+    """
+    records.to_csv(filename_out, index=False)
+
+# !SECTION
+
+#%% SECTION: Output sinks
+# Sinks append records to one output file as they are produced, so a run over
+# many transcripts holds at most one transcript's rows (plus whatever is
+# waiting for the next flush) instead of one frame of every row. CSV and JSONL
+# output can be tailed while the run is going; a Parquet file is only
+# readable once its sink is closed and the footer is written.
+
+# ANCHOR: Sink constants
+SINK_FLUSH_ROWS = 1000
+SINK_FLUSH_SECONDS = 5.0
+
+# ANCHOR: RecordSink
+class RecordSink:
+    """
+    Base of the streaming record writers. Records are buffered until
+    flush_rows rows are pending or flush_seconds have passed since the last
+    flush, then written out and flushed to the OS. Every frame is written in
+    the columns of the first one.
+
+    Use as a context manager, or call close() when done.
+    """
+    extensions = ()
+
+    def __init__(self, filename_out, flush_rows=SINK_FLUSH_ROWS,
+                 flush_seconds=SINK_FLUSH_SECONDS, append=False):
+        self.filename_out = filename_out
+        self.flush_rows, self.flush_seconds = flush_rows, flush_seconds
+        self.append = append
+        self.columns = None
+        self.rows = 0
+        self._pending, self._npending = [], 0
+        self._flushed = time.monotonic()
+        self._open()
+
+    def write(self, records):
+        """
+        Args:
+            records: pd.DataFrame of rows to append
+        """
+        if self.columns is None:
+            self.columns = list(records.columns)
+        self._pending.append(records.reindex(columns=self.columns))
+        self._npending += len(records)
+        self.rows += len(records)
+        if self._npending >= self.flush_rows or \
+           time.monotonic() - self._flushed >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """ Writes out the pending records. """
+        if self._pending:
+            records = pd.concat(self._pending, ignore_index=True) \
+                      if len(self._pending) > 1 else self._pending[0]
+            self._write(records)
+        self._pending, self._npending = [], 0
+        self._flushed = time.monotonic()
+
+    def close(self):
+        """ Flushes the pending records and closes the file. """
+        self.flush()
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write(self, records):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+# ANCHOR: CSVSink
+class CSVSink(RecordSink):
+    """
+    Appends records to a CSV file with a single header line. In append mode,
+    the header is left out when the file already has one.
+    """
+    extensions = (".csv",)
+
+    def _open(self):
+        self._header = not (self.append and os.path.isfile(self.filename_out)
+                            and os.path.getsize(self.filename_out) > 0)
+        self._file = open(self.filename_out, 'a' if self.append else 'w',
+                          newline='', encoding='utf-8')
+
+    def _write(self, records):
+        records.to_csv(self._file, index=False, header=self._header)
+        self._header = False
+        self._file.flush()
+
+    def _close(self):
+        if self._header and self.columns is not None:
+            # nothing was written: an empty table still gets its header
+            pd.DataFrame(columns=self.columns).to_csv(self._file, index=False)
+        self._file.close()
+
+# ANCHOR: JSONLSink
+class JSONLSink(RecordSink):
+    """
+    Appends records to a newline-delimited JSON file, one object per row.
+    """
+    extensions = (".jsonl", ".ndjson")
+
+    def _open(self):
+        self._file = open(self.filename_out, 'a' if self.append else 'w',
+                          encoding='utf-8')
+
+    def _write(self, records):
+        if len(records):
+            self._file.write(records.to_json(orient='records', lines=True).rstrip("\n") + "\n")
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+# ANCHOR: ParquetSink
+class ParquetSink(RecordSink):
     """
-    prepared_courses = []
-    for dept, seq in courses:
-        if not dept.pageside:
-            COLX = COL1_X_VALS
+    Writes records to a Parquet file, one row group per flush, so
+    flush_rows is the row group size. Needs pyarrow. Appending is not
+    supported: Parquet keeps its schema and row group index in the footer.
+    """
+    extensions = (".parquet",)
+
+    def _open(self):
+        if self.append:
+            raise ValueError("Parquet output cannot be appended to: %s" % self.filename_out)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)") from e
+        self._pa = pyarrow
+        self._writer = None
+        self._schema = None
+
+    def _write(self, records):
+        if self._writer is None:
+            table = self._pa.Table.from_pandas(records, preserve_index=False)
+            self._schema = table.schema
+            self._writer = self._pa.parquet.ParquetWriter(self.filename_out, self._schema)
         else:
-            COLX = COL2_X_VALS
-        course = {
-            "dept":        dept.text,
-            "seq":         seq.text,
-            "x0":          dept.x0,
-            "y0":          dept.y0,
-            "x1":          seq.x1,
-            "y1":          dept.y1,
-            "pageid":      dept.pageid,
-            "description": scrape_bbox(pdf, courses, COLX.description[0], dept.y0, COLX.description[1], dept.y1, dept.pageid),
-            "attempted":   scrape_bbox(pdf, courses, COLX.attempted[0], dept.y0, COLX.attempted[1], dept.y1, dept.pageid),
-            "earned":      scrape_bbox(pdf, courses, COLX.earned[0], dept.y0, COLX.earned[1], dept.y1, dept.pageid),
-            "grade":       scrape_bbox(pdf, courses, COLX.grade[0], dept.y0, COLX.grade[1], dept.y1, dept.pageid),
-            "points":      scrape_bbox(pdf, courses, COLX.points[0], dept.y0, COLX.points[1], dept.y1, dept.pageid),}
-        prepared_courses.append(course)
-
-    return pd.DataFrame.from_records(prepared_courses)
-
-# ANCHOR: scrape_targets()
-def scrape_bbox(pdf, courses, x0, y0, x1, y1, pageid):
+            table = self._pa.Table.from_pandas(records, schema=self._schema,
+                                               preserve_index=False)
+        self._writer.write_table(table)
+
+    def _close(self):
+        if self._writer is None and self.columns is not None:
+            self._write(pd.DataFrame(columns=self.columns))
+        if self._writer is not None:
+            self._writer.close()
+
+# ANCHOR: SQLiteSink
+class SQLiteSink(RecordSink):
     """
-    Returns dict
+    Ingests records into a results store (see transcript_store), one
+    transaction per flush. Records need a 'source' column with the path of
+    the PDF they were mined from: rows are keyed by the PDF's content digest,
+    so a transcript ingested again replaces its earlier rows. The store keeps
+    every other transcript it holds, with or without append.
+    """
+    extensions = (".db", ".sqlite", ".sqlite3")
+
+    def _open(self):
+        import transcript_store
+        self._store = transcript_store.open_store(self.filename_out)
+
+    def _write(self, records):
+        if "source" not in records.columns:
+            raise ValueError("SQLite output needs the source PDF of the records")
+        self._store.ingest((content_digest(source), source, rows.drop(columns="source"))
+                           for source, rows in records.groupby("source", sort=False))
+
+    def _close(self):
+        self._store.close()
+
+# ANCHOR: Sink formats
+SINK_FORMATS = {"csv": CSVSink, "jsonl": JSONLSink, "parquet": ParquetSink,
+                "sqlite": SQLiteSink}
+
+# ANCHOR: sink_format()
+def sink_format(filename_out, fmt=None):
+    """
+    Returns str, a key of SINK_FORMATS: fmt if given, else the format
+    matching the file's extension, else "csv"
 
     Args:
-        pdf: loaded pdfquery object contianing transcript
-        courses: pd.DataFrame
+        filename_out: path of the output file
+        fmt: format name, or None to go by the extension
     """
-    raw_scrape = pdf.pq('LTTextLineHorizontal:in_bbox("%s, %s, %s, %s")' % \
-                                                      (x0, y0, x1, y1))
-    for i in raw_scrape:
-        if i.iterancestors('LTPage').__next__().layout.pageid == pageid:
-            if len(i) > 0:
-                for j in i:
-                    if j!=None and j.text!=None:
-                        target = dict(j.attrib, **{"text": j.text.strip(" "),
-                                                   "pageid": pageid})
-            else:
-                if i!=None and i.text!=None:
-                    target = dict(i.attrib, **{"text": i.text.strip(" "),
-                                               "pageid": pageid})
-    return target
-
-# ANCHOR: scrape_course_bbox()
-def scrape_course_bbox(pdf, x0, y0, x1, y1, pageid):
-    targets = []
-    raw_scrape = pdf.pq('LTTextLineHorizontal:in_bbox("%s, %s, %s, %s")' % \
-                                                      (x0, y0, x1, y1))
-    for i in raw_scrape:
-        if i.iterancestors('LTPage').__next__().layout.pageid == pageid:
-            if len(i) > 0:
-                for j in i:
-                    if j.text != None and j != None:
-                        targets.append(( dict(j.attrib, **{"pageid": pageid,
-                                                           "text": j.text.strip(" ")}
-                                            )))
-            else:
-                if i.text != None and i != None:
-                    targets.append(( dict(i.attrib, **{"pageid": pageid,
-                                                       "text": i.text.strip(" ")}
-                                        )))
+    if fmt is not None:
+        if fmt not in SINK_FORMATS:
+            raise ValueError("Unknown output format: %s" % fmt)
+        return fmt
+    extension = os.path.splitext(filename_out)[1].lower()
+    for fmt, sink in SINK_FORMATS.items():
+        if extension in sink.extensions:
+            return fmt
+    return "csv"
 
-    depts = [i for i in targets if i['text'].isalpha()]
-    seqs = [i for i in targets if i['text'].isnumeric()]
-    courses = zip(depts, seqs)
+# ANCHOR: open_sink()
+def open_sink(filename_out, fmt=None, **kwargs):
+    """
+    Returns RecordSink writing to filename_out
 
-    return __prepare_courses(pdf, courses)
+    Args:
+        filename_out: path of the output file
+        fmt: a key of SINK_FORMATS, or None to go by the file's extension
+        kwargs: flush_rows, flush_seconds and append, see RecordSink
+    """
+    return SINK_FORMATS[sink_format(filename_out, fmt)](filename_out, **kwargs)
 
+# ANCHOR: write_records()
+@instrumented("write_records")
+def write_records(records, filename_out, fmt=None, source=None):
+    """
+    Writes one transcript's records to a file of their own.
 
-def prepare_records(pdf, colleges):
+    Args:
+        records: pd.DataFrame from prepare_records()
+        filename_out: path of the output file
+        fmt: a key of SINK_FORMATS, or None to go by the file's extension
+        source: path of the transcript pdf, which the "sqlite" format
+                needs; not written by the other formats
     """
+    fmt = sink_format(filename_out, fmt)
+    if fmt == "csv":
+        gen_csv(records, filename_out)
+        return
+    if fmt == "sqlite" and source is not None:
+        records = records.assign(source=source)
+    with open_sink(filename_out, fmt, flush_rows=float('inf')) as sink:
+        sink.write(records)
+
+# !SECTION
+
+#%% SECTION: Parse cache
+# Cache entries are keyed by the SHA-256 of the PDF plus the layout settings,
+# so an entry never outlives a change to pdfminer or to the layout profile.
+# Alongside the whole-file entries, "page-" entries hold single pages keyed by
+# the page's fingerprint. Entries are evicted least recently used first once
+# the cache outgrows CACHE_MAX_BYTES.
+
+# ANCHOR: Cache constants
+CACHE_DIR = os.environ.get("TRANSCRIPT_MINER_CACHE",
+                           os.path.join(os.path.expanduser("~"), ".cache", "transcript_miner"))
+CACHE_MAX_BYTES = 256 * 2**20
+CACHE_FORMAT = 1
+
+# pages a worker lays out per task when a document is split across workers
+PAGE_CHUNK = 4
+
+LITERAL_FORM = LIT('Form')
+
+# ANCHOR: cache_key()
+def cache_key(pdf_filepath, profile=None):
+    """
+    Returns str, the hex digest naming the cache entry of the PDF
+
     Args:
-        filename_out: name of csv file to output
-        pdf: loaded pdfquery pdf object
-        colleges: dict of dicts of dataframes containing label instances
+        pdf_filepath: path to transcript pdf, or a SharedPdf
+        profile: a key of LAYOUT_PROFILES (default: see layout_profile)
     """
-    studentname = pdf.pq('LTTextLineHorizontal:contains("Name:")')[0][0].text.split("Name: ")[1]
-    courses = []
-    for college in colleges:
-        for n, row in colleges[college]['Course'].iterrows():
-            course_targets = row['targets']
-            for target_set in course_targets:
-                courses.append(
-                    dict({(target['label'] if target!=None else "missing") : (target['text'] if target!=None else None) \
-                         for target in target_set},
-                         **{"semester":colleges[college]['semester'].loc[n]['text'],
-                            "plan": colleges[college]['Plan'].loc[n]['target']['text'],
-                            "college": college,
-                            "name": studentname})
-                )
+    return content_digest(pdf_filepath) + "-" + __settings_key(profile)
+
+# ANCHOR: __settings_key()
+def __settings_key(profile=None):
+    """
+    Returns str, a short digest of everything besides the PDF that layout
+    analysis depends on
+
+    Args:
+        profile: a key of LAYOUT_PROFILES (default: see layout_profile)
+    """
+    import pdfminer
+
+    profile = LAYOUT_PROFILES[layout_profile(profile)]
+    settings = repr((CACHE_FORMAT, pdfminer.__version__,
+                     sorted(profile["laparams"].items()), profile["min_y"]))
+    return hashlib.sha256(settings.encode('utf-8')).hexdigest()[:16]
+
+# ANCHOR: __write_cache_entry()
+@instrumented("write_cache_entry")
+def __write_cache_entry(entry, layout):
+    """
+    Stores the layout as one compressed numpy archive: a column per numeric
+    field, and the line texts as a single UTF-8 blob plus offsets. The entry
+    is written under a temporary name and renamed into place, so concurrent
+    workers never read a partial entry.
+
+    Args:
+        entry: path of the cache entry
+        layout: layout dict from load_layout()
+    """
+    pages, lines = layout["pages"], layout["lines"]
+    texts = [text.encode('utf-8') for text in lines["text"]]
+
+    columns = {"page_" + k: pages[k].to_numpy() for k in LAYOUT_PAGE_COLUMNS}
+    columns.update({"line_" + k: lines[k].to_numpy()
+                    for k in LAYOUT_LINE_COLUMNS if k != "text"})
+    columns["text_blob"] = np.frombuffer(b''.join(texts), dtype=np.uint8)
+    columns["text_ends"] = np.cumsum([len(text) for text in texts], dtype=np.int64)
 
+    tmp = "%s.%d.tmp" % (entry, os.getpid())
     try:
-        records = pd.DataFrame(courses).drop('missing', 1)
-    except:
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        with open(tmp, 'wb') as cache_file:
+            np.savez_compressed(cache_file, **columns)
+        os.replace(tmp, entry)
+    except OSError:
+        # an unwritable cache only costs the next run its speedup
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# ANCHOR: __read_cache_entry()
+@instrumented("read_cache_entry")
+def __read_cache_entry(entry):
+    """
+    Returns layout dict, or None on a cache miss or an unreadable entry
+
+    Args:
+        entry: path of the cache entry
+    """
+    try:
+        with np.load(entry, allow_pickle=False) as columns:
+            pages = pd.DataFrame({k: columns["page_" + k] for k in LAYOUT_PAGE_COLUMNS})
+            lines = {k: columns["line_" + k] for k in LAYOUT_LINE_COLUMNS if k != "text"}
+            blob = columns["text_blob"].tobytes()
+            ends = columns["text_ends"].tolist()
+        os.utime(entry)  # mark as recently used
+    except (OSError, KeyError, ValueError):
+        return None
+
+    starts = [0] + ends[:-1]
+    lines["text"] = [blob[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+    count_elements(matched=len(ends))
+    return {"pages": pages,
+            "lines": pd.DataFrame(lines, columns=LAYOUT_LINE_COLUMNS)}
+
+# ANCHOR: page_fingerprints()
+@instrumented("page_fingerprints")
+def page_fingerprints(pdf_filepath):
+    """
+    Fingerprints every page by the content that its layout depends on: its
+    MediaBox, its content streams, and the streams of the forms and images
+    it draws, followed down through nested forms. Object numbers and
+    resource names are left out, so a page re-exported into a new file keeps
+    its fingerprint.
+
+    Returns list of str, one hex digest per page, in page order
+
+    Raises InvalidPDF if the file cannot be parsed
+
+    Args:
+        pdf_filepath: path to transcript pdf, or a SharedPdf
+    """
+    with open_pdf(pdf_filepath) as pdf_file:
         try:
-            records = pd.DataFrame(courses)
+            pages = PDFPage.create_pages(PDFDocument(PDFParser(pdf_file)))
+            return [__page_digest(page) for page in pages]
         except Exception as e:
-            print(e)
-            return -1
+            raise InvalidPDF(REJECT_UNREADABLE, "%s: %s" % (type(e).__name__, e))
 
-    return records
+# ANCHOR: __page_digest()
+def __page_digest(page):
+    """
+    Returns str, the hex digest of a page
 
-def gen_csv(records, filename_out):
+    Args:
+        page: pdfminer PDFPage
+    """
+    digest = hashlib.sha256(repr([round(v, 2) for v in page.mediabox]).encode('ascii'))
+    contents = page.contents if isinstance(page.contents, list) else [page.contents]
+    for stream in contents:
+        digest.update(resolve1(stream).get_data())
+    __digest_resources(digest, page.resources, set())
+    return digest.hexdigest()
+
+# ANCHOR: __digest_resources()
+def __digest_resources(digest, resources, seen):
     """
+    Adds the streams of the XObjects and the names of the fonts among the
+    resources to the digest, recursing into forms.
+
     Args:
-        filename_out: name of csv file to output
-        pdf: loaded pdfquery pdf object
-        colleges: dict of dicts of dataframes containing label instances
+        digest: hashlib object
+        resources: resource dict (or a reference to one)
+        seen: ids of the streams already added, so that shared or cyclic
+              forms are read once
     """
-    records.to_csv(filename_out, index=False)
+    resources = resolve1(resources) or {}
+    for font in sorted((resolve1(resources.get('Font')) or {}).items()):
+        font = resolve1(font[1])
+        digest.update(repr(resolve1(font.get('BaseFont'))).encode('utf-8'))
+    for name, xobject in sorted((resolve1(resources.get('XObject')) or {}).items()):
+        stream = resolve1(xobject)
+        if id(stream) in seen:
+            continue
+        seen.add(id(stream))
+        digest.update(stream.get_data())
+        if resolve1(stream.get('Subtype')) == LITERAL_FORM:
+            __digest_resources(digest, stream.get('Resources'), seen)
+
+# ANCHOR: load_layout_pages()
+@instrumented("load_layout_pages")
+def load_layout_pages(pdf_filepath, cache_dir=None, backend=None, profile=None, executor=None):
+    """
+    Lays out the PDF page by page through a cache of page layouts keyed by
+    page_fingerprints(), so that re-mining a transcript that gained or
+    changed a few pages only lays out those pages. Pages are stored with
+    their tokens numbered from 0, and renumbered across the document when
+    joined; the mining stages then run on the whole joined layout.
+
+    Returns layout dict (see load_layout)
+
+    Raises InvalidPDF when precheck_pdf() rejects the file, or when the first
+    page's layout fails rejection_reason(); in this process, before the rest
+    of the document is laid out.
+
+    Args:
+        pdf_filepath: path to transcript pdf, or a SharedPdf
+        cache_dir: parse cache directory (default: CACHE_DIR), or None with
+                   an executor, to lay out every page without the cache
+        backend: a key of LAYOUT_BACKENDS (default: see layout_backend)
+        profile: a key of LAYOUT_PROFILES (default: see layout_profile)
+        executor: concurrent.futures.Executor to lay out the pages missing
+                  from the cache on, in chunks of PAGE_CHUNK, or None
+    """
+    if cache_dir is None and executor is None:
+        cache_dir = CACHE_DIR
+    npages = precheck_pdf(pdf_filepath)
 
+    if cache_dir is None:
+        entries = [None] * npages
+    else:
+        settings = __settings_key(profile)
+        entries = [os.path.join(cache_dir, "page-%s-%s.npz" % (fingerprint, settings))
+                   for fingerprint in page_fingerprints(pdf_filepath)]
+    pages = [None if entry is None else __read_cache_entry(entry) for entry in entries]
+    missing = [n for n, page in enumerate(pages) if page is None]
+    if pages[0] is not None:
+        __check_first_page(pages[0])
+
+    if executor is None:
+        pdf = None
+        try:
+            for n in missing:
+                if pdf is None:
+                    pdf = layout_backend(backend)(pdf_filepath, profile)
+                pages[n], _ = __layout_page(pdf, n)
+                __write_cache_entry(entries[n], pages[n])
+                if n == 0:
+                    __check_first_page(pages[0])
+        finally:
+            if pdf is not None:
+                pdf.close()
+    else:
+        chunks = [missing[i:i + PAGE_CHUNK] for i in range(0, len(missing), PAGE_CHUNK)]
+        futures = [executor.submit(layout_pages, pdf_filepath, chunk, backend, profile)
+                   for chunk in chunks]
+        try:
+            for chunk, future in zip(chunks, futures):
+                for n, page in zip(chunk, future.result()):
+                    pages[n] = page
+                    if entries[n] is not None:
+                        __write_cache_entry(entries[n], page)
+                    if n == 0:
+                        __check_first_page(page)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return __join_pages(pages)
+
+# ANCHOR: layout_pages()
+def layout_pages(pdf_filepath, pages, backend=None, profile=None):
+    """
+    Lays out some of the pages of the PDF, e.g. one worker's share of a long
+    transcript.
+
+    Returns list of layout dicts, one per page, each with its tokens
+    numbered from 0
+
+    Args:
+        pdf_filepath: path to transcript pdf, or a SharedPdf
+        pages: 0-based page numbers, in increasing order
+        backend: a key of LAYOUT_BACKENDS (default: see layout_backend)
+        profile: a key of LAYOUT_PROFILES (default: see layout_profile)
+    """
+    pdf = layout_backend(backend)(pdf_filepath, profile)
+    try:
+        return [__layout_page(pdf, n)[0] for n in pages]
+    finally:
+        pdf.close()
+
+# ANCHOR: __check_first_page()
+def __check_first_page(page):
+    """
+    Raises InvalidPDF if the first page's layout fails rejection_reason()
+
+    Args:
+        page: layout dict of the first page
+    """
+    reason = rejection_reason(page)
+    if reason is not None:
+        raise InvalidPDF(reason)
+
+# ANCHOR: __join_pages()
+def __join_pages(pages):
+    """
+    Returns layout dict joining single-page layouts, with their pages
+    numbered from 1 and their tokens numbered across the document
+
+    Args:
+        pages: list of layout dicts, each with its tokens numbered from 0
+    """
+    ntokens = 0
+    for n, page in enumerate(pages):
+        page["pages"]["pageid"] = page["lines"]["pageid"] = n + 1
+        tokens = page["lines"]["token"]
+        page["lines"]["token"] = tokens.where(tokens < 0, tokens + ntokens)
+        ntokens += int((tokens >= 0).sum())
+    return concat_layouts(pages)
+
+# ANCHOR: prune_cache()
+def prune_cache(cache_dir=None, max_bytes=None):
+    """
+    Evicts the least recently used cache entries until the cache fits in
+    max_bytes.
+
+    Returns int, the number of entries evicted
+
+    Args:
+        cache_dir: parse cache directory (default: CACHE_DIR)
+        max_bytes: parse cache size bound (default: CACHE_MAX_BYTES)
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    entries = []
+    for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+        if name.endswith(".npz"):
+            try:
+                stat = os.stat(os.path.join(cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    evicted = 0
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+            evicted += 1
+        except OSError:
+            pass  # already evicted by another worker
+        total -= size
+    return evicted
 # !SECTION
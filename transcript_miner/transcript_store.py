@@ -0,0 +1,317 @@
+# Environment:
+# python = 3.74
+# dependencies: pandas, numpy
+
+#%% ANCHOR: Imports
+import os
+import re
+import time
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+#%% SECTION: Results store
+# Mined records of many transcripts in one SQLite database, so that questions
+# across the whole archive are answered from indexes instead of by re-reading
+# every CSV:
+#
+#   transcripts: one row per transcript, keyed by the SHA-256 of its PDF, so
+#       ingesting a transcript again replaces its rows instead of adding them
+#   courses: one row per mined course, in the columns of the records plus the
+#       semester's year, indexed on (name), (dept, seq), (college, semester)
+#       and transcript
+#
+# Units and grade points are stored as numbers, everything else as text.
+
+# ANCHOR: Global Constants
+STORE_FORMAT = 1
+STORE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# columns of tm.RECORD_COLUMNS and transcript_catalog.ENRICHED_COLUMNS, in
+# table order; the catalog columns stay NULL for records not enriched
+STORE_COLUMNS = ("dept", "seq", "title", "attempt", "earned", "grade", "points",
+                 "semester", "year", "plan", "college", "name", "catalog_title", "units")
+NUMERIC_COLUMNS = ("attempt", "earned", "points", "units")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id       INTEGER PRIMARY KEY,
+    digest   TEXT NOT NULL UNIQUE,
+    source   TEXT,
+    name     TEXT COLLATE NOCASE,
+    rows     INTEGER NOT NULL,
+    ingested REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS courses (
+    transcript    INTEGER NOT NULL REFERENCES transcripts (id),
+    dept          TEXT COLLATE NOCASE,
+    seq           TEXT COLLATE NOCASE,
+    title         TEXT,
+    attempt       REAL,
+    earned        REAL,
+    grade         TEXT COLLATE NOCASE,
+    points        REAL,
+    semester      TEXT COLLATE NOCASE,
+    year          INTEGER,
+    plan          TEXT,
+    college       TEXT COLLATE NOCASE,
+    name          TEXT COLLATE NOCASE,
+    catalog_title TEXT,
+    units         REAL
+);
+CREATE INDEX IF NOT EXISTS courses_name ON courses (name);
+CREATE INDEX IF NOT EXISTS courses_course ON courses (dept, seq);
+CREATE INDEX IF NOT EXISTS courses_college_semester ON courses (college, semester);
+CREATE INDEX IF NOT EXISTS courses_transcript ON courses (transcript);
+"""
+
+SEMESTER_YEAR = re.compile(r'(\d{4})\s*$')
+
+# ANCHOR: ResultsStore
+class ResultsStore:
+    """
+    A results store on disk, created on first open. Every ingest() is one
+    transaction, however many transcripts it holds.
+
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(self, db_filepath):
+        self.db_filepath = db_filepath
+        self.connection = sqlite3.connect(db_filepath)
+        # readers are not blocked while a batch is being ingested
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, STORE_FORMAT):
+            self.connection.close()
+            raise ValueError("%s is a results store of format %d, not %d" % \
+                             (db_filepath, version, STORE_FORMAT))
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute("PRAGMA user_version = %d" % STORE_FORMAT)
+
+    def ingest(self, transcripts):
+        """
+        Adds the records of every transcript, replacing the rows of any
+        transcript already in the store, in a single transaction.
+
+        Returns int, the number of course rows inserted
+
+        Args:
+            transcripts: iterable of (digest, source, records): the SHA-256
+                         of the transcript's PDF (see tm.content_digest), its
+                         path, and its pd.DataFrame from tm.prepare_records()
+        """
+        transcripts = list(transcripts)
+        if len(transcripts) == 0:
+            return 0
+        # convert every transcript's rows in one pass, then split them again
+        rows = course_rows(pd.concat([records for digest, source, records in transcripts],
+                                     ignore_index=True))
+        ends = np.cumsum([len(records) for digest, source, records in transcripts])
+
+        inserted = 0
+        with self.connection:
+            cursor = self.connection.cursor()
+            for (digest, source, records), end in zip(transcripts, ends):
+                name = records["name"].iloc[0] if len(records) else None
+                transcript_rows = rows[end - len(records):end]
+                found = cursor.execute("SELECT id FROM transcripts WHERE digest = ?",
+                                       (digest,)).fetchone()
+                if found is None:
+                    cursor.execute("INSERT INTO transcripts (digest, source, name, rows, ingested) "
+                                   "VALUES (?, ?, ?, ?, ?)",
+                                   (digest, source, name, len(records), time.time()))
+                    transcript = cursor.lastrowid
+                else:
+                    transcript = found[0]
+                    cursor.execute("DELETE FROM courses WHERE transcript = ?", (transcript,))
+                    cursor.execute("UPDATE transcripts SET source = ?, name = ?, rows = ?, "
+                                   "ingested = ? WHERE id = ?",
+                                   (source, name, len(records), time.time(), transcript))
+                cursor.executemany("INSERT INTO courses VALUES (?%s)" % (", ?" * len(STORE_COLUMNS)),
+                                   [(transcript,) + row for row in transcript_rows])
+                inserted += len(transcript_rows)
+        return inserted
+
+    def find(self, name=None, course=None, college=None, semester=None, since=None,
+             grade=None, limit=None):
+        """
+        Returns pd.DataFrame of the matching course rows, in the columns of
+        STORE_COLUMNS plus source, ordered by name, year and course
+
+        Args:
+            name: student name or the start of one, case-insensitive,
+                  e.g. "Guerra, J"
+            course: "DEPT SEQ" (e.g. "CHEM 305"), or just "DEPT"
+            college: college code, e.g. "ARC"
+            semester: semester, e.g. "Spring 2016"
+            since: first year to include
+            grade: grade, e.g. "W"
+            limit: most rows to return, or None for all
+        """
+        where, params = [], []
+        if name is not None:
+            where.append("c.name LIKE ? ESCAPE '\\'")
+            params.append(re.sub(r'([\\%_])', r'\\\1', name) + "%")
+        if course is not None:
+            parts = course.split()
+            where.append("c.dept = ?")
+            params.append(parts[0])
+            if len(parts) > 1:
+                where.append("c.seq = ?")
+                params.append(" ".join(parts[1:]))
+        for column, value in (("college", college), ("semester", semester), ("grade", grade)):
+            if value is not None:
+                where.append("c.%s = ?" % column)
+                params.append(value)
+        if since is not None:
+            where.append("c.year >= ?")
+            params.append(int(since))
+
+        query = "SELECT %s, t.source FROM courses c JOIN transcripts t ON t.id = c.transcript" % \
+                ", ".join("c." + column for column in STORE_COLUMNS)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY c.name, c.year, c.dept, c.seq"
+        if limit is not None:
+            query += " LIMIT %d" % int(limit)
+        return pd.read_sql_query(query, self.connection, params=params)
+
+    def query(self, sql, params=()):
+        """
+        Returns pd.DataFrame, the result of any SQL query on the store
+
+        Args:
+            sql: the query
+            params: its parameters
+        """
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def summary(self):
+        """
+        Returns dict with keys transcripts, courses, students and colleges,
+        each a count
+        """
+        transcripts, courses = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM transcripts").fetchone()
+        students = self.connection.execute(
+            "SELECT COUNT(DISTINCT name) FROM transcripts").fetchone()[0]
+        colleges = self.connection.execute(
+            "SELECT COUNT(DISTINCT college) FROM courses").fetchone()[0]
+        return {"transcripts": transcripts, "courses": courses, "students": students,
+                "colleges": colleges}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# ANCHOR: course_rows()
+def course_rows(records):
+    """
+    Returns list of tuples in the columns of STORE_COLUMNS, with None for
+    missing values
+
+    Args:
+        records: pd.DataFrame from tm.prepare_records()
+    """
+    records = records.reindex(columns=STORE_COLUMNS)
+    records["year"] = pd.to_numeric(records["semester"].astype(str).str.extract(
+                                        SEMESTER_YEAR, expand=False), errors='coerce')
+    for column in NUMERIC_COLUMNS:
+        records[column] = pd.to_numeric(records[column], errors='coerce')
+    records = records.astype(object).where(records.notna(), None)
+    return list(records.itertuples(index=False, name=None))
+
+# ANCHOR: open_store()
+def open_store(db_filepath):
+    """
+    Returns ResultsStore
+
+    Args:
+        db_filepath: path of the store's SQLite file
+    """
+    directory = os.path.dirname(os.path.abspath(db_filepath))
+    os.makedirs(directory, exist_ok=True)
+    return ResultsStore(db_filepath)
+# !SECTION
+
+#%%
+if __name__ == "__main__":
+    import argparse
+
+    argparser = argparse.ArgumentParser(\
+        description = "Query a results store written by main.py (e.g. main.py in_dir/ "
+                      "results.db --batch --merge)")
+
+    argparser.add_argument(
+        "store", metavar = "DB",
+        help = "results store (.db)"
+    )
+
+    argparser.add_argument(
+        "--student", default = None, metavar = "NAME",
+        help = "courses of the students whose names start with NAME, e.g. \"Guerra, J\""
+    )
+
+    argparser.add_argument(
+        "--course", default = None, metavar = "COURSE",
+        help = "rows of one course (\"CHEM 305\") or department (\"CHEM\")"
+    )
+
+    argparser.add_argument(
+        "--college", default = None,
+        help = "rows from one college, e.g. ARC"
+    )
+
+    argparser.add_argument(
+        "--semester", default = None,
+        help = "rows from one semester, e.g. \"Spring 2016\""
+    )
+
+    argparser.add_argument(
+        "--since", type = int, default = None, metavar = "YEAR",
+        help = "rows from YEAR on"
+    )
+
+    argparser.add_argument(
+        "--grade", default = None,
+        help = "rows with this grade, e.g. W"
+    )
+
+    argparser.add_argument(
+        "--limit", type = int, default = None,
+        help = "most rows to print"
+    )
+
+    argparser.add_argument(
+        "--sql", default = None,
+        help = "run this SQL query instead (tables: transcripts, courses)"
+    )
+
+    args = argparser.parse_args()
+
+    if not os.path.isfile(args.store):
+        argparser.error("no such results store: %s" % args.store)
+    with ResultsStore(args.store) as store:
+        start = time.perf_counter()
+        if args.sql:
+            found = store.query(args.sql)
+        elif any(value is not None for value in (args.student, args.course, args.college,
+                                                 args.semester, args.since, args.grade)):
+            found = store.find(args.student, args.course, args.college, args.semester,
+                               args.since, args.grade, args.limit)
+        else:
+            print(", ".join("%d %s" % (n, key) for key, n in store.summary().items()))
+            found = None
+        elapsed = time.perf_counter() - start
+        if found is not None:
+            print(found.to_string(index=False))
+            print("%d rows in %.1f ms" % (len(found), 1000 * elapsed))
@@ -1,20 +1,61 @@
 #%%
 # ANCHOR: Imports
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-from matplotlib import gridspec
-import numpy as np
-
-# ANCHOR: Plot style
-try:
-    from jupyterthemes import jtplot
-    jtplot.style(theme='solarizedl')
-except:
-    None
+import os
+import sys
+import functools
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "transcript_miner"))
+
+# ANCHOR: __matplotlib()
+@functools.lru_cache(maxsize=None)
+def __matplotlib():
+    """
+    Imports matplotlib and sets the plot style on first use, rather than
+    whenever this module is imported.
+
+    Returns tuple of (matplotlib.pyplot, matplotlib.patches)
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as mpatches
+    try:
+        from jupyterthemes import jtplot
+        jtplot.style(theme='solarizedl')
+    except:
+        None
+    return plt, mpatches
+
+# ANCHOR: Selectors
+# pdf.pq() parses and translates its CSS selector to XPath on every call;
+# these are the same queries as XPath, compiled once by __selectors()
+PRINT_DATE_XPATH = 'descendant-or-self::LTTextLineHorizontal[contains(., "Print")]'
+IN_BBOX_XPATH = 'descendant-or-self::LTTextLineHorizontal' \
+                '[@x0 >= $x0 and @y0 >= $y0 and @x1 <= $x1 and @y1 <= $y1]'
+
+# ANCHOR: __selectors()
+@functools.lru_cache(maxsize=None)
+def __selectors():
+    """
+    Returns tuple of compiled lxml XPaths (print date lines, lines in a bbox)
+    """
+    from lxml import etree
+    return etree.XPath(PRINT_DATE_XPATH), etree.XPath(IN_BBOX_XPATH)
+
+# ANCHOR: __top_of_page()
+def __top_of_page(pdf):
+    """
+    Returns float, the height of the first "Print Date" line
+
+    Args:
+        pdf: loaded pdfquery pdf object
+    """
+    print_date, in_bbox = __selectors()
+    return float(print_date(pdf.tree)[0].get('y0'))
 
 # ANCHOR: Visual Test
 
 def setup_plot(npages):
+    plt, mpatches = __matplotlib()
     NROW = npages
     NCOL = 1
     FIG, AX = plt.subplots(NROW, NCOL,
@@ -31,6 +72,7 @@ COLORS = {'College':"red", 'Plan':"yellow",
           'semester':"purple"}
 
 def drawpage(FIG, AX, i):
+    plt, mpatches = __matplotlib()
     AX[i].set(xlim=[0, 792], ylim=[0,612])
     AX[i].set_xticklabels([]); AX[i].set_yticklabels([])
     FIG.canvas.draw()
@@ -40,6 +82,7 @@ def drawpage(FIG, AX, i):
     AX[i].text(10, 602, ("(Page %s)"% (i+1)), color="black")
 
 def drawcollegelabels(FIG, AX, instances):
+    plt, mpatches = __matplotlib()
     for key in instances.keys():
         for n, row in instances[key].iterrows():
             pageid, text = int(row.pageid-1), row.text
@@ -52,6 +95,7 @@ def drawcollegelabels(FIG, AX, instances):
             #AX[pageid].text(x, y-1, ("%s"% (row.text)), fontsize=9, color=COLORS[key])
 
 def drawbbox(FIG, AX, i, x0, y0, x1, y1, bboxcolor):
+    plt, mpatches = __matplotlib()
     w = x1 - x0
     h = y1 - y0
     rect = mpatches.Rectangle((x0, y0), w, h, edgecolor=bboxcolor)
@@ -59,7 +103,7 @@ def drawbbox(FIG, AX, i, x0, y0, x1, y1, bboxcolor):
 
 def draw_targetarea_bboxes(FIG, AX, pdf, instances):
     bottom_of_page = 72
-    top_of_page = float(pdf.pq('LTTextLineHorizontal:contains("Print")')[0].get('y0'))
+    top_of_page = __top_of_page(pdf)
     rightside_of_page = 792
     middle_of_page = 792/2
     leftside_of_page = 0
@@ -155,7 +199,7 @@ def draw_course_targets(FIG, AX, colleges):
 
 def draw_course_bboxes(FIG, AX, pdf, instances):
     bottom_of_page = 72
-    top_of_page = float(pdf.pq('LTTextLineHorizontal:contains("Print")')[0].get('y0'))
+    top_of_page = __top_of_page(pdf)
     rightside_of_page = 792
     middle_of_page = 792/2
     leftside_of_page = 0
@@ -219,6 +263,7 @@ def draw_course_target_bboxes(FIG, AX, pdf, colleges):
     student's attempted credits, earned credits, grade, and points.
     """
     keys = ["Course", "Plan", "Description", "Attempted", "Earned", "Grade", "Points"]
+    print_date, in_bbox = __selectors()
     for college in colleges:
         instances = colleges[college]
         instances["Course"]['target'] = {'course':'',
@@ -234,8 +279,7 @@ def draw_course_target_bboxes(FIG, AX, pdf, colleges):
             y0 = row['y0'] -1
             x1 = row['x1'] + 300
             y1 = row['y1'] +1
-            raw_scrape = pdf.pq('LTTextLineHorizontal:in_bbox("%s, %s, %s, %s")' % \
-                                                                (x0, y0, x1, y1))
+            raw_scrape = in_bbox(pdf.tree, x0=x0, y0=y0, x1=x1, y1=y1)
             for i in raw_scrape:
                 if i.iterancestors('LTPage').__next__().layout.pageid == row['pageid']:
                     target_text = ''.join([j.text for j in i])
@@ -261,5 +305,292 @@ def plot_transcript(FIG, AX, pdf, npages, colleges):
         draw_plan_targets(FIG, AX, instances)
 
     draw_course_targets(FIG, AX, colleges)
-plt.show()
-# !SECTION
\ No newline at end of file
+    plt, mpatches = __matplotlib()
+    plt.show()
+# !SECTION
+
+#%% SECTION: Headless overlays
+# Draws the miner's own view of a transcript, one page per figure, on the Agg
+# canvas with no window or pyplot state, so that QA overlays can be rendered
+# for a whole batch in worker processes. Every box of a kind on a page is one
+# PolyCollection, built from a vertex array rather than patch by patch.
+
+OVERLAY_FORMATS = ("png", "pdf")
+
+# kinds of box drawn, bottom to top; COLORS gives each one's color
+OVERLAY_KINDS = ("line", "College", "semester", "Plan", "Points", "Course")
+LINE_COLOR = "lightgray"
+
+OVERLAY_COLUMNS = ("pageid", "kind", "x0", "y0", "x1", "y1", "label")
+
+# ANCHOR: __agg()
+@functools.lru_cache(maxsize=None)
+def __agg():
+    """
+    Imports the pieces of matplotlib needed to draw off-screen, without
+    pyplot, on first use.
+
+    Returns tuple of (Figure, FigureCanvasAgg, PdfPages, PolyCollection)
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.collections import PolyCollection
+    return Figure, FigureCanvasAgg, PdfPages, PolyCollection
+
+# ANCHOR: transcript_overlays()
+def transcript_overlays(pdf_filepath, cache=True, cache_dir=None):
+    """
+    Mines a transcript as main.mine_transcript does, keeping the positions of
+    what was found rather than the records.
+
+    Returns tuple of (pages, boxes): pages is the layout's pd.DataFrame of
+    pages, boxes a pd.DataFrame in the columns of OVERLAY_COLUMNS with one row
+    per text line ("line"), college heading, semester heading, plan label,
+    semester end ("Points") and course row, each labelled with what was read
+    from it. A course row's box spans from its dept cell to the end of the
+    points column of its page side.
+
+    Raises tm.InvalidPDF if the file is not a valid transcript.
+
+    Args:
+        pdf_filepath: path to transcript pdf
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+    """
+    import pandas as pd
+    import transcript_miner as tm
+
+    layout = tm.load_layout(pdf_filepath, cache=cache, cache_dir=cache_dir)
+    reason = tm.rejection_reason(layout)
+    if reason is not None:
+        raise tm.InvalidPDF(reason)
+
+    tokens = tm.tokenize_layout(layout)
+    colleges = tm.define_college_sections(tokens, len(layout["pages"]))
+    semesters = tm.scrape_semesters_and_plans(tokens)
+    colleges = tm.group_semesters_by_college(colleges, semesters)
+    colleges = tm.scrape_courses(layout, colleges)
+
+    def box(kind, line, label=""):
+        return (line.pageid, kind, line.x0, line.y0, line.x1, line.y1, label)
+
+    found = [box("College", college.heading, college.name) for college in colleges]
+    for college in colleges:
+        for semester in college.semesters:
+            found.append(box("semester", semester.heading, semester.name))
+            if semester.end is not None:
+                found.append(box("Points", semester.end))
+    found += [box("Plan", plan) for plan in tokens[tm.PLAN]]
+
+    lines = layout["lines"]
+    frames = [lines.loc[lines["indexed"], ["pageid", "x0", "y0", "x1", "y1"]].assign(
+                  kind="line", label=""),
+              pd.DataFrame(found, columns=OVERLAY_COLUMNS)]
+    # the courses frame keeps the dept cell's box; widen it to the whole row
+    row_end = {False: tm.COL1_X_VALS["points"][1], True: tm.COL2_X_VALS["points"][1]}
+    for semester in semesters:
+        courses = semester.courses
+        if len(courses):
+            frames.append(courses[["pageid", "x0", "y0", "y1"]].assign(
+                x1=(courses["x0"] > tm.HALFPAGEWIDTH).map(row_end),
+                kind="Course", label=courses["dept"] + " " + courses["seq"] + " " + courses["grade"]))
+
+    boxes = pd.concat(frames, ignore_index=True)[list(OVERLAY_COLUMNS)]
+    return layout["pages"], boxes
+
+# ANCHOR: __draw_overlay()
+def __draw_overlay(figure, page, boxes):
+    """
+    Clears figure and draws one page of overlays on it.
+
+    Args:
+        figure: matplotlib Figure on an Agg canvas, reused from page to page
+        page: the page's row of the layout's pages frame
+        boxes: the page's rows of the boxes frame from transcript_overlays()
+    """
+    import numpy as np
+    Figure, FigureCanvasAgg, PdfPages, PolyCollection = __agg()
+
+    figure.clear()
+    ax = figure.add_axes([0, 0, 1, 1])
+    ax.set_xlim(page.x0, page.x1); ax.set_ylim(page.y0, page.y1)
+    ax.set_axis_off()
+    ax.text(page.x0 + 10, page.y1 - 10, "(Page %s)" % page.pageid, color="black",
+            fontsize=8, va="top")
+
+    for kind in OVERLAY_KINDS:
+        group = boxes[boxes["kind"] == kind]
+        if len(group) == 0:
+            continue
+        color = LINE_COLOR if kind == "line" else COLORS[kind]
+        x0, y0, x1, y1 = (group[k].to_numpy(dtype=float) for k in ("x0", "y0", "x1", "y1"))
+        # (n, 4, 2) corners of every box of the kind
+        vertices = np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1),
+                             np.stack([x1, y1], 1), np.stack([x0, y1], 1)], 1)
+        ax.add_collection(PolyCollection(vertices, closed=True, facecolors="none",
+                                         edgecolors=color, linewidths=0.5))
+        for x, y, label in zip(x0, y1, group["label"].tolist()):
+            if label:
+                ax.text(x, y, label, fontsize=5, color=color, va="bottom", clip_on=True)
+
+# ANCHOR: render_overlays()
+def render_overlays(pdf_filepath, out_path, fmt=None, dpi=72, cache=True, cache_dir=None):
+    """
+    Renders a transcript's overlays page by page, without a display. Only one
+    page is drawn at a time, on one reused figure, so memory does not grow with
+    the number of pages.
+
+    Returns tuple of (number of pages, list of files written)
+
+    Args:
+        pdf_filepath: path to transcript pdf
+        out_path: with fmt "pdf", the multi-page PDF to write; with "png", the
+                  directory to write page_001.png, page_002.png, ... to
+        fmt: one of OVERLAY_FORMATS (default: "pdf" if out_path ends in
+             .pdf, else "png")
+        dpi: resolution of the PNGs (a PDF page is 72 points per inch)
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+    """
+    from contextlib import nullcontext
+    Figure, FigureCanvasAgg, PdfPages, PolyCollection = __agg()
+
+    if fmt is None:
+        fmt = "pdf" if out_path.lower().endswith(".pdf") else "png"
+    if fmt not in OVERLAY_FORMATS:
+        raise ValueError("Unknown overlay format %r." % fmt)
+
+    pages, boxes = transcript_overlays(pdf_filepath, cache, cache_dir)
+    if fmt == "png":
+        os.makedirs(out_path, exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+
+    figure = Figure(figsize=(792/72, 612/72), dpi=dpi)
+    FigureCanvasAgg(figure)
+    written = []
+    by_page = dict(tuple(boxes.groupby("pageid")))
+    with (PdfPages(out_path) if fmt == "pdf" else nullcontext()) as document:
+        for page in pages.itertuples(index=False):
+            figure.set_size_inches((page.x1 - page.x0)/72, (page.y1 - page.y0)/72)
+            __draw_overlay(figure, page, by_page.get(page.pageid, boxes.iloc[:0]))
+            if fmt == "pdf":
+                document.savefig(figure)
+            else:
+                png = os.path.join(out_path, "page_%03d.png" % page.pageid)
+                figure.savefig(png, dpi=dpi)
+                written.append(png)
+    figure.clear()
+    return len(pages), written if fmt == "png" else [out_path]
+
+# ANCHOR: __render_one()
+def __render_one(pdf_filepath, out_path, fmt, dpi, cache, cache_dir):
+    """
+    Batch worker. Never raises: failures are reported in the returned dict.
+
+    Returns dict with keys file, out, pages, seconds and error (None on
+    success)
+    """
+    import time
+    start = time.perf_counter()
+    result = {"file": pdf_filepath, "out": out_path, "pages": 0, "error": None}
+    try:
+        result["pages"], written = render_overlays(pdf_filepath, out_path, fmt, dpi,
+                                                   cache, cache_dir)
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+# ANCHOR: render_batch()
+def render_batch(pdf_filepaths, out_dir, fmt="png", workers=None, dpi=72, cache=True,
+                 cache_dir=None):
+    """
+    Renders the overlays of many transcripts, one transcript per worker
+    process at a time, to out_dir/<name>/page_NNN.png or out_dir/<name>.pdf.
+
+    Returns list of result dicts from __render_one(), in completion order
+
+    Args:
+        pdf_filepaths: paths to transcript pdfs
+        out_dir: directory to write the overlays to
+        fmt: one of OVERLAY_FORMATS
+        workers: number of worker processes (default: os.cpu_count())
+        dpi: resolution of the PNGs
+        cache: whether to reuse layout analysis from the parse cache
+        cache_dir: parse cache directory (default: tm.CACHE_DIR)
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    def out_path(pdf_filepath):
+        name = os.path.splitext(os.path.basename(pdf_filepath))[0]
+        return os.path.join(out_dir, name + (".pdf" if fmt == "pdf" else ""))
+
+    results = []
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(__render_one, pdf_filepath, out_path(pdf_filepath), fmt, dpi,
+                               cache, cache_dir)
+                   for pdf_filepath in pdf_filepaths]
+        for future in as_completed(futures):
+            result = future.result()
+            if result["error"] is None:
+                print("%s: %d pages in %.2fs -> %s" % \
+                      (result["file"], result["pages"], result["seconds"], result["out"]))
+            else:
+                print("%s: FAILED (%s)" % (result["file"], result["error"]))
+            results.append(result)
+    return results
+# !SECTION
+
+#%%
+if __name__ == "__main__":
+    import glob
+    import argparse
+
+    argparser = argparse.ArgumentParser(\
+        description = "Render what the miner found in transcripts as per-page QA overlays")
+
+    argparser.add_argument(
+        "inputs", nargs = "+", metavar = "PDF_IN",
+        help = "transcript pdfs, directories of them, or glob patterns"
+    )
+
+    argparser.add_argument(
+        "--out", required = True, metavar = "DIR",
+        help = "directory to write the overlays to"
+    )
+
+    argparser.add_argument(
+        "--format", default = "png", choices = OVERLAY_FORMATS,
+        help = "one PNG per page in a directory per transcript, or one "
+               "multi-page PDF per transcript (default: png)"
+    )
+
+    argparser.add_argument(
+        "--workers", type = int, default = None,
+        help = "number of worker processes (default: CPU count)"
+    )
+
+    argparser.add_argument(
+        "--dpi", type = int, default = 72,
+        help = "resolution of the PNGs (default: 72)"
+    )
+
+    argparser.add_argument(
+        "--no-cache", action = "store_true",
+        help = "lay out every page again instead of reading the parse cache"
+    )
+
+    args = argparser.parse_args()
+
+    pdf_filepaths = []
+    for source in args.inputs:
+        if os.path.isdir(source):
+            pdf_filepaths += sorted(glob.glob(os.path.join(source, "*.pdf")))
+        else:
+            pdf_filepaths += sorted(glob.glob(source))
+
+    results = render_batch(pdf_filepaths, args.out, args.format, args.workers, args.dpi,
+                           cache = not args.no_cache)
+    sys.exit(0 if all(result["error"] is None for result in results) else 1)